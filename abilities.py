@@ -0,0 +1,231 @@
+import math
+import random
+from collections import namedtuple
+from combat_jit import HAVE_NUMBA, fight_metrics
+
+# Opcodes executed by the ability kernels; a participant's behavior compiles into arrays of these
+ATTACK = 0  # One random opponent takes max(1, int(attack * attack_multiplier * power) - int(defense * defense_multiplier))
+DEFEND = 1  # Incoming blows are multiplied by power (at least 1 damage) until the defender's next turn
+HEAL = 2  # The most wounded living ally (by HP ratio, self included) regains int(power) HP, up to max HP
+AOE = 3  # Every living opponent takes an attack at this power
+POISON = 4  # One random opponent loses int(power) HP at the start of each of its next duration turns
+OPCODE_NAMES = ('attack', 'defend', 'heal', 'aoe', 'poison')
+
+# An action a participant can take. power and duration are interpreted per opcode (see above).
+Ability = namedtuple('Ability', ['name', 'opcode', 'power', 'duration'], defaults=(1.0, 0))
+
+# One line of a behavior: use ability when the participant's own HP ratio is below below_hp_ratio.
+# A behavior is a tuple of rules checked in order; the first match is used each turn.
+Rule = namedtuple('Rule', ['below_hp_ratio', 'ability'])
+
+BASIC_ATTACK = Ability('Attack', ATTACK)
+GUARD = Ability('Guard', DEFEND, 0.5)
+FIRST_AID = Ability('First Aid', HEAL, 10)
+FIREBALL = Ability('Fireball', AOE, 0.6)
+VENOM = Ability('Venom', POISON, 3, 3)
+
+# Named behaviors usable in scenario files; None (the default) is AGGRESSIVE
+BEHAVIORS = {
+    'aggressive': (Rule(math.inf, BASIC_ATTACK),),
+    # The reference decision model, executed: attack above 50% HP, defend at 50% or below (rules
+    # compare with <, so the threshold is the next float above 0.5)
+    'cautious': (Rule(math.nextafter(0.5, math.inf), GUARD), Rule(math.inf, BASIC_ATTACK)),
+    'healer': (Rule(0.6, FIRST_AID), Rule(math.inf, BASIC_ATTACK)),
+    'caster': (Rule(0.3, GUARD), Rule(math.inf, FIREBALL)),
+    'poisoner': (Rule(math.inf, VENOM),),
+}
+
+# Encounter compiled for the ability kernels: per-slot stats plus a rule table per slot, padded to
+# the longest behavior. thresholds/opcodes/values/durations are [slot][rule]; values hold the scaled
+# attack value for ATTACK/AOE, the HP amount for HEAL/POISON and the damage factor for DEFEND.
+AbilityEncounter = namedtuple(
+    'AbilityEncounter',
+    ['names', 'max_hp', 'is_player', 'order', 'num_players', 'defense', 'rule_count', 'thresholds', 'opcodes',
+     'values', 'durations']
+)
+
+def resolve_behavior(behavior):
+    """Return the rule tuple for a behavior given as rules, a BEHAVIORS name or None."""
+    if behavior is None:
+        return BEHAVIORS['aggressive']
+    if isinstance(behavior, str):
+        if behavior not in BEHAVIORS:
+            raise ValueError(f"Unknown behavior '{behavior}'. Choose from: {', '.join(BEHAVIORS)}")
+        return BEHAVIORS[behavior]
+    return tuple(behavior)
+
+def compile_abilities(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0):
+    """Flatten participants and their behaviors into the integer opcode tables the kernels run.
+
+    Args:
+        players (list): Player Participant objects (their behavior attribute is used).
+        enemies (list): Enemy Participant objects.
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+
+    Returns:
+        AbilityEncounter
+    """
+    participants = list(players) + list(enemies)
+    behaviors = [resolve_behavior(getattr(p, 'behavior', None)) for p in participants]
+    width = max(len(rules) for rules in behaviors) if behaviors else 1
+    thresholds, opcodes, values, durations = [], [], [], []
+    for p, rules in zip(participants, behaviors):
+        row_thresholds, row_opcodes, row_values, row_durations = [], [], [], []
+        for rule in rules:
+            ability = rule.ability
+            if ability.opcode in (ATTACK, AOE):
+                value = float(int(p.attack * attack_multiplier * ability.power))
+            elif ability.opcode in (HEAL, POISON):
+                value = float(int(ability.power))
+            else:
+                value = float(ability.power)
+            row_thresholds.append(float(rule.below_hp_ratio))
+            row_opcodes.append(ability.opcode)
+            row_values.append(value)
+            row_durations.append(ability.duration)
+        padding = width - len(rules)
+        thresholds.append(row_thresholds + [0.0] * padding)
+        opcodes.append(row_opcodes + [ATTACK] * padding)
+        values.append(row_values + [0.0] * padding)
+        durations.append(row_durations + [0] * padding)
+    return AbilityEncounter(
+        names=[p.name for p in participants],
+        max_hp=[p.max_hp for p in participants],
+        is_player=[i < len(players) for i in range(len(participants))],
+        # Same stable speed ordering as combat.simulate_combat
+        order=sorted(range(len(participants)), key=lambda i: participants[i].speed, reverse=True),
+        num_players=len(players),
+        defense=[int(p.defense * defense_multiplier) for p in participants],
+        rule_count=[len(rules) for rules in behaviors],
+        thresholds=thresholds,
+        opcodes=opcodes,
+        values=values,
+        durations=durations,
+    )
+
+def _fight(encounter, rng, party_hp=None):
+    """Pure-Python ability kernel.
+
+    With every participant on the default behavior it consumes rng exactly like
+    combat.simulate_combat, so both produce identical fights for the same seed. A decision
+    shift is counted whenever a participant uses a different opcode than on its previous turn.
+    """
+    max_hp, is_player, defense = encounter.max_hp, encounter.is_player, encounter.defense
+    thresholds, opcodes, values, durations = (encounter.thresholds, encounter.opcodes, encounter.values,
+                                              encounter.durations)
+    n = len(max_hp)
+    hp = list(max_hp)
+    alive = [True] * n
+    alive_players = list(range(encounter.num_players))
+    alive_enemies = list(range(encounter.num_players, n))
+    guard = [1.0] * n  # Incoming damage factor while defending
+    poison_turns = [0] * n
+    poison_damage = [0] * n
+    last_opcode = [-1] * n
+
+    rounds = 0
+    damage_by_players = 0
+    damage_by_enemies = 0
+    tension_count = 0
+    total_turns = 0
+    damage_distribution = {}
+    decision_shifts = 0
+
+    def hit(j, blow):
+        """Apply a blow to slot j through its guard and return the damage dealt."""
+        if guard[j] != 1.0:
+            blow = max(1, int(blow * guard[j]))
+        hp[j] = max(0, hp[j] - blow)
+        if hp[j] == 0:
+            alive[j] = False
+            (alive_players if is_player[j] else alive_enemies).remove(j)
+        return blow
+
+    while alive_players and alive_enemies:
+        rounds += 1
+        for i in encounter.order:
+            if not alive[i]:
+                continue
+            if poison_turns[i]:
+                poison_turns[i] -= 1
+                tick = min(hp[i], poison_damage[i])
+                if is_player[i]:
+                    damage_by_enemies += tick
+                else:
+                    damage_by_players += tick
+                hp[i] -= tick
+                if hp[i] == 0:
+                    alive[i] = False
+                    (alive_players if is_player[i] else alive_enemies).remove(i)
+                    continue
+            guard[i] = 1.0
+            opponents = alive_enemies if is_player[i] else alive_players
+            if not opponents:
+                continue
+            ratio = hp[i] / max_hp[i]
+            r = 0
+            while r < encounter.rule_count[i] - 1 and not ratio < thresholds[i][r]:
+                r += 1
+            op = opcodes[i][r]
+            if last_opcode[i] >= 0 and op != last_opcode[i]:
+                decision_shifts += 1
+            last_opcode[i] = op
+
+            dealt = 0
+            if op == ATTACK:
+                j = rng.choice(opponents)
+                dealt = hit(j, max(1, int(values[i][r]) - defense[j]))
+            elif op == DEFEND:
+                guard[i] = values[i][r]
+            elif op == HEAL:
+                allies = alive_players if is_player[i] else alive_enemies
+                j = min(allies, key=lambda a: hp[a] / max_hp[a])
+                hp[j] = min(max_hp[j], hp[j] + int(values[i][r]))
+            elif op == AOE:
+                for j in list(opponents):
+                    dealt += hit(j, max(1, int(values[i][r]) - defense[j]))
+            elif op == POISON:
+                j = rng.choice(opponents)
+                poison_turns[j] = durations[i][r]
+                poison_damage[j] = int(values[i][r])
+
+            damage_distribution[dealt] = damage_distribution.get(dealt, 0) + 1
+            total_turns += 1
+            if hp[i] / max_hp[i] < 0.2:
+                tension_count += 1
+            if is_player[i]:
+                damage_by_players += dealt
+            else:
+                damage_by_enemies += dealt
+
+    if party_hp is not None:
+        party_hp.append(sum(hp[:encounter.num_players]))
+    return fight_metrics(len(alive_players) > 0, rounds, damage_by_players, damage_by_enemies, tension_count,
+                         total_turns, damage_distribution.values(), decision_shifts, len(alive_players))
+
+def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0, use_jit=True, rng=random):
+    """Simulate a single fight with abilities and return the same metric tuple as combat.simulate_combat.
+
+    Participants are not modified. With use_jit=False (or without Numba) rng is used.
+    """
+    encounter = compile_abilities(players, enemies, attack_multiplier, defense_multiplier)
+    if use_jit and HAVE_NUMBA:
+        import combat_kernels
+        return combat_kernels.run_abilities_seeded(encounter, [rng.getrandbits(32)])[0]
+    return _fight(encounter, rng)
+
+def simulate_runs(encounter, seeds, use_jit=True, party_hp=None):
+    """Run one fight per seed on a compiled AbilityEncounter and return the metric tuples.
+
+    If party_hp is a list, the players' remaining HP after each fight is appended to it.
+    """
+    if use_jit and HAVE_NUMBA:
+        import combat_kernels
+        return combat_kernels.run_abilities_seeded(encounter, seeds, party_hp)
+    rng = random.Random()
+    results = []
+    for seed in seeds:
+        rng.seed(seed)
+        results.append(_fight(encounter, rng, party_hp))
+    return results
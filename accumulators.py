@@ -0,0 +1,375 @@
+import math
+
+# Names of the nine metrics returned by combat.simulate_combat, in tuple order
+METRIC_NAMES = ('victory', 'rounds', 'dmg_players', 'dmg_enemies', 'tension_index',
+                'engagement_variability', 'flow_state', 'decision_impact', 'ntr')
+
+# Distribution-level metrics from engagement_variability.md, computed across all runs of a batch
+DISTRIBUTION_NAMES = ('victory_entropy', 'dmg_players_std', 'dmg_enemies_std', 'rounds_variance')
+
+def victory_entropy(p):
+    """Binary Shannon entropy (bits) of a victory probability: 1.0 at 50%, 0.0 at 0% or 100%."""
+    if p <= 0 or p >= 1:
+        return 0.0
+    return -(p * math.log2(p) + (1 - p) * math.log2(1 - p))
+
+class MetricAccumulator:
+    """Running sums of fight metrics that can be merged across chunks, processes and machines.
+
+    Only sums and sums of squares are stored, so memory stays constant no matter how many fights
+    are added. Victory, rounds and damage are integers, so their sums of squares are exact and
+    their variances suffer no cancellation however large the batch.
+    """
+
+    def __init__(self, histograms=None, slots=None):
+        """Create an empty accumulator, optionally carrying empty OutcomeHistograms and SlotStats.
+
+        Histograms are filled through add(); slot statistics are filled by the engine while it
+        fights (see parallel.simulate_chunk) and merged along with everything else.
+        """
+        self.count = 0
+        self.sums = [0] * len(METRIC_NAMES)
+        self.squares = [0] * len(METRIC_NAMES)
+        self.histograms = histograms
+        self.slots = slots
+
+    def add(self, result, party_hp=None):
+        """Add one fight's metric tuple (as returned by simulate_combat).
+
+        party_hp is the players' total remaining HP, needed only when histograms are collected.
+        """
+        self.count += 1
+        sums = self.sums
+        squares = self.squares
+        for m, value in enumerate(result):
+            sums[m] += value
+            squares[m] += value * value
+        if self.histograms is not None:
+            self.histograms.add(result, party_hp)
+
+    def merge(self, other):
+        """Fold another accumulator into this one and return self."""
+        self.count += other.count
+        for m, value in enumerate(other.sums):
+            self.sums[m] += value
+            self.squares[m] += other.squares[m]
+        if other.histograms is not None:
+            if self.histograms is None:
+                self.histograms = other.histograms.empty()
+            self.histograms.merge(other.histograms)
+        if other.slots is not None:
+            if self.slots is None:
+                self.slots = other.slots.empty()
+            self.slots.merge(other.slots)
+        return self
+
+    def means(self):
+        """Return the average of each metric, in the same order as run_multiple_simulations."""
+        if self.count == 0:
+            return tuple(0.0 for _ in METRIC_NAMES)
+        return tuple(s / self.count for s in self.sums)
+
+    def variances(self):
+        """Return the sample variance of each metric (0 with fewer than two fights)."""
+        n = self.count
+        if n < 2:
+            return tuple(0.0 for _ in METRIC_NAMES)
+        # n * sum(x^2) - sum(x)^2 stays an exact integer for integer metrics
+        return tuple(max(0, n * q - s * s) / (n * (n - 1)) for s, q in zip(self.sums, self.squares))
+
+    def distribution(self):
+        """Return the distribution-level metrics (see DISTRIBUTION_NAMES) as a dict."""
+        variances = dict(zip(METRIC_NAMES, self.variances()))
+        return {
+            'victory_entropy': victory_entropy(self.sums[0] / self.count) if self.count else 0.0,
+            'dmg_players_std': math.sqrt(variances['dmg_players']),
+            'dmg_enemies_std': math.sqrt(variances['dmg_enemies']),
+            'rounds_variance': variances['rounds'],
+        }
+
+    def to_dict(self):
+        """Serialize to plain JSON-compatible data (floats round-trip exactly through json)."""
+        data = {'count': self.count, 'sums': list(self.sums), 'squares': list(self.squares)}
+        if self.histograms is not None:
+            data['histograms'] = self.histograms.to_dict()
+        if self.slots is not None:
+            data['slots'] = self.slots.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild an accumulator serialized with to_dict."""
+        acc = cls()
+        acc.count = data['count']
+        acc.sums = list(data['sums'])
+        acc.squares = list(data['squares'])
+        if 'histograms' in data:
+            acc.histograms = OutcomeHistograms.from_dict(data['histograms'])
+        if 'slots' in data:
+            acc.slots = SlotStats.from_dict(data['slots'])
+        return acc
+
+class RunningStats:
+    """Streaming count, mean and variance (Welford), mergeable with Chan's parallel update."""
+
+    def __init__(self):
+        """Create empty statistics."""
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+
+    def add(self, value):
+        """Add one observation."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """Fold another RunningStats into this one and return self."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance (0 with fewer than two observations)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std_error(self):
+        """Standard error of the mean."""
+        return (self.variance / self.count) ** 0.5 if self.count > 0 else 0.0
+
+    def to_dict(self):
+        """Serialize to plain JSON-compatible data."""
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild statistics serialized with to_dict."""
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = data['count'], data['mean'], data['m2']
+        return stats
+
+class Histogram:
+    """Fixed-bin histogram over [low, high] with underflow and overflow counts.
+
+    Memory depends only on the number of bins, and histograms with the same bins merge by
+    adding counts, so chunks from any number of workers combine exactly.
+    """
+
+    def __init__(self, low, high, bins):
+        """Create an empty histogram of bins equal-width bins covering [low, high]."""
+        if high <= low or bins < 1:
+            raise ValueError(f"Invalid histogram range [{low}, {high}] with {bins} bins")
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.width = (high - low) / bins
+        self.counts = [0] * bins
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, value):
+        """Count one observation (values equal to high land in the last bin)."""
+        if value < self.low:
+            self.underflow += 1
+        elif value > self.high:
+            self.overflow += 1
+        else:
+            self.counts[min(int((value - self.low) / self.width), self.bins - 1)] += 1
+
+    def merge(self, other):
+        """Add another histogram's counts into this one and return self."""
+        if (other.low, other.high, other.bins) != (self.low, self.high, self.bins):
+            raise ValueError("Cannot merge histograms with different bins")
+        for b, count in enumerate(other.counts):
+            self.counts[b] += count
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    @property
+    def total(self):
+        """Number of observations, including those outside the range."""
+        return sum(self.counts) + self.underflow + self.overflow
+
+    def edges(self):
+        """Return the bins + 1 bin edges."""
+        return [self.low + b * self.width for b in range(self.bins)] + [self.high]
+
+    def centers(self):
+        """Return the midpoint of each bin."""
+        return [self.low + (b + 0.5) * self.width for b in range(self.bins)]
+
+    def empty(self):
+        """Return an empty histogram with the same bins."""
+        return Histogram(self.low, self.high, self.bins)
+
+    def to_dict(self):
+        """Serialize to plain JSON-compatible data."""
+        return {'low': self.low, 'high': self.high, 'bins': self.bins, 'counts': list(self.counts),
+                'underflow': self.underflow, 'overflow': self.overflow}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram serialized with to_dict."""
+        hist = cls(data['low'], data['high'], data['bins'])
+        hist.counts = list(data['counts'])
+        hist.underflow = data['underflow']
+        hist.overflow = data['overflow']
+        return hist
+
+# Per-fight outcomes collected by OutcomeHistograms: four metrics plus the players' remaining HP
+HISTOGRAM_NAMES = ('rounds', 'dmg_players', 'dmg_enemies', 'party_hp', 'ntr')
+
+class OutcomeHistograms:
+    """Histograms of rounds, damage dealt and taken, remaining party HP and NTR across fights.
+
+    Averages hide bimodal encounters (a boss fight that is either a stomp or a wipe); these
+    show the whole distribution in constant memory.
+    """
+
+    def __init__(self, histograms):
+        """Wrap a dict of HISTOGRAM_NAMES -> Histogram."""
+        self.histograms = histograms
+
+    @classmethod
+    def for_encounter(cls, players, enemies, attack_multiplier=1.0, defense_multiplier=1.0, bins=40):
+        """Create empty histograms whose ranges cover every possible outcome of an encounter.
+
+        Damage tops out at the opposing side's total HP plus one overkill blow per participant,
+        rounds at the smaller side's total HP (each side loses at least 1 HP per round), and
+        NTR at the entropy of the distinct damage values. Round bins are whole rounds wide.
+        """
+        def max_blow(attackers, targets):
+            return max(max(1, int(a.attack * attack_multiplier) - int(t.defense * defense_multiplier))
+                       for a in attackers for t in targets)
+
+        player_hp = sum(p.max_hp for p in players)
+        enemy_hp = sum(e.max_hp for e in enemies)
+        max_rounds = min(player_hp, enemy_hp)
+        round_width = -(-max_rounds // bins)
+        distinct_blows = 2 * len(players) * len(enemies)
+        return cls({
+            'rounds': Histogram(0.5, 0.5 + round_width * bins, bins),
+            'dmg_players': Histogram(0, enemy_hp + len(enemies) * max_blow(players, enemies), bins),
+            'dmg_enemies': Histogram(0, player_hp + len(players) * max_blow(enemies, players), bins),
+            'party_hp': Histogram(0, player_hp, bins),
+            'ntr': Histogram(0, max(1.0, math.log2(distinct_blows)), bins),
+        })
+
+    def add(self, result, party_hp):
+        """Count one fight from its metric tuple and the players' total remaining HP."""
+        histograms = self.histograms
+        histograms['rounds'].add(result[1])
+        histograms['dmg_players'].add(result[2])
+        histograms['dmg_enemies'].add(result[3])
+        histograms['party_hp'].add(party_hp)
+        histograms['ntr'].add(result[8])
+
+    def merge(self, other):
+        """Merge another OutcomeHistograms with the same bins into this one and return self."""
+        for name, hist in other.histograms.items():
+            self.histograms[name].merge(hist)
+        return self
+
+    def __getitem__(self, name):
+        """Return the Histogram for one of HISTOGRAM_NAMES."""
+        return self.histograms[name]
+
+    def empty(self):
+        """Return empty histograms with the same bins, e.g. one per worker chunk."""
+        return OutcomeHistograms({name: hist.empty() for name, hist in self.histograms.items()})
+
+    def to_dict(self):
+        """Serialize to plain JSON-compatible data."""
+        return {name: hist.to_dict() for name, hist in self.histograms.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild histograms serialized with to_dict."""
+        return cls({name: Histogram.from_dict(hist) for name, hist in data.items()})
+
+# Per-participant totals kept by SlotStats, in the order of SlotStats.totals
+SLOT_STAT_NAMES = ('dealt', 'taken', 'turns', 'deaths', 'death_rounds', 'first_deaths', 'kills', 'rounds_alive')
+
+class SlotStats:
+    """Per-participant totals across fights, in preallocated lists indexed by participant slot.
+
+    Slots follow combat_jit.compile_encounter: players first, then enemies. Totals per slot are
+    damage dealt and taken (full blows, like the side-level metrics), turns taken, deaths, the sum
+    of death rounds, fights in which it was the first of its side to die, kills, and rounds
+    survived (the death round, or the fight's length if it was still standing). Fight kernels
+    update the lists in place, so tracking costs a few additions per turn; with tracking off
+    the compiled kernels skip it entirely.
+    """
+
+    def __init__(self, names, num_players):
+        """Create zeroed totals for participants with the given names."""
+        self.names = list(names)
+        self.num_players = num_players
+        self.fights = 0
+        self.totals = [[0] * len(self.names) for _ in SLOT_STAT_NAMES]
+
+    @classmethod
+    def for_participants(cls, players, enemies):
+        """Create zeroed totals for an encounter's participants."""
+        return cls([p.name for p in list(players) + list(enemies)], len(players))
+
+    def merge(self, other):
+        """Add another SlotStats for the same encounter into this one and return self."""
+        if other.names != self.names:
+            raise ValueError("Cannot merge slot statistics of different encounters")
+        self.fights += other.fights
+        for mine, theirs in zip(self.totals, other.totals):
+            for slot, value in enumerate(theirs):
+                mine[slot] += value
+        return self
+
+    def empty(self):
+        """Return zeroed totals for the same participants."""
+        return SlotStats(self.names, self.num_players)
+
+    def summary(self):
+        """Return one dict per slot with per-fight averages and rates.
+
+        Keys: name, side, dealt, taken, turns, kills and rounds_alive (averages per fight),
+        death_rate, mean_death_round (over fights it died in) and first_death_rate.
+        """
+        fights = self.fights or 1
+        dealt, taken, turns, deaths, death_rounds, first_deaths, kills, rounds_alive = self.totals
+        return [{
+            'name': name,
+            'side': 'player' if slot < self.num_players else 'enemy',
+            'dealt': dealt[slot] / fights,
+            'taken': taken[slot] / fights,
+            'turns': turns[slot] / fights,
+            'kills': kills[slot] / fights,
+            'rounds_alive': rounds_alive[slot] / fights,
+            'death_rate': deaths[slot] / fights,
+            'mean_death_round': death_rounds[slot] / deaths[slot] if deaths[slot] else 0.0,
+            'first_death_rate': first_deaths[slot] / fights,
+        } for slot, name in enumerate(self.names)]
+
+    def to_dict(self):
+        """Serialize to plain JSON-compatible data."""
+        return {'names': self.names, 'num_players': self.num_players, 'fights': self.fights,
+                'totals': [list(stat) for stat in self.totals]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild statistics serialized with to_dict."""
+        slots = cls(data['names'], data['num_players'])
+        slots.fights = data['fights']
+        slots.totals = [list(stat) for stat in data['totals']]
+        return slots
@@ -0,0 +1,159 @@
+# benchmark_augmentation.py
+# Measures dice dataset augmentation throughput and where the time goes.
+# Every stage of process_image.augment_image is timed along with source decoding and JPEG encoding
+# (the fused geometry as matrix composition, Lanczos reduction and affine resample),
+# across several worker counts, so we can size the machines that rebuild the dataset.
+#
+# Usage:
+#   python benchmark_augmentation.py --workers 1,2,4 --report augmentation_benchmark.json
+#   python benchmark_augmentation.py --synthetic 8   # Use generated 12MP photos instead of original_dice_images/
+
+# Import necessary libraries
+import argparse
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+import process_image
+
+PERCENTILES = (50, 90, 99)
+SYNTHETIC_SIZE = (4032, 3024)  # Typical 12MP phone photo
+
+# Function to create synthetic source photos
+def make_synthetic_sources(directory, count, size=SYNTHETIC_SIZE):
+    """
+    Writes count noisy JPEG photos of the given size into directory and returns their paths.
+    Lets the benchmark run on machines that don't have the original dice photos.
+    """
+    rng = np.random.default_rng(0)
+    paths = []
+    for idx in range(count):
+        # Low-resolution noise upscaled keeps the JPEG realistic in size and decode cost
+        base = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+        image = Image.fromarray(base).resize(size, Image.BILINEAR)
+        path = os.path.join(directory, f"d6_synthetic{idx}.jpg")
+        image.save(path, quality=92)
+        paths.append(path)
+    return paths
+
+# Function to process one source with instrumentation (runs inside worker processes)
+def benchmark_source(args):
+    """
+    Decodes one source and produces augmentations_per_image augmented, JPEG-encoded outputs,
+    returning a dict mapping stage name to a list of durations in seconds.
+    """
+    image_path, augmentations_per_image = args
+    timings = {}
+    start = time.perf_counter()
+    working_image, source_size = process_image.load_working_copy(image_path)
+    timings['decode'] = [time.perf_counter() - start]
+    for _ in range(augmentations_per_image):
+        augmented = process_image.augment_image(working_image, source_size, timings=timings)
+        start = time.perf_counter()
+        augmented.save(io.BytesIO(), format='JPEG', quality=95)  # Same encoder settings as generate_dataset
+        timings.setdefault('encode', []).append(time.perf_counter() - start)
+    return timings
+
+# Function to run the benchmark for a single worker count
+def run_benchmark(image_paths, augmentations_per_image, workers):
+    """
+    Augments every source using a pool of the given size and returns throughput and per-stage
+    statistics (count, mean, total share and percentiles in milliseconds).
+    """
+    tasks = [(path, augmentations_per_image) for path in image_paths]
+    start = time.perf_counter()
+    if workers == 1:
+        results = [benchmark_source(task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(benchmark_source, tasks, chunksize=1)
+    wall_time = time.perf_counter() - start
+
+    merged = {}
+    for timings in results:
+        for stage, durations in timings.items():
+            merged.setdefault(stage, []).extend(durations)
+    stage_total = sum(sum(durations) for durations in merged.values())
+    stages = {}
+    for stage, durations in merged.items():
+        values = np.array(durations) * 1000
+        stages[stage] = {
+            'count': len(durations),
+            'mean_ms': float(values.mean()),
+            'share': float(values.sum() / 1000 / stage_total) if stage_total else 0.0,
+            **{f"p{p}_ms": float(np.percentile(values, p)) for p in PERCENTILES},
+        }
+    num_images = len(image_paths) * augmentations_per_image
+    return {
+        'workers': workers,
+        'sources': len(image_paths),
+        'images': num_images,
+        'wall_time_s': wall_time,
+        'images_per_second': num_images / wall_time if wall_time else 0.0,
+        'stages': stages,
+    }
+
+# Function to print a human-readable summary
+def print_report(result):
+    """
+    Prints throughput and a per-stage table for one worker count, slowest stage first.
+    """
+    print(f"\nWorkers: {result['workers']}  |  {result['images']} images in {result['wall_time_s']:.2f}s  |  "
+          f"{result['images_per_second']:.1f} images/s")
+    print(f"{'Stage':<15}{'Count':>8}{'Mean ms':>10}" + ''.join(f"{'p' + str(p) + ' ms':>10}" for p in PERCENTILES)
+          + f"{'Share':>8}")
+    for stage, stats in sorted(result['stages'].items(), key=lambda item: -item[1]['share']):
+        print(f"{stage:<15}{stats['count']:>8}{stats['mean_ms']:>10.3f}"
+              + ''.join(f"{stats[f'p{p}_ms']:>10.3f}" for p in PERCENTILES)
+              + f"{stats['share']:>8.1%}")
+
+# Main function
+def main(argv=None):
+    """
+    Parses arguments (argv, or the command line), runs the benchmark for each worker count and
+    writes a JSON report.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark dice image augmentation throughput.")
+    parser.add_argument('--input-dir', default=process_image.INPUT_DIR, help="Directory with source dice photos.")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="Generate this many synthetic 12MP sources instead of reading --input-dir.")
+    parser.add_argument('--augmentations', type=int, default=10, help="Augmentations per source image.")
+    parser.add_argument('--workers', default='1', help="Comma-separated worker counts, e.g. '1,2,4'.")
+    parser.add_argument('--report', default='augmentation_benchmark.json', help="Path of the JSON report.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.synthetic:
+            image_paths = make_synthetic_sources(tmp_dir, args.synthetic)
+        else:
+            images = process_image.load_images(args.input_dir) if os.path.isdir(args.input_dir) else {}
+            image_paths = [path for paths in images.values() for path in paths]
+        if not image_paths:
+            print("No source images found. Add images to the input directory or use --synthetic N.")
+            return
+
+        results = []
+        for workers in (int(w) for w in args.workers.split(',')):
+            result = run_benchmark(image_paths, args.augmentations, workers)
+            print_report(result)
+            results.append(result)
+
+    report = {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpu_count': os.cpu_count()},
+        'config': {'augmentations_per_image': args.augmentations, 'target_size': list(process_image.TARGET_SIZE),
+                   'working_scale': process_image.WORKING_SCALE, 'pipeline_version': process_image.PIPELINE_VERSION},
+        'results': results,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark report saved to '{args.report}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmark_startup.py
+# Measures how long main.py takes to start and which heavy dependencies each entry point loads.
+# Job runners spawn 'main.py simulate' once per scenario batch and worker processes import parallel,
+# so neither should pay for Gradio, Plotly, Numba or the test suite unless it actually uses them.
+#
+# Usage:
+#   python benchmark_startup.py --repeat 10 --report startup_benchmark.json
+
+# Import necessary libraries
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ('gradio', 'plotly', 'numba', 'numpy', 'tabulate', 'colorama', 'tests')
+
+# Commands timed end to end, as a job runner would launch them
+COMMANDS = {
+    'simulate (1 run)': ['main.py', 'simulate', 'Solo Warrior vs. Goblin', '--runs', '1'],
+    'simulate --help': ['main.py', 'simulate', '--help'],
+}
+
+# Imports checked for heavy dependencies: the CLI module and what worker processes load
+IMPORTS = ('main', 'parallel', 'distributed', 'ui')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Function to list heavy modules pulled in by an import
+def heavy_imports(module):
+    """
+    Imports module in a fresh interpreter and returns (module count, heavy modules loaded).
+    """
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps([len(sys.modules), sorted({{m.split('.')[0] for m in sys.modules}} & {set(HEAVY_MODULES)!r})]))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    count, heavy = json.loads(output)
+    return count, heavy
+
+# Function to time a command
+def time_command(argv, repeat):
+    """
+    Runs the command repeat times in fresh interpreters and returns wall-clock durations in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, capture_output=True, check=True)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+# Main function to run the benchmark
+def main():
+    """
+    Parses arguments, times each command and import, prints the results and optionally writes a JSON report.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark main.py startup time and import footprint.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per command.")
+    parser.add_argument('--report', help="Optional JSON file to write results to.")
+    args = parser.parse_args()
+
+    report = {'python': sys.version.split()[0], 'commands': {}, 'imports': {}}
+    baseline = time_command(['-c', 'pass'], args.repeat)
+    report['interpreter_s'] = statistics.median(baseline)
+    print(f"{'bare interpreter':<24} median {report['interpreter_s'] * 1000:7.1f} ms")
+    for name, argv in COMMANDS.items():
+        durations = time_command(argv, args.repeat)
+        report['commands'][name] = {'median_s': statistics.median(durations), 'max_s': max(durations)}
+        print(f"{name:<24} median {statistics.median(durations) * 1000:7.1f} ms   max {max(durations) * 1000:7.1f} ms")
+    for module in IMPORTS:
+        count, heavy = heavy_imports(module)
+        report['imports'][module] = {'modules': count, 'heavy': heavy}
+        print(f"import {module:<17} {count:4d} modules   heavy: {', '.join(heavy) or 'none'}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import json
+import math
+import os
+import threading
+import time
+from accumulators import MetricAccumulator
+
+# Seconds between automatic saves; every save rewrites the whole (small) file
+CHECKPOINT_INTERVAL = 30.0
+
+class JobProgress:
+    """Completed chunks of one job: the merged prefix of chunks 0..next_chunk-1, plus chunks that
+    finished ahead of it and wait to be merged.
+
+    Chunks are always merged in index order, so a job resumed from a checkpoint ends with exactly
+    the sums an uninterrupted run would. Because run seeds are counter-based (seeding.run_seed),
+    next_chunk is also the job's position in its random stream; rng_state holds the generator
+    state for batches that draw from a shared generator instead.
+    """
+
+    def __init__(self, merged, next_chunk=0, pending=None, rng_state=None):
+        """Start from a merged prefix (an empty MetricAccumulator for a new job)."""
+        self.merged = merged
+        self.next_chunk = next_chunk
+        self.pending = pending or {}
+        self.rng_state = rng_state
+
+    def done(self, chunk):
+        """True if chunk has already been completed."""
+        return chunk < self.next_chunk or chunk in self.pending
+
+    @property
+    def completed(self):
+        """Number of completed chunks."""
+        return self.next_chunk + len(self.pending)
+
+    def add(self, chunk, acc):
+        """Record a completed chunk, merging it and any waiting successors into the prefix; duplicates are ignored."""
+        if self.done(chunk):
+            return
+        self.pending[chunk] = acc
+        while self.next_chunk in self.pending:
+            self.merged.merge(self.pending.pop(self.next_chunk))
+            self.next_chunk += 1
+
+    def to_dict(self):
+        """Serialize to plain JSON-compatible data."""
+        return {'next_chunk': self.next_chunk, 'merged': self.merged.to_dict(),
+                'pending': {str(chunk): acc.to_dict() for chunk, acc in self.pending.items()},
+                'rng_state': self.rng_state}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild progress serialized with to_dict."""
+        return cls(MetricAccumulator.from_dict(data['merged']), data['next_chunk'],
+                   {int(chunk): MetricAccumulator.from_dict(acc) for chunk, acc in data['pending'].items()},
+                   data['rng_state'])
+
+class Checkpoint:
+    """Progress of one or more jobs, saved atomically to a local JSON file.
+
+    fingerprint describes the work (participants, multipliers, seed, engine, chunking); a file
+    written for different work is refused rather than silently mixed in. Saves happen at most
+    every interval seconds from record() plus whenever save() is called, and go through a
+    temporary file and os.replace, so a crash mid-save leaves the previous checkpoint intact.
+    Once the work is complete, remove() deletes the file, so starting the same work again runs
+    it afresh instead of returning the old result. With path None nothing is written and the
+    object only tracks progress in memory.
+    """
+
+    def __init__(self, path, fingerprint, interval=CHECKPOINT_INTERVAL):
+        """Open the checkpoint at path, resuming from it if it exists.
+
+        Raises:
+            ValueError: The file was written for different work.
+        """
+        self.path = path
+        # Round-trip through JSON so tuples and lists compare equal to what a saved file holds
+        self.fingerprint = json.loads(json.dumps(fingerprint))
+        self.interval = interval
+        self.jobs = {}
+        self._last_save = time.monotonic()
+        self._write_lock = threading.Lock()
+        self._version = 0  # Number of snapshots taken
+        self._written = 0  # Version of the snapshot on disk; infinite once removed
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data['fingerprint'] != self.fingerprint:
+                raise ValueError(f"Checkpoint '{path}' belongs to different work; delete it or choose another path")
+            self.jobs = {name: JobProgress.from_dict(job) for name, job in data['jobs'].items()}
+
+    def job(self, name, empty=None):
+        """Progress of job name, started from empty (default: a plain MetricAccumulator) if it is new."""
+        key = str(name)
+        if key not in self.jobs:
+            self.jobs[key] = JobProgress(empty if empty is not None else MetricAccumulator())
+        return self.jobs[key]
+
+    def record(self, name, chunk, acc):
+        """Record a completed chunk of job name, saving if the interval has passed."""
+        self.job(name).add(chunk, acc)
+        self.save_if_due()
+
+    def due(self):
+        """True if at least interval seconds have passed since the last save."""
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save_if_due(self):
+        """Save if the interval has passed."""
+        if self.due():
+            self.save()
+
+    def snapshot(self):
+        """Serialize every job's progress for write() and restart the save interval.
+
+        Only this step reads the progress, so callers that share it between threads take the
+        snapshot under their lock and write it after releasing it.
+        """
+        self._last_save = time.monotonic()
+        self._version += 1
+        return self._version, {'fingerprint': self.fingerprint,
+                               'jobs': {name: job.to_dict() for name, job in self.jobs.items()}}
+
+    def write(self, snapshot):
+        """Write a snapshot() atomically, unless a newer one was already written (no-op without a path)."""
+        version, data = snapshot
+        if self.path is None:
+            return
+        with self._write_lock:
+            if version <= self._written:
+                return
+            temporary = f"{self.path}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+            self._written = version
+
+    def save(self):
+        """Write every job's progress atomically (no-op without a path)."""
+        self.write(self.snapshot())
+
+    def remove(self):
+        """Delete the file once the work is complete; snapshots taken earlier are no longer written."""
+        self._last_save = time.monotonic()
+        if self.path is None:
+            return
+        with self._write_lock:
+            self._written = math.inf
+            for path in (self.path, f"{self.path}.tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def batch_fingerprint(players, enemies, attack_multiplier, defense_multiplier, num_runs, seed, engine, chunk_size,
+                      **options):
+    """Description of a simulation batch that a checkpoint must match to be resumed."""
+    return {
+        'players': [[p.name, p.max_hp, p.attack, p.defense, p.speed, repr(p.behavior), p.targeting] for p in players],
+        'enemies': [[e.name, e.max_hp, e.attack, e.defense, e.speed, repr(e.behavior), e.targeting] for e in enemies],
+        'attack_multiplier': attack_multiplier, 'defense_multiplier': defense_multiplier, 'num_runs': num_runs,
+        'seed': seed, 'engine': engine, 'chunk_size': chunk_size, **options,
+    }
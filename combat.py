@@ -1,10 +1,22 @@
 import random
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import math
 from participant import Participant
+from accumulators import MetricAccumulator
+from checkpoint import Checkpoint, batch_fingerprint
+from seeding import run_seed
+from telemetry import RECORD_STRIDE, describe_batch
 
-def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0):
-    """Simulate a single combat encounter between players and enemies, including advanced metrics."""
+# One blow of a traced fight: attacker and target are the Participant objects, target_hp is the
+# target's HP after the blow
+TurnEvent = namedtuple('TurnEvent', ['round', 'attacker', 'target', 'damage', 'target_hp'])
+
+def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0, rng=random, trace=None):
+    """Simulate a single combat encounter between players and enemies, including advanced metrics.
+
+    rng is the random source for target selection; pass a seeded random.Random to make a fight reproducible.
+    trace is an optional callable receiving a TurnEvent for every blow; it does not change the fight.
+    """
     
     rounds = 0
     damage_by_players = 0
@@ -37,7 +49,10 @@ def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=
                 # Track decision shifts (simplified: assume a shift if HP crosses 50%)
                 if current_hp_ratio < 0.5 and participant.hp / participant.max_hp > 0.5:
                     decision_shifts += 1
-                damage = participant.take_turn(alive_targets, attack_multiplier, defense_multiplier)
+                hook = None
+                if trace is not None:
+                    hook = lambda attacker, target, damage: trace(TurnEvent(rounds, attacker, target, damage, target.hp))
+                damage = participant.take_turn(alive_targets, attack_multiplier, defense_multiplier, rng, hook)
                 damage_distribution[damage] += 1
                 total_turns += 1
                 if participant.hp / participant.max_hp < 0.2:
@@ -78,34 +93,84 @@ def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=
     return (victory, rounds, damage_by_players, damage_by_enemies, 
             tension_index, engagement_variability, flow_state, decision_impact, ntr)
 
-def run_multiple_simulations(players, enemies, attack_multiplier, defense_multiplier, num_runs=1000):
-    """Run multiple combat simulations and compute average results, including advanced metrics."""
-    results = defaultdict(list)
-    for _ in range(num_runs):
+def run_multiple_simulations(players, enemies, attack_multiplier, defense_multiplier, num_runs=1000,
+                             distribution_metrics=False, seed=None, checkpoint=None, telemetry=None):
+    """Run multiple combat simulations and compute average results, including advanced metrics.
+
+    Results are folded into streaming sums, so memory does not grow with num_runs. With
+    distribution_metrics=True a dict of victory entropy, damage spread and round variance across
+    all runs (see accumulators.DISTRIBUTION_NAMES) is appended to the returned tuple. With a seed,
+    run i draws from random.Random(run_seed(seed, i)), so replay_fight(..., seed, i) reproduces it;
+    without one the global random module is used.
+
+    With a checkpoint file path the running sums, the next run index and (without a seed) the
+    global generator's state are saved periodically; starting the same batch again resumes from
+    the file and returns exactly what an uninterrupted run would. The file is deleted once the
+    batch completes, so a finished batch is never resumed with a stale generator state.
+
+    With a telemetry.Telemetry, progress, throughput and running means are reported to it every
+    telemetry.RECORD_STRIDE fights.
+    """
+    results = MetricAccumulator()
+    rng = random if seed is None else random.Random()
+    first = 0
+    if checkpoint is not None:
+        store = Checkpoint(checkpoint, batch_fingerprint(players, enemies, attack_multiplier, defense_multiplier,
+                                                         num_runs, seed, 'reference', 1))
+        progress = store.job('batch', results)
+        results, first = progress.merged, progress.next_chunk
+        if seed is None and progress.rng_state is not None:
+            version, internal, gauss_next = progress.rng_state
+            random.setstate((version, tuple(internal), gauss_next))
+    if telemetry is not None:
+        label = describe_batch(players, enemies, attack_multiplier, defense_multiplier, seed)
+        telemetry.start_job(label, num_runs, first)
+        reported = (results.count, results.sums[1])
+    for i in range(first, num_runs):
+        if seed is not None:
+            rng.seed(run_seed(seed, i))
         players_copy = [Participant(p.name, p.max_hp, p.attack, p.defense, p.speed) for p in players]
         enemies_copy = [Participant(e.name, e.max_hp, e.attack, e.defense, e.speed) for e in enemies]
-        (victory, rounds, dmg_players, dmg_enemies, tension_idx, eng_var, flow, dec_impact, ntr) = simulate_combat(
-            players_copy, enemies_copy, attack_multiplier, defense_multiplier
-        )
-        results['victory'].append(victory)
-        results['rounds'].append(rounds)
-        results['dmg_players'].append(dmg_players)
-        results['dmg_enemies'].append(dmg_enemies)
-        results['tension_index'].append(tension_idx)
-        results['engagement_variability'].append(eng_var)
-        results['flow_state'].append(flow)
-        results['decision_impact'].append(dec_impact)
-        results['ntr'].append(ntr)
+        results.add(simulate_combat(players_copy, enemies_copy, attack_multiplier, defense_multiplier, rng))
+        if checkpoint is not None and store.due():
+            # Each run is one work unit here, so next_chunk is the next run to simulate
+            progress.next_chunk = i + 1
+            progress.rng_state = random.getstate() if seed is None else None
+            store.save()
+        if telemetry is not None and ((i + 1) % RECORD_STRIDE == 0 or i == num_runs - 1):
+            telemetry.record(label, results.count - reported[0], results.sums[1] - reported[1], results.means())
+            reported = (results.count, results.sums[1])
+    if checkpoint is not None:
+        store.remove()
+    if telemetry is not None:
+        telemetry.finish_job(label)
     
     # Calculate averages
-    avg_victory = sum(results['victory']) / num_runs
-    avg_rounds = sum(results['rounds']) / num_runs
-    avg_dmg_players = sum(results['dmg_players']) / num_runs
-    avg_dmg_enemies = sum(results['dmg_enemies']) / num_runs
-    avg_tension = sum(results['tension_index']) / num_runs
-    avg_engagement = sum(results['engagement_variability']) / num_runs
-    avg_flow = sum(results['flow_state']) / num_runs
-    avg_dec_impact = sum(results['decision_impact']) / num_runs
-    avg_ntr = sum(results['ntr']) / num_runs
-    return (avg_victory, avg_rounds, avg_dmg_players, avg_dmg_enemies, 
-            avg_tension, avg_engagement, avg_flow, avg_dec_impact, avg_ntr)
\ No newline at end of file
+    averages = results.means()
+    if distribution_metrics:
+        return averages + (results.distribution(),)
+    return averages
+
+def replay_fight(players, enemies, attack_multiplier, defense_multiplier, seed, run_index, trace=None):
+    """Replay run run_index of a seeded batch on its own, in O(one fight).
+
+    The run's generator is derived from (seed, run_index) alone (seeding.run_seed), so none of the
+    preceding runs are simulated. Gives the same fight as run run_index of run_multiple_simulations
+    or parallel.run_parallel_simulations with the 'reference' engine and the same seed.
+
+    Args:
+        players (list): Player Participant objects (not modified).
+        enemies (list): Enemy Participant objects (not modified).
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+        seed (int): Master seed of the batch.
+        run_index (int): Index of the run within the batch.
+        trace: Optional callable receiving a TurnEvent for every blow.
+
+    Returns:
+        tuple: The run's metrics, as returned by simulate_combat.
+    """
+    players_copy = [Participant(p.name, p.max_hp, p.attack, p.defense, p.speed) for p in players]
+    enemies_copy = [Participant(e.name, e.max_hp, e.attack, e.defense, e.speed) for e in enemies]
+    return simulate_combat(players_copy, enemies_copy, attack_multiplier, defense_multiplier,
+                           random.Random(run_seed(seed, run_index)), trace)
@@ -0,0 +1,185 @@
+import importlib.util
+import math
+import random
+from collections import namedtuple
+from accumulators import MetricAccumulator
+
+# Numba is optional and slow to import, so only check it is installed here; the nopython
+# kernels live in combat_kernels and are imported the first time a JIT path runs
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+# Encounter flattened into plain arrays indexed by participant slot (players first, then enemies)
+CompiledEncounter = namedtuple(
+    'CompiledEncounter',
+    ['names', 'max_hp', 'is_player', 'order', 'damage', 'num_players']
+)
+
+def compile_encounter(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0):
+    """Flatten participants into typed arrays the fight kernels can run without Python objects.
+
+    Args:
+        players (list): Player Participant objects.
+        enemies (list): Enemy Participant objects.
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+
+    Returns:
+        CompiledEncounter: Stats by slot, the speed-sorted turn order and the damage matrix
+        (damage[i][j] is what slot i deals to slot j, using Participant.take_turn's formula).
+    """
+    participants = list(players) + list(enemies)
+    # Same stable speed ordering as combat.simulate_combat; speeds never change mid-fight
+    order = sorted(range(len(participants)), key=lambda i: participants[i].speed, reverse=True)
+    damage = [[max(1, int(a.attack * attack_multiplier) - int(t.defense * defense_multiplier))
+               for t in participants] for a in participants]
+    return CompiledEncounter(
+        names=[p.name for p in participants],
+        max_hp=[p.max_hp for p in participants],
+        is_player=[i < len(players) for i in range(len(participants))],
+        order=order,
+        damage=damage,
+        num_players=len(players),
+    )
+
+def _fight(encounter, rng, party_hp=None, slots=None):
+    """Pure-Python fight kernel; consumes rng exactly like combat.simulate_combat does.
+
+    If party_hp is a list, the players' remaining HP is appended to it. If slots is an
+    accumulators.SlotStats, this fight's per-participant totals are added to it.
+    """
+    max_hp, is_player, damage = encounter.max_hp, encounter.is_player, encounter.damage
+    hp = list(max_hp)
+    alive = [True] * len(hp)
+    # Alive slots per side, kept in slot order so rng.choice sees the same lists as the reference
+    alive_players = list(range(encounter.num_players))
+    alive_enemies = list(range(encounter.num_players, len(hp)))
+
+    rounds = 0
+    damage_by_players = 0
+    damage_by_enemies = 0
+    tension_count = 0
+    total_turns = 0
+    damage_distribution = {}
+    decision_shifts = 0  # The reference decision model never registers a shift
+    if slots is not None:
+        slots.fights += 1
+        dealt_by, taken_by, turns_by, deaths, death_rounds, first_deaths, kills, rounds_alive = slots.totals
+        first_player_death = first_enemy_death = True
+
+    while alive_players and alive_enemies:
+        rounds += 1
+        for i in encounter.order:
+            if not alive[i]:
+                continue
+            targets = alive_enemies if is_player[i] else alive_players
+            if not targets:
+                continue
+            j = rng.choice(targets)
+            dealt = damage[i][j]
+            hp[j] = max(0, hp[j] - dealt)
+            if hp[j] == 0:
+                alive[j] = False
+                targets.remove(j)
+            if slots is not None:
+                dealt_by[i] += dealt
+                taken_by[j] += dealt
+                turns_by[i] += 1
+                if not alive[j]:
+                    deaths[j] += 1
+                    death_rounds[j] += rounds
+                    rounds_alive[j] += rounds
+                    kills[i] += 1
+                    if is_player[j] and first_player_death:
+                        first_deaths[j] += 1
+                        first_player_death = False
+                    elif not is_player[j] and first_enemy_death:
+                        first_deaths[j] += 1
+                        first_enemy_death = False
+            damage_distribution[dealt] = damage_distribution.get(dealt, 0) + 1
+            total_turns += 1
+            if hp[i] / max_hp[i] < 0.2:
+                tension_count += 1
+            if is_player[i]:
+                damage_by_players += dealt
+            else:
+                damage_by_enemies += dealt
+
+    if slots is not None:
+        for slot in alive_players + alive_enemies:
+            rounds_alive[slot] += rounds
+    if party_hp is not None:
+        party_hp.append(sum(hp[:encounter.num_players]))
+    return fight_metrics(len(alive_players) > 0, rounds, damage_by_players, damage_by_enemies, tension_count,
+                         total_turns, damage_distribution.values(), decision_shifts, len(alive_players))
+
+def fight_metrics(victory, rounds, damage_by_players, damage_by_enemies, tension_count, total_turns,
+                  damage_counts, decision_shifts, players_alive):
+    """Turn raw fight counters into the metric tuple returned by combat.simulate_combat."""
+    engagement_variability = 0
+    if total_turns > 0:
+        for count in damage_counts:
+            p = count / total_turns
+            if p > 0:
+                engagement_variability -= p * math.log2(p)
+    avg_dmg_dealt = damage_by_players / players_alive if players_alive else 0
+    avg_dmg_taken = damage_by_enemies / players_alive if players_alive else 0
+    flow_state = abs(1 - (avg_dmg_taken / avg_dmg_dealt)) if avg_dmg_dealt > 0 else 0
+    tension_index = tension_count / total_turns if total_turns > 0 else 0
+    decision_impact = (decision_shifts / total_turns) * 100 if total_turns > 0 else 0
+    ntr = (tension_index * engagement_variability) / (decision_impact if decision_impact > 0 else 1) if total_turns > 0 else 0
+    return (victory, rounds, damage_by_players, damage_by_enemies,
+            tension_index, engagement_variability, flow_state, decision_impact, ntr)
+
+def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0, use_jit=True, rng=random):
+    """Simulate a single combat encounter on the compiled engine.
+
+    Returns the same metric tuple as combat.simulate_combat. Unlike the reference, participants
+    are not modified. With use_jit=False (or without Numba) the pure-Python kernel draws from rng
+    exactly like the reference, so both produce identical fights for the same seed.
+    """
+    encounter = compile_encounter(players, enemies, attack_multiplier, defense_multiplier)
+    if use_jit and HAVE_NUMBA:
+        import combat_kernels
+        return combat_kernels.simulate_one(encounter)
+    return _fight(encounter, rng)
+
+def run_multiple_simulations(players, enemies, attack_multiplier, defense_multiplier, num_runs=1000,
+                             seed=None, use_jit=True, distribution_metrics=False):
+    """Run many fights on the compiled engine and return the same averages as combat.run_multiple_simulations.
+
+    With Numba the whole batch runs in nopython mode. seed makes the batch reproducible; without
+    Numba it seeds a private random.Random, otherwise the module-level random is used.
+    distribution_metrics=True appends the same distribution dict as the reference.
+    """
+    encounter = compile_encounter(players, enemies, attack_multiplier, defense_multiplier)
+    results = MetricAccumulator()
+    if use_jit and HAVE_NUMBA:
+        import combat_kernels
+        results.count = num_runs
+        results.sums, results.squares = combat_kernels.run_batch(encounter, num_runs, seed)
+    else:
+        rng = random if seed is None else random.Random(seed)
+        for _ in range(num_runs):
+            results.add(_fight(encounter, rng))
+    averages = results.means()
+    if distribution_metrics:
+        return averages + (results.distribution(),)
+    return averages
+
+def simulate_runs(encounter, seeds, use_jit=True, party_hp=None, slots=None):
+    """Run one fight per seed on a compiled encounter and return the metric tuples.
+
+    Each fight starts from a generator seeded with its own seed, so any run can be reproduced
+    on its own and two configurations given the same seeds share their random numbers.
+    If party_hp is a list, the players' remaining HP after each fight is appended to it; if
+    slots is an accumulators.SlotStats, per-participant totals are added to it.
+    """
+    if use_jit and HAVE_NUMBA:
+        import combat_kernels
+        return combat_kernels.run_seeded(encounter, seeds, party_hp, slots)
+    rng = random.Random()
+    results = []
+    for seed in seeds:
+        rng.seed(seed)
+        results.append(_fight(encounter, rng, party_hp, slots))
+    return results
@@ -0,0 +1,352 @@
+"""Numba nopython kernels for combat_jit.
+
+Imported lazily by combat_jit the first time a JIT path runs, so programs that never use the
+compiled engine don't pay for importing Numba. Requires numpy and numba.
+"""
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def _fight_numba(max_hp, is_player, order, damage, num_players, out, slot_out, track_slots):
+    """Nopython fight kernel; writes the nine metrics (victory as 0/1) and the players' remaining HP into out.
+
+    If track_slots is true, per-participant totals are added to slot_out, an (n, 8) array with
+    columns in accumulators.SLOT_STAT_NAMES order; otherwise slot_out is never touched.
+    """
+    n = max_hp.shape[0]
+    hp = max_hp.copy()
+    alive = np.ones(n, dtype=np.bool_)
+    alive_players = np.arange(0, num_players)
+    alive_enemies = np.arange(num_players, n)
+    num_alive_players = num_players
+    num_alive_enemies = n - num_players
+    # Damage histogram keyed by value, remembering first-seen order like the reference dict
+    max_damage = damage.max()
+    counts = np.zeros(max_damage + 1, dtype=np.int64)
+    seen = np.empty(n * n, dtype=np.int64)
+    num_seen = 0
+
+    rounds = 0
+    damage_by_players = 0
+    damage_by_enemies = 0
+    tension_count = 0
+    total_turns = 0
+    first_player_death = True
+    first_enemy_death = True
+    while num_alive_players > 0 and num_alive_enemies > 0:
+        rounds += 1
+        for k in range(n):
+            i = order[k]
+            if not alive[i]:
+                continue
+            if is_player[i]:
+                if num_alive_enemies == 0:
+                    continue
+                pos = np.random.randint(0, num_alive_enemies)
+                j = alive_enemies[pos]
+            else:
+                if num_alive_players == 0:
+                    continue
+                pos = np.random.randint(0, num_alive_players)
+                j = alive_players[pos]
+            dealt = damage[i, j]
+            hp[j] = max(0, hp[j] - dealt)
+            if track_slots:
+                slot_out[i, 0] += dealt
+                slot_out[j, 1] += dealt
+                slot_out[i, 2] += 1
+            if hp[j] == 0:
+                alive[j] = False
+                if track_slots:
+                    slot_out[j, 3] += 1
+                    slot_out[j, 4] += rounds
+                    slot_out[j, 7] += rounds
+                    slot_out[i, 6] += 1
+                    if is_player[j] and first_player_death:
+                        slot_out[j, 5] += 1
+                        first_player_death = False
+                    elif not is_player[j] and first_enemy_death:
+                        slot_out[j, 5] += 1
+                        first_enemy_death = False
+                # Remove j while keeping slot order
+                if is_player[j]:
+                    for m in range(pos, num_alive_players - 1):
+                        alive_players[m] = alive_players[m + 1]
+                    num_alive_players -= 1
+                else:
+                    for m in range(pos, num_alive_enemies - 1):
+                        alive_enemies[m] = alive_enemies[m + 1]
+                    num_alive_enemies -= 1
+            if counts[dealt] == 0:
+                seen[num_seen] = dealt
+                num_seen += 1
+            counts[dealt] += 1
+            total_turns += 1
+            if hp[i] / max_hp[i] < 0.2:
+                tension_count += 1
+            if is_player[i]:
+                damage_by_players += dealt
+            else:
+                damage_by_enemies += dealt
+
+    if track_slots:
+        for i in range(n):
+            if alive[i]:
+                slot_out[i, 7] += rounds
+    engagement_variability = 0.0
+    for m in range(num_seen):
+        p = counts[seen[m]] / total_turns
+        engagement_variability -= p * np.log2(p)
+    flow_state = 0.0
+    if num_alive_players > 0 and damage_by_players > 0:
+        flow_state = abs(1 - (damage_by_enemies / num_alive_players) / (damage_by_players / num_alive_players))
+    tension_index = tension_count / total_turns if total_turns > 0 else 0.0
+    out[0] = 1.0 if num_alive_players > 0 else 0.0
+    out[1] = rounds
+    out[2] = damage_by_players
+    out[3] = damage_by_enemies
+    out[4] = tension_index
+    out[5] = engagement_variability
+    out[6] = flow_state
+    out[7] = 0.0  # Decision impact: the reference decision model never registers a shift
+    out[8] = tension_index * engagement_variability
+    out[9] = hp[:num_players].sum()
+
+@njit(cache=True)
+def _run_batch_numba(max_hp, is_player, order, damage, num_players, num_runs, seed):
+    """Run num_runs fights in nopython mode and return a (2, 9) array of per-metric sums and sums of squares."""
+    if seed >= 0:
+        np.random.seed(seed)
+    totals = np.zeros((2, 9))
+    out = np.zeros(10)
+    slot_out = np.zeros((0, 8))  # Never written: batches don't track per-participant totals
+    for _ in range(num_runs):
+        _fight_numba(max_hp, is_player, order, damage, num_players, out, slot_out, False)
+        for m in range(9):
+            totals[0, m] += out[m]
+            totals[1, m] += out[m] * out[m]
+    return totals
+
+@njit(cache=True)
+def _run_seeded_numba(max_hp, is_player, order, damage, num_players, seeds, slot_out, track_slots):
+    """Run one fight per seed, reseeding before each, and return a (len(seeds), 10) result array.
+
+    If track_slots is true, per-participant totals over all the fights are added to slot_out.
+    """
+    results = np.zeros((seeds.shape[0], 10))
+    for r in range(seeds.shape[0]):
+        np.random.seed(seeds[r])
+        _fight_numba(max_hp, is_player, order, damage, num_players, results[r], slot_out, track_slots)
+    return results
+
+def as_arrays(encounter):
+    """Convert a CompiledEncounter into the numpy arrays the kernels expect."""
+    return (np.array(encounter.max_hp, dtype=np.int64), np.array(encounter.is_player, dtype=np.bool_),
+            np.array(encounter.order, dtype=np.int64), np.array(encounter.damage, dtype=np.int64),
+            encounter.num_players)
+
+def _to_tuple(row):
+    """Convert a kernel result row into the metric tuple returned by combat.simulate_combat."""
+    return (bool(row[0]), int(row[1]), int(row[2]), int(row[3])) + tuple(float(v) for v in row[4:9])
+
+def simulate_one(encounter):
+    """Run a single fight on Numba's global generator and return its metric tuple."""
+    out = np.zeros(10)
+    _fight_numba(*as_arrays(encounter), out, np.zeros((0, 8)), False)
+    return _to_tuple(out)
+
+def run_batch(encounter, num_runs, seed=None):
+    """Run num_runs fights in nopython mode and return (sums, sums of squares) as lists of floats."""
+    totals = _run_batch_numba(*as_arrays(encounter), num_runs, -1 if seed is None else seed)
+    return [float(v) for v in totals[0]], [float(v) for v in totals[1]]
+
+def run_seeded(encounter, seeds, party_hp=None, slots=None):
+    """Run one fight per seed (Numba's generator takes 32-bit seeds) and return the metric tuples.
+
+    If party_hp is a list, the players' remaining HP after each fight is appended to it; if
+    slots is an accumulators.SlotStats, per-participant totals are added to it.
+    """
+    slot_out = np.zeros((len(encounter.max_hp) if slots is not None else 0, 8))
+    results = _run_seeded_numba(*as_arrays(encounter), np.array([s & 0xFFFFFFFF for s in seeds], dtype=np.uint32),
+                                slot_out, slots is not None)
+    if party_hp is not None:
+        party_hp.extend(int(row[9]) for row in results)
+    if slots is not None:
+        slots.fights += len(seeds)
+        for stat, column in zip(slots.totals, slot_out.T):
+            for slot, value in enumerate(column):
+                stat[slot] += int(value)
+    return [_to_tuple(row) for row in results]
+
+@njit(cache=True)
+def _remove_slot(alive_list, count, slot):
+    """Remove slot from the first count entries of alive_list, keeping slot order; return the new count."""
+    pos = 0
+    while alive_list[pos] != slot:
+        pos += 1
+    for m in range(pos, count - 1):
+        alive_list[m] = alive_list[m + 1]
+    return count - 1
+
+@njit(cache=True)
+def _fight_abilities_numba(max_hp, is_player, order, num_players, defense, rule_count, thresholds, opcodes,
+                           values, durations, out):
+    """Nopython ability kernel, mirroring abilities._fight; writes the same outputs as _fight_numba."""
+    n = max_hp.shape[0]
+    hp = max_hp.copy()
+    alive = np.ones(n, dtype=np.bool_)
+    alive_players = np.arange(0, num_players)
+    alive_enemies = np.arange(num_players, n)
+    num_alive_players = num_players
+    num_alive_enemies = n - num_players
+    guard = np.ones(n)
+    poison_turns = np.zeros(n, dtype=np.int64)
+    poison_damage = np.zeros(n, dtype=np.int64)
+    last_opcode = np.full(n, -1, dtype=np.int64)
+    # Damage histogram in first-seen order; distinct values are few, so a linear search is cheapest
+    seen = np.empty(64, dtype=np.int64)
+    counts = np.zeros(64, dtype=np.int64)
+    num_seen = 0
+
+    rounds = 0
+    damage_by_players = 0
+    damage_by_enemies = 0
+    tension_count = 0
+    total_turns = 0
+    decision_shifts = 0
+    while num_alive_players > 0 and num_alive_enemies > 0:
+        rounds += 1
+        for k in range(n):
+            i = order[k]
+            if not alive[i]:
+                continue
+            if poison_turns[i] > 0:
+                poison_turns[i] -= 1
+                tick = min(hp[i], poison_damage[i])
+                if is_player[i]:
+                    damage_by_enemies += tick
+                else:
+                    damage_by_players += tick
+                hp[i] -= tick
+                if hp[i] == 0:
+                    alive[i] = False
+                    if is_player[i]:
+                        num_alive_players = _remove_slot(alive_players, num_alive_players, i)
+                    else:
+                        num_alive_enemies = _remove_slot(alive_enemies, num_alive_enemies, i)
+                    continue
+            guard[i] = 1.0
+            num_opponents = num_alive_enemies if is_player[i] else num_alive_players
+            if num_opponents == 0:
+                continue
+            opponents = alive_enemies if is_player[i] else alive_players
+            ratio = hp[i] / max_hp[i]
+            r = 0
+            while r < rule_count[i] - 1 and not ratio < thresholds[i, r]:
+                r += 1
+            op = opcodes[i, r]
+            if last_opcode[i] >= 0 and op != last_opcode[i]:
+                decision_shifts += 1
+            last_opcode[i] = op
+
+            dealt = 0
+            if op == 0 or op == 3:  # ATTACK, AOE
+                if op == 0:
+                    first = np.random.randint(0, num_opponents)
+                    last = first + 1
+                else:
+                    first = 0
+                    last = num_opponents
+                # Copy the targets first: kills shrink the alive list while we iterate
+                targets = opponents[first:last].copy()
+                for j in targets:
+                    blow = max(1, int(values[i, r]) - defense[j])
+                    if guard[j] != 1.0:
+                        blow = max(1, int(blow * guard[j]))
+                    hp[j] = max(0, hp[j] - blow)
+                    dealt += blow
+                    if hp[j] == 0:
+                        alive[j] = False
+                        if is_player[j]:
+                            num_alive_players = _remove_slot(alive_players, num_alive_players, j)
+                        else:
+                            num_alive_enemies = _remove_slot(alive_enemies, num_alive_enemies, j)
+            elif op == 1:  # DEFEND
+                guard[i] = values[i, r]
+            elif op == 2:  # HEAL
+                allies = alive_players if is_player[i] else alive_enemies
+                num_allies = num_alive_players if is_player[i] else num_alive_enemies
+                j = allies[0]
+                for a in range(1, num_allies):
+                    if hp[allies[a]] / max_hp[allies[a]] < hp[j] / max_hp[j]:
+                        j = allies[a]
+                hp[j] = min(max_hp[j], hp[j] + int(values[i, r]))
+            elif op == 4:  # POISON
+                j = opponents[np.random.randint(0, num_opponents)]
+                poison_turns[j] = durations[i, r]
+                poison_damage[j] = int(values[i, r])
+
+            index = 0
+            while index < num_seen and seen[index] != dealt:
+                index += 1
+            if index == num_seen:
+                if num_seen == seen.shape[0]:
+                    seen = np.concatenate((seen, np.empty(num_seen, dtype=np.int64)))
+                    counts = np.concatenate((counts, np.zeros(num_seen, dtype=np.int64)))
+                seen[num_seen] = dealt
+                num_seen += 1
+            counts[index] += 1
+            total_turns += 1
+            if hp[i] / max_hp[i] < 0.2:
+                tension_count += 1
+            if is_player[i]:
+                damage_by_players += dealt
+            else:
+                damage_by_enemies += dealt
+
+    engagement_variability = 0.0
+    for m in range(num_seen):
+        p = counts[m] / total_turns
+        engagement_variability -= p * np.log2(p)
+    flow_state = 0.0
+    if num_alive_players > 0 and damage_by_players > 0:
+        flow_state = abs(1 - (damage_by_enemies / num_alive_players) / (damage_by_players / num_alive_players))
+    tension_index = tension_count / total_turns if total_turns > 0 else 0.0
+    decision_impact = decision_shifts / total_turns * 100 if total_turns > 0 else 0.0
+    out[0] = 1.0 if num_alive_players > 0 else 0.0
+    out[1] = rounds
+    out[2] = damage_by_players
+    out[3] = damage_by_enemies
+    out[4] = tension_index
+    out[5] = engagement_variability
+    out[6] = flow_state
+    out[7] = decision_impact
+    out[8] = tension_index * engagement_variability / (decision_impact if decision_impact > 0 else 1.0)
+    out[9] = hp[:num_players].sum()
+
+@njit(cache=True)
+def _run_abilities_seeded_numba(max_hp, is_player, order, num_players, defense, rule_count, thresholds, opcodes,
+                                values, durations, seeds):
+    """Run one ability fight per seed, reseeding before each, and return a (len(seeds), 10) result array."""
+    results = np.zeros((seeds.shape[0], 10))
+    for r in range(seeds.shape[0]):
+        np.random.seed(seeds[r])
+        _fight_abilities_numba(max_hp, is_player, order, num_players, defense, rule_count, thresholds, opcodes,
+                               values, durations, results[r])
+    return results
+
+def run_abilities_seeded(encounter, seeds, party_hp=None):
+    """Run one fight per seed on an abilities.AbilityEncounter and return the metric tuples.
+
+    If party_hp is a list, the players' remaining HP after each fight is appended to it.
+    """
+    results = _run_abilities_seeded_numba(
+        np.array(encounter.max_hp, dtype=np.int64), np.array(encounter.is_player, dtype=np.bool_),
+        np.array(encounter.order, dtype=np.int64), encounter.num_players,
+        np.array(encounter.defense, dtype=np.int64), np.array(encounter.rule_count, dtype=np.int64),
+        np.array(encounter.thresholds, dtype=np.float64), np.array(encounter.opcodes, dtype=np.int64),
+        np.array(encounter.values, dtype=np.float64), np.array(encounter.durations, dtype=np.int64),
+        np.array([s & 0xFFFFFFFF for s in seeds], dtype=np.uint32))
+    if party_hp is not None:
+        party_hp.extend(int(row[9]) for row in results)
+    return [_to_tuple(row) for row in results]
@@ -0,0 +1,88 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from accumulators import METRIC_NAMES, RunningStats
+from parallel import CHUNK_SIZE, ENGINES, chunk_bounds, run_seed
+
+# Per-metric result of a paired comparison against the baseline configuration.
+# unpaired_std_error is what the same runs would give with independent randomness, for reference.
+PairedDifference = namedtuple(
+    'PairedDifference', ['metric', 'mean', 'std_error', 'ci_low', 'ci_high', 'unpaired_std_error']
+)
+
+def _normalize(configuration):
+    """Accept (attack_multiplier, defense_multiplier) pairs or dicts with those keys."""
+    if isinstance(configuration, dict):
+        return configuration['attack_multiplier'], configuration['defense_multiplier']
+    return tuple(configuration)
+
+def compare_chunk(engine, players, enemies, configurations, master_seed, start, stop):
+    """Simulate runs start..stop-1 for every configuration with shared seeds.
+
+    Returns (per_config, diffs): per_config[c][m] is RunningStats of metric m under configuration c,
+    diffs[c][m] is RunningStats of the per-run difference between configuration c and configuration 0.
+    """
+    seeds = [run_seed(master_seed, i) for i in range(start, stop)]
+    results = [ENGINES[engine](players, enemies, am, dm, seeds) for am, dm in configurations]
+    per_config = [[RunningStats() for _ in METRIC_NAMES] for _ in configurations]
+    diffs = [[RunningStats() for _ in METRIC_NAMES] for _ in configurations]
+    for run in range(len(seeds)):
+        baseline = results[0][run]
+        for c, config_results in enumerate(results):
+            for m, value in enumerate(config_results[run]):
+                per_config[c][m].add(value)
+                diffs[c][m].add(value - baseline[m])
+    return per_config, diffs
+
+def compare_configurations(players, enemies, configurations, num_runs=1000, seed=0, engine='reference',
+                           confidence=0.95, workers=1, chunk_size=CHUNK_SIZE):
+    """Compare two or more multiplier settings with common random numbers.
+
+    Run i of every configuration uses the same seed, so each configuration sees the same random
+    target choices and per-run differences cancel most of the noise shared between them. Only
+    streaming statistics are kept, so memory does not grow with num_runs.
+
+    Args:
+        players (list): Player Participant objects (not modified).
+        enemies (list): Enemy Participant objects (not modified).
+        configurations (list): (attack_multiplier, defense_multiplier) pairs or dicts; the first is the baseline.
+        num_runs (int): Paired runs per configuration.
+        seed (int): Master seed.
+        engine (str): Simulation engine (see parallel.ENGINES).
+        confidence (float): Confidence level of the reported intervals.
+        workers (int): Worker processes.
+        chunk_size (int): Runs per work unit.
+
+    Returns:
+        list: For each configuration after the baseline, a dict mapping metric name to PairedDifference.
+    """
+    configurations = [_normalize(c) for c in configurations]
+    if len(configurations) < 2:
+        raise ValueError("Need a baseline and at least one configuration to compare against it.")
+    args = [(engine, players, enemies, configurations, seed, start, stop)
+            for start, stop in chunk_bounds(num_runs, chunk_size)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(compare_chunk, *zip(*args)))
+    else:
+        chunks = [compare_chunk(*chunk_args) for chunk_args in args]
+
+    per_config = [[RunningStats() for _ in METRIC_NAMES] for _ in configurations]
+    diffs = [[RunningStats() for _ in METRIC_NAMES] for _ in configurations]
+    for chunk_per_config, chunk_diffs in chunks:
+        for c in range(len(configurations)):
+            for m in range(len(METRIC_NAMES)):
+                per_config[c][m].merge(chunk_per_config[c][m])
+                diffs[c][m].merge(chunk_diffs[c][m])
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    report = []
+    for c in range(1, len(configurations)):
+        metrics = {}
+        for m, name in enumerate(METRIC_NAMES):
+            diff = diffs[c][m]
+            unpaired = (per_config[c][m].std_error ** 2 + per_config[0][m].std_error ** 2) ** 0.5
+            metrics[name] = PairedDifference(name, diff.mean, diff.std_error, diff.mean - z * diff.std_error,
+                                             diff.mean + z * diff.std_error, unpaired)
+        report.append(metrics)
+    return report
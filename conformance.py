@@ -0,0 +1,220 @@
+import argparse
+import random
+import sys
+from collections import namedtuple
+from statistics import NormalDist
+import abilities
+import combat_jit
+from accumulators import METRIC_NAMES, MetricAccumulator
+from parallel import ENGINES, run_seed
+from scenarios import SCENARIOS, Scenario, build_participants
+
+# Outcome of checking one engine on one scenario against the reference.
+# mode is 'exact' (shared seeds, every fight compared) or 'statistical' (TOST on every metric's mean);
+# detail is the first mismatching run index for exact checks, or the least equivalent metric otherwise.
+ConformanceResult = namedtuple('ConformanceResult', ['engine', 'scenario', 'mode', 'runs', 'passed', 'detail'])
+
+# Per-metric outcome of a two one-sided tests (TOST) equivalence check.
+# The engines are equivalent on the metric when both one-sided p-values are below alpha, i.e.
+# the (1 - 2 * alpha) confidence interval of the difference lies inside [-margin, margin].
+Equivalence = namedtuple('Equivalence', ['metric', 'difference', 'margin', 'p_value', 'equivalent'])
+
+def _all_random(players, enemies):
+    """True when nobody sets a targeting policy other than 'random'."""
+    return all((p.targeting or 'random') == 'random' for p in list(players) + list(enemies))
+
+def _all_aggressive(players, enemies):
+    """True when every participant uses the default (plain attack) behavior."""
+    return all(p.behavior in (None, 'aggressive') for p in list(players) + list(enemies))
+
+def _equal_speeds(players, enemies):
+    """True when every participant has the same speed."""
+    return len({p.speed for p in list(players) + list(enemies)}) == 1
+
+def _distinct_units(players, enemies):
+    """True when no two participants share a stat block, so every unit group has one member."""
+    participants = list(players) + list(enemies)
+    return len({(p.name, p.max_hp, p.attack, p.defense, p.speed) for p in participants}) == len(participants)
+
+def _repeated_units(players, enemies):
+    """True when some unit group has more than one member."""
+    return not _distinct_units(players, enemies)
+
+def _python_compiled_runs(players, enemies, attack_multiplier, defense_multiplier, seeds):
+    """Results of the compiled engine's pure-Python kernel, one fight per seed."""
+    encounter = combat_jit.compile_encounter(players, enemies, attack_multiplier, defense_multiplier)
+    return combat_jit.simulate_runs(encounter, seeds, use_jit=False)
+
+def _python_ability_runs(players, enemies, attack_multiplier, defense_multiplier, seeds):
+    """Results of the ability engine's pure-Python kernel, one fight per seed."""
+    encounter = abilities.compile_abilities(players, enemies, attack_multiplier, defense_multiplier)
+    return abilities.simulate_runs(encounter, seeds, use_jit=False)
+
+def _engine(name):
+    """Wrap a parallel.ENGINES entry as function(players, enemies, am, dm, seeds)."""
+    return lambda players, enemies, am, dm, seeds: ENGINES[name](players, enemies, am, dm, seeds)
+
+# Checked engines: name -> (function(players, enemies, am, dm, seeds), mode, applies(players, enemies)).
+# Engines that consume Python's random module like combat.simulate_combat are compared fight for
+# fight on the encounters their parity guarantee covers; Numba kernels draw from their own generator,
+# so they can only be held to statistical equivalence.
+CHECKS = {
+    'compiled (python)': (_python_compiled_runs, 'exact', _all_aggressive),
+    'compiled': (_engine('compiled'), 'statistical' if combat_jit.HAVE_NUMBA else 'exact', _all_aggressive),
+    'abilities (python)': (_python_ability_runs, 'exact', _all_aggressive),
+    'abilities': (_engine('abilities'), 'statistical' if combat_jit.HAVE_NUMBA else 'exact', _all_aggressive),
+    'group': (_engine('group'), 'exact', _distinct_units),
+    'group (multi-member)': (_engine('group'), 'statistical', _repeated_units),
+    'targeted': (_engine('targeted'), 'exact', _all_random),
+    'event': (_engine('event'), 'exact', _equal_speeds),
+}
+
+def generate_scenarios(count, seed=0):
+    """Random encounters for conformance checks.
+
+    Sides have 1-4 players and 1-6 enemies with varied stats and multipliers; every third
+    encounter gives everyone the same speed so speed-sensitive engines are covered too. Names
+    are unique, so no two participants share a stat block.
+
+    Returns:
+        list: Scenario tuples.
+    """
+    rng = random.Random(seed)
+    generated = []
+    for k in range(count):
+        speed = rng.randint(5, 15) if k % 3 == 0 else None
+
+        def side(prefix, size):
+            return [(f"{prefix} {i + 1}", rng.randint(10, 80), rng.randint(3, 15), rng.randint(0, 8),
+                     speed or rng.randint(5, 15)) for i in range(size)]
+
+        generated.append(Scenario(f"Generated {k + 1}", side("Hero", rng.randint(1, 4)),
+                                  side("Foe", rng.randint(1, 6)), round(rng.uniform(0.7, 1.6), 2),
+                                  round(rng.uniform(0.7, 1.4), 2), (0.0, 1.0)))
+    return generated
+
+def exact_mismatch(expected, actual):
+    """Index of the first run whose metric tuples differ, or None when every fight matches."""
+    for run, (a, b) in enumerate(zip(expected, actual)):
+        if a != b:
+            return run
+    if len(expected) != len(actual):
+        return min(len(expected), len(actual))
+    return None
+
+def equivalence_test(reference, candidate, margin=0.2, alpha=0.05):
+    """TOST equivalence of every metric's mean between two independent samples.
+
+    The margin is a standardized effect size: the means may differ by at most margin times the
+    pooled standard deviation of the metric. A metric that is constant in both samples is only
+    equivalent when the constants agree.
+
+    Args:
+        reference (MetricAccumulator): Fights from the reference engine.
+        candidate (MetricAccumulator): Fights from the engine under test.
+        margin (float): Equivalence margin in pooled standard deviations.
+        alpha (float): Significance level of each one-sided test.
+
+    Returns:
+        list: One Equivalence per metric, in METRIC_NAMES order.
+    """
+    results = []
+    normal = NormalDist()
+    for m, metric in enumerate(METRIC_NAMES):
+        difference = candidate.means()[m] - reference.means()[m]
+        var_ref, var_cand = reference.variances()[m], candidate.variances()[m]
+        bound = margin * ((var_ref + var_cand) / 2) ** 0.5
+        std_error = (var_ref / reference.count + var_cand / candidate.count) ** 0.5
+        if std_error == 0:
+            p_value = 0.0 if abs(difference) <= bound + 1e-12 else 1.0
+        else:
+            p_lower = 1 - normal.cdf((difference + bound) / std_error)
+            p_upper = normal.cdf((difference - bound) / std_error)
+            p_value = max(p_lower, p_upper)
+        results.append(Equivalence(metric, difference, bound, p_value, p_value < alpha))
+    return results
+
+def check_engine(engine, scenario, runs=500, seed=0, margin=0.2, alpha=0.05, statistical_runs=4000):
+    """Check one engine against combat.simulate_combat on one scenario.
+
+    Both engines are given the same per-run seeds (parallel.run_seed). Exact checks compare every
+    fight's metric tuple over runs fights; statistical checks run a TOST on every metric's mean
+    over statistical_runs fights, enough to show equivalence within a 0.2 SD margin reliably.
+
+    Returns:
+        ConformanceResult, or None when the engine's parity guarantee does not cover the scenario.
+    """
+    function, mode, applies = CHECKS[engine]
+    players, enemies = build_participants(scenario)
+    if not applies(players, enemies):
+        return None
+    if mode == 'statistical':
+        runs = statistical_runs
+    seeds = [run_seed(seed, i) for i in range(runs)]
+    am, dm = scenario.attack_multiplier, scenario.defense_multiplier
+    expected = ENGINES['reference'](players, enemies, am, dm, seeds)
+    actual = function(players, enemies, am, dm, seeds)
+    if mode == 'exact':
+        mismatch = exact_mismatch(expected, actual)
+        detail = 'all fights identical' if mismatch is None else f"run {mismatch} differs"
+        return ConformanceResult(engine, scenario.name, mode, runs, mismatch is None, detail)
+    reference, candidate = MetricAccumulator(), MetricAccumulator()
+    for result in expected:
+        reference.add(result)
+    for result in actual:
+        candidate.add(result)
+    tests = equivalence_test(reference, candidate, margin, alpha)
+    worst = max(tests, key=lambda t: t.p_value)
+    detail = f"{worst.metric}: diff {worst.difference:+.4g} (margin {worst.margin:.4g}), p={worst.p_value:.3g}"
+    return ConformanceResult(engine, scenario.name, mode, runs, all(t.equivalent for t in tests), detail)
+
+def run_conformance(scenarios=None, engines=None, runs=500, seed=0, margin=0.2, alpha=0.05, statistical_runs=4000):
+    """Check every engine on every scenario it applies to.
+
+    Args:
+        scenarios (list): Scenario tuples; defaults to the registered scenarios plus 12 generated ones.
+        engines (list): Keys of CHECKS; defaults to all of them.
+        runs (int): Fights per exact check.
+        seed (int): Master seed shared by the reference and the engine under test.
+        margin (float): Equivalence margin for statistical checks, in standard deviations.
+        alpha (float): Significance level of each one-sided test.
+        statistical_runs (int): Fights per statistical check.
+
+    Returns:
+        list: ConformanceResult for every applicable (engine, scenario) pair.
+    """
+    if scenarios is None:
+        scenarios = list(SCENARIOS.values()) + generate_scenarios(12, seed)
+    results = []
+    for engine in engines or CHECKS:
+        if engine not in CHECKS:
+            raise ValueError(f"Unknown engine '{engine}'. Choose from: {', '.join(CHECKS)}")
+        for scenario in scenarios:
+            result = check_engine(engine, scenario, runs, seed, margin, alpha, statistical_runs)
+            if result is not None:
+                results.append(result)
+    return results
+
+# Main function to run the conformance suite from the command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the fast combat engines against the reference simulate_combat.")
+    parser.add_argument('--engine', action='append', choices=list(CHECKS), help="Engine to check (repeatable; default all).")
+    parser.add_argument('--generated', type=int, default=12, help="Number of generated scenarios.")
+    parser.add_argument('--runs', type=int, default=500, help="Fights per exact check.")
+    parser.add_argument('--statistical-runs', type=int, default=4000, help="Fights per statistical check.")
+    parser.add_argument('--seed', type=int, default=0, help="Master seed.")
+    parser.add_argument('--margin', type=float, default=0.2, help="Equivalence margin in standard deviations.")
+    args = parser.parse_args(argv)
+
+    from tabulate import tabulate
+    scenarios = list(SCENARIOS.values()) + generate_scenarios(args.generated, args.seed)
+    results = run_conformance(scenarios, args.engine, args.runs, args.seed, args.margin,
+                              statistical_runs=args.statistical_runs)
+    print(tabulate([[r.engine, r.scenario, r.mode, 'pass' if r.passed else 'FAIL', r.detail] for r in results],
+                   headers=['Engine', 'Scenario', 'Mode', 'Result', 'Detail']))
+    failures = sum(not r.passed for r in results)
+    print(f"{len(results) - failures}/{len(results)} checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
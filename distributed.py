@@ -0,0 +1,308 @@
+import ipaddress
+import os
+import secrets
+import socket
+import threading
+import time
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+from accumulators import MetricAccumulator
+from checkpoint import CHECKPOINT_INTERVAL, Checkpoint, batch_fingerprint
+from parallel import CHUNK_SIZE, ENGINES, Job, chunk_bounds, simulate_chunk
+
+# The broker speaks pickle over multiprocessing.managers, so the authkey is all that stops anyone who
+# can reach the port from running code on the coordinator (or a fake coordinator on its workers).
+# There is deliberately no default: it comes from the caller or this environment variable.
+AUTHKEY_ENV = 'RPG_COMBAT_AUTHKEY'
+LEASE_TIMEOUT = 60.0  # Seconds a worker may hold a chunk before it is handed to someone else
+MAX_ATTEMPTS = 3  # Failed or expired chunks are retried this many times before the sweep aborts
+
+class WorkBroker:
+    """Thread-safe queue of simulation chunks with leases and retries.
+
+    Lives in the coordinator process and is shared with workers through a multiprocessing manager.
+    A chunk handed to a worker is leased; if the worker reports a failure or the lease expires
+    the chunk goes back on the queue, up to max_attempts times. Finished chunks are merged per job
+    in chunk order as they arrive; with a checkpoint file that progress survives a coordinator
+    restart, and chunks already in it are not handed out again. The file is deleted once every
+    chunk has finished.
+    """
+
+    def __init__(self, jobs, chunk_size=CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                 checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL, telemetry=None):
+        """Split every job into chunk tasks, skipping chunks already completed in the checkpoint file.
+
+        With a telemetry.Telemetry, queue depth, worker activity and per-job progress are reported to it.
+
+        Raises:
+            ValueError: A job names an unknown engine.
+        """
+        for job in jobs:
+            if job.engine not in ENGINES:
+                raise ValueError(f"Unknown engine '{job.engine}'. Choose from: {', '.join(ENGINES)}")
+        self._lock = threading.Lock()
+        fingerprint = {} if checkpoint is None else [
+            [str(job.name), batch_fingerprint(job.players, job.enemies, job.attack_multiplier, job.defense_multiplier,
+                                              job.num_runs, job.seed, job.engine, chunk_size)] for job in jobs]
+        self._checkpoint = Checkpoint(checkpoint, fingerprint, checkpoint_interval)
+        self._progress = {job.name: self._checkpoint.job(job.name) for job in jobs}
+        self._tasks = {}
+        self._pending = []
+        self._chunks = {}
+        for job in jobs:
+            for index, (start, stop) in enumerate(chunk_bounds(job.num_runs, chunk_size)):
+                task_id = (job.name, index)
+                self._tasks[task_id] = (job.engine, job.players, job.enemies, job.attack_multiplier,
+                                        job.defense_multiplier, job.seed, start, stop)
+                if not self._progress[job.name].done(index):
+                    self._pending.append(task_id)
+            self._chunks[job.name] = len(chunk_bounds(job.num_runs, chunk_size))
+        self._pending.reverse()  # pop() from the end hands out chunks in order
+        self._leases = {}
+        self._attempts = {task_id: 0 for task_id in self._tasks}
+        self._error = None
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._telemetry = telemetry
+        if telemetry is not None:
+            for job in jobs:
+                progress = self._progress[job.name]
+                done = progress.merged.count + sum(acc.count for acc in progress.pending.values())
+                telemetry.start_job(str(job.name), job.num_runs, done)
+                if progress.completed == self._chunks[job.name]:
+                    telemetry.finish_job(str(job.name))
+            telemetry.set_queue(len(self._pending))
+
+    def _report_queue(self):
+        """Send the queue depth to telemetry (call with the lock held)."""
+        if self._telemetry is not None:
+            self._telemetry.set_queue(len(self._pending), len(self._leases))
+
+    def _requeue(self, task_id, reason):
+        """Put a task back on the queue, or abort the sweep once it has used all its attempts."""
+        lease = self._leases.pop(task_id, None)
+        if self._telemetry is not None and lease is not None:
+            self._telemetry.worker_idle(lease[0], completed=False)
+        if self._attempts[task_id] >= self.max_attempts:
+            self._error = f"Chunk {task_id} failed {self._attempts[task_id]} times; last error: {reason}"
+        else:
+            self._pending.append(task_id)
+
+    def get_task(self, worker_id):
+        """Lease the next chunk to a worker.
+
+        Returns:
+            dict: {'status': 'task', 'task_id': ..., 'args': ...}, {'status': 'wait'} when all remaining
+            chunks are leased, or {'status': 'done'} when the sweep has finished or aborted.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._telemetry is not None:
+                self._telemetry.worker_seen(worker_id)
+            for task_id, (_, deadline) in list(self._leases.items()):
+                if deadline < now:
+                    self._requeue(task_id, "lease expired")
+            if self._error is not None or self._completed() == len(self._tasks):
+                return {'status': 'done'}
+            if not self._pending:
+                self._report_queue()
+                return {'status': 'wait'}
+            task_id = self._pending.pop()
+            self._attempts[task_id] += 1
+            self._leases[task_id] = (worker_id, now + self.lease_timeout)
+            if self._telemetry is not None:
+                self._telemetry.worker_busy(worker_id)
+                self._report_queue()
+            return {'status': 'task', 'task_id': task_id, 'args': self._tasks[task_id]}
+
+    def _completed(self):
+        """Number of completed chunks over all jobs (call with the lock held)."""
+        return sum(progress.completed for progress in self._progress.values())
+
+    def put_result(self, task_id, result):
+        """Record a finished chunk (a MetricAccumulator.to_dict()); duplicates from retried chunks are ignored."""
+        snapshot = finished = None
+        with self._lock:
+            lease = self._leases.pop(task_id, None)
+            name, index = task_id
+            if not self._progress[name].done(index):
+                acc = MetricAccumulator.from_dict(result)
+                self._progress[name].add(index, acc)
+                finished = self._completed() == len(self._tasks)
+                if not finished and self._checkpoint.due():
+                    snapshot = self._checkpoint.snapshot()
+                if self._telemetry is not None:
+                    progress = self._progress[name]
+                    self._telemetry.record(str(name), acc.count, acc.sums[1], progress.merged.means())
+                    if progress.completed == self._chunks[name]:
+                        self._telemetry.finish_job(str(name))
+            if task_id in self._pending:
+                self._pending.remove(task_id)
+            if self._telemetry is not None:
+                if lease is not None:
+                    self._telemetry.worker_idle(lease[0])
+                self._report_queue()
+        # Disk writes happen outside the lock so other workers are not stalled behind an fsync
+        if finished:
+            self._checkpoint.remove()
+        elif snapshot is not None:
+            self._checkpoint.write(snapshot)
+
+    def report_failure(self, task_id, error, worker_id):
+        """Give a chunk back after the worker failed to simulate it.
+
+        Reports from a worker that no longer holds the lease (it expired and the chunk went to
+        another worker) are ignored, so they cannot cancel the new holder's lease, queue the chunk
+        twice or use up one of its attempts.
+        """
+        with self._lock:
+            lease = self._leases.get(task_id)
+            if lease is None or lease[0] != worker_id:
+                return
+            name, index = task_id
+            if not self._progress[name].done(index):
+                self._requeue(task_id, error)
+            self._report_queue()
+
+    def status(self):
+        """Counts of total, completed, leased and pending chunks, plus the abort reason if any."""
+        with self._lock:
+            return {'total': len(self._tasks), 'completed': self._completed(), 'leased': len(self._leases),
+                    'pending': len(self._pending), 'error': self._error}
+
+    def finished(self):
+        """True once every chunk has a result or the sweep was aborted."""
+        with self._lock:
+            return self._error is not None or self._completed() == len(self._tasks)
+
+    def merged_results(self):
+        """Per-job results merged in chunk order, matching parallel.run_parallel_simulations."""
+        with self._lock:
+            if self._error is not None:
+                raise RuntimeError(self._error)
+            return {name: progress.merged for name, progress in self._progress.items()}
+
+def resolve_authkey(authkey=None):
+    """The explicit authkey (str or bytes) as bytes, else the AUTHKEY_ENV variable's, else None."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV) or None
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey
+
+def is_loopback(host):
+    """True if host only accepts connections from this machine."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:  # A hostname; it may resolve to a public interface
+        return False
+
+class _BrokerClient(BaseManager):
+    """Worker-side manager giving access to the coordinator's WorkBroker."""
+
+_BrokerClient.register('broker')
+
+def serve_broker(broker, address, authkey):
+    """Start serving broker on a background thread and return the (host, port) it listens on."""
+    class _BrokerServer(BaseManager):
+        """Manager exposing this broker over TCP (one class per broker, so registries don't clash)."""
+
+    _BrokerServer.register('broker', callable=lambda: broker)
+    server = _BrokerServer(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.address
+
+def run_worker(address, authkey, worker_id=None, poll_interval=0.2, connect_timeout=30.0):
+    """Pull chunks from a coordinator until the sweep is done.
+
+    Args:
+        address (tuple): (host, port) of the coordinator.
+        authkey (bytes): Shared secret of the coordinator.
+        worker_id (str): Name used in leases; defaults to host:pid.
+        poll_interval (float): Seconds to wait when every remaining chunk is leased.
+        connect_timeout (float): Seconds to keep retrying while the coordinator is not up yet.
+
+    Returns:
+        int: Number of chunks this worker completed.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    manager = _BrokerClient(address=address, authkey=authkey)
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(poll_interval)
+    broker = manager.broker()
+    completed = 0
+    while True:
+        try:
+            task = broker.get_task(worker_id)
+        except (ConnectionError, EOFError):  # Coordinator finished and went away
+            return completed
+        if task['status'] == 'done':
+            return completed
+        if task['status'] == 'wait':
+            time.sleep(poll_interval)
+            continue
+        try:
+            result = simulate_chunk(*task['args'])
+        except Exception as exc:  # Report and keep serving; the coordinator decides whether to retry
+            broker.report_failure(task['task_id'], repr(exc), worker_id)
+            continue
+        broker.put_result(task['task_id'], result.to_dict())
+        completed += 1
+
+def run_distributed(jobs, address=('127.0.0.1', 0), authkey=None, local_workers=0,
+                    chunk_size=CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                    on_listening=None, poll_interval=0.5, checkpoint=None, telemetry=None):
+    """Coordinate a sweep: serve its chunks to workers and merge what they send back.
+
+    Results are identical to running each job with parallel.run_parallel_simulations using the
+    same seed and chunk size, however many workers join or fail.
+
+    Args:
+        jobs (list): Job tuples.
+        address (tuple): (host, port) to listen on; port 0 picks a free one.
+        authkey (bytes): Shared secret workers must present. Without one (argument or AUTHKEY_ENV) a
+            random key is generated, which only local workers know, and binding to anything but a
+            loopback address is refused.
+        local_workers (int): Worker processes to start on this machine.
+        chunk_size (int): Fights per chunk.
+        lease_timeout (float): Seconds before an unanswered chunk is retried.
+        max_attempts (int): Attempts per chunk before giving up.
+        on_listening (callable): Called with the bound (host, port), e.g. to print it for remote workers.
+        poll_interval (float): Seconds between completion checks.
+        checkpoint (str): Optional checkpoint file; a restarted coordinator resumes from it.
+        telemetry (Telemetry): Optional telemetry.Telemetry fed with progress, queue depth and worker activity.
+
+    Returns:
+        dict: Job name -> merged MetricAccumulator.
+
+    Raises:
+        ValueError: No authkey was given for a non-loopback address.
+    """
+    authkey = resolve_authkey(authkey)
+    if authkey is None:
+        if not is_loopback(address[0]):
+            raise ValueError(f"Refusing to listen on {address[0]} without an explicit authkey "
+                             f"(pass one or set {AUTHKEY_ENV})")
+        authkey = secrets.token_bytes(32)
+    broker = WorkBroker(jobs, chunk_size, lease_timeout, max_attempts, checkpoint, telemetry=telemetry)
+    bound = serve_broker(broker, address, authkey)
+    if on_listening is not None:
+        on_listening(bound)
+    workers = [Process(target=run_worker, args=(bound, authkey, f"local-{i}"), daemon=True)
+               for i in range(local_workers)]
+    for worker in workers:
+        worker.start()
+    while not broker.finished():
+        time.sleep(poll_interval)
+    for worker in workers:
+        worker.join(timeout=5)
+    return broker.merged_results()
@@ -0,0 +1,122 @@
+import random
+from collections import defaultdict
+from participant import UnitGroup
+from combat_jit import fight_metrics
+
+def group_participants(participants):
+    """Collapse identical participants into UnitGroups, keeping first-appearance order.
+
+    Args:
+        participants (list): Participant objects; identical stat blocks (name, hp, attack,
+            defense, speed) are merged into one group.
+
+    Returns:
+        list: UnitGroup objects.
+    """
+    counts = {}
+    for p in participants:
+        key = (p.name, p.max_hp, p.attack, p.defense, p.speed)
+        counts[key] = counts.get(key, 0) + 1
+    return [UnitGroup(*key, count) for key, count in counts.items()]
+
+def _pick_member(groups, rng):
+    """Pick a living member uniformly across groups; returns (group, index within the group)."""
+    total = sum(g.alive_count for g in groups)
+    if total == 0:
+        return None, None
+    # For single-member groups this is exactly random.choice over the living targets
+    pick = rng.randrange(total)
+    for g in groups:
+        if pick < g.alive_count:
+            return g, pick
+        pick -= g.alive_count
+
+def _acting_below(group, acted, ratio, rng):
+    """Tension count for a volley cut short after acted members, drawn without replacement."""
+    below = group.count_below(ratio)
+    remaining = group.alive_count
+    count = 0
+    for _ in range(acted):
+        if rng.randrange(remaining) < below:
+            below -= 1
+            count += 1
+        remaining -= 1
+    return count
+
+def simulate_group_combat(player_groups, enemy_groups, attack_multiplier=1.0, defense_multiplier=1.0, rng=random):
+    """Simulate a single combat encounter between groups of identical units.
+
+    Groups act in speed order and all living members of a group act back to back, each hitting
+    a uniformly random living opponent exactly as combat.simulate_combat does, so outcomes follow
+    the reference distribution. Members at the same HP are interchangeable, so a hit costs one
+    random draw plus a walk over the opposing groups' HP levels instead of rebuilding a target
+    list of every living unit. Identical units that the reference would interleave with another
+    group of the same speed act together here, which leaves the distribution unchanged. With
+    every group of size one this plays out exactly like combat.simulate_combat for the same seed.
+
+    Args:
+        player_groups (list): Player UnitGroup objects (modified in place).
+        enemy_groups (list): Enemy UnitGroup objects (modified in place).
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+        rng: Random source (the random module or a random.Random instance).
+
+    Returns:
+        tuple: Same metrics as combat.simulate_combat.
+    """
+    groups = player_groups + enemy_groups
+    is_player = {id(g): i < len(player_groups) for i, g in enumerate(groups)}
+    damage = {(id(a), id(t)): max(1, int(a.attack * attack_multiplier) - int(t.defense * defense_multiplier))
+              for a in groups for t in groups}
+    order = sorted(groups, key=lambda g: g.speed, reverse=True)
+
+    rounds = 0
+    damage_by_players = 0
+    damage_by_enemies = 0
+    tension_count = 0
+    total_turns = 0
+    damage_distribution = defaultdict(int)
+
+    while any(g.alive for g in player_groups) and any(g.alive for g in enemy_groups):
+        rounds += 1
+        for group in order:
+            if not group.alive:
+                continue
+            attacker_is_player = is_player[id(group)]
+            opponents = enemy_groups if attacker_is_player else player_groups
+            attackers = group.alive_count
+            made = 0
+            dealt = 0
+            for _ in range(attackers):
+                target, index = _pick_member(opponents, rng)
+                if target is None:
+                    break
+                blow = damage[(id(group), id(target))]
+                target.strike(index, blow)
+                made += 1
+                dealt += blow
+                damage_distribution[blow] += 1
+            total_turns += made
+            # The volley cannot hurt its own members, so their HP is the same for every attacker
+            if made == attackers:
+                tension_count += group.count_below(0.2)
+            elif made:
+                tension_count += _acting_below(group, made, 0.2, rng)
+            if attacker_is_player:
+                damage_by_players += dealt
+            else:
+                damage_by_enemies += dealt
+
+    players_alive = sum(g.alive_count for g in player_groups)
+    return fight_metrics(players_alive > 0, rounds, damage_by_players, damage_by_enemies, tension_count,
+                         total_turns, damage_distribution.values(), 0, players_alive)
+
+def run_multiple_group_simulations(player_groups, enemy_groups, attack_multiplier, defense_multiplier, num_runs=1000):
+    """Run multiple group combat simulations and compute average results, like combat.run_multiple_simulations."""
+    sums = [0] * 9
+    for _ in range(num_runs):
+        result = simulate_group_combat([g.copy() for g in player_groups], [g.copy() for g in enemy_groups],
+                                       attack_multiplier, defense_multiplier)
+        for m, value in enumerate(result):
+            sums[m] += value
+    return tuple(s / num_runs for s in sums)
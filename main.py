@@ -1,14 +1,19 @@
 import argparse
-import unittest
 import sys
-import colorama
-from colorama import Fore, Style
-from tests import TestCombatScenarios
 
-colorama.init()
+# Heavy dependencies (colorama, tabulate, numba, gradio, plotly) are imported inside the functions
+# that need them, so headless commands and worker processes start quickly
+
+def _init_colors():
+    """Import colorama and enable ANSI colors on Windows terminals."""
+    import colorama
+    colorama.init()
 
 def run_terminal_mode():
     """Run tests, generate report, and save to CSV in terminal mode."""
+    import unittest
+    from colorama import Fore, Style
+    from tests import TestCombatScenarios
     # Load and run tests using the unittest framework
     suite = unittest.TestLoader().loadTestsFromTestCase(TestCombatScenarios)
     runner = unittest.TextTestRunner(verbosity=2)
@@ -26,20 +31,336 @@ def run_terminal_mode():
         print(f"\n{Fore.RED}Some tests failed. Check the output for details.{Style.RESET_ALL}")
         sys.exit(1)
 
-def run_gradio_mode():
-    """Launch only the Gradio UI in interactive mode."""
-    from ui import demo
-    demo.launch(server_name="0.0.0.0", server_port=7860, share=False)
+def _parse_band(text):
+    """Parse a 'low,high' command-line band into a tuple of floats."""
+    low, high = (float(v) for v in text.split(','))
+    return low, high
+
+def run_tune_mode(args):
+    """Search a multiplier or stat for a registered scenario until it hits the target bands."""
+    from colorama import Fore, Style
+    from scenarios import SCENARIOS, build_participants
+    from tuner import tune
+    scenario = SCENARIOS[args.scenario]
+    players, enemies = build_participants(scenario)
+    result = tune(players, enemies, args.parameter, _parse_band(args.bounds), _parse_band(args.target),
+                  attack_multiplier=scenario.attack_multiplier, defense_multiplier=scenario.defense_multiplier,
+                  flow_band=_parse_band(args.flow_band) if args.flow_band else None,
+                  ntr_band=_parse_band(args.ntr_band) if args.ntr_band else None,
+                  num_runs=args.runs, seed=args.seed, workers=args.workers)
+    color = Fore.GREEN if all(result.in_band.values()) else Fore.YELLOW
+    print(f"{color}{args.scenario}: {result.parameter} = {result.value} "
+          f"after {len(result.evaluations)} evaluations{Style.RESET_ALL}")
+    for name, value in result.metrics.items():
+        print(f"  {name}: {value:.4f}")
+    for name, ok in result.in_band.items():
+        print(f"  {name} in band: {'yes' if ok else 'no'}")
+
+def run_sensitivity_mode(args):
+    """Rank which participant stats drive the chosen metrics in a registered scenario (Sobol indices)."""
+    from colorama import Fore, Style
+    from scenarios import SCENARIOS, build_participants
+    from sensitivity import sobol_indices
+    scenario = SCENARIOS[args.scenario]
+    players, enemies = build_participants(scenario)
+    report = sobol_indices(players, enemies, scenario.attack_multiplier, scenario.defense_multiplier,
+                           metrics=tuple(args.metrics.split(',')), samples=args.samples, runs=args.sample_runs,
+                           spread=args.spread, seed=args.seed, engine=args.engine, workers=args.workers)
+    for metric, indices in report.items():
+        print(f"{Fore.CYAN}{args.scenario}: sensitivity of {metric} (stats +-{args.spread:.0%}){Style.RESET_ALL}")
+        print(f"  {'parameter':<20} {'first order':>24} {'total':>24}")
+        for index in indices:
+            print(f"  {index.parameter:<20} {index.first_order:7.3f} [{index.first_order_ci[0]:6.3f}, "
+                  f"{index.first_order_ci[1]:6.3f}] {index.total:7.3f} [{index.total_ci[0]:6.3f}, {index.total_ci[1]:6.3f}]")
+
+def start_telemetry(args):
+    """Start the live terminal view (--live) and Prometheus endpoint (--metrics-port) if requested.
+
+    Returns:
+        tuple: (Telemetry or None, function that stops the view and the endpoint).
+    """
+    if not args.live and args.metrics_port is None:
+        return None, lambda: None
+    from telemetry import LiveView, Telemetry, serve_metrics
+    telemetry = Telemetry()
+    view = LiveView(telemetry).start() if args.live else None
+    server = None
+    if args.metrics_port is not None:
+        server = serve_metrics(telemetry, ('127.0.0.1', args.metrics_port))
+        host, port = server.server_address[:2]
+        print(f"Prometheus metrics at http://{host}:{port}/metrics", file=sys.stderr)
+
+    def stop():
+        if view is not None:
+            view.stop()
+        if server is not None:
+            server.shutdown()
+    return telemetry, stop
+
+def add_telemetry_arguments(group, default=None):
+    """Add --live and --metrics-port to a parser or argument group.
+
+    Subcommands pass default=argparse.SUPPRESS so that, when a flag is not repeated after the
+    subcommand, their defaults don't overwrite the value given before it.
+    """
+    group.add_argument('--live', action='store_true', default=False if default is None else default,
+                       help="Show live throughput, queue depth, ETA and workers on stderr while running.")
+    group.add_argument('--metrics-port', type=int, default=default,
+                       help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics while running.")
+
+def _parse_address(text):
+    """Parse 'host:port' into a (host, port) tuple."""
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+def run_coordinator_mode(args):
+    """Serve a sweep of every registered scenario over a multiplier grid to distributed workers."""
+    import json
+    from colorama import Fore, Style
+    from accumulators import METRIC_NAMES
+    import secrets
+    from distributed import AUTHKEY_ENV, Job, is_loopback, resolve_authkey, run_distributed
+    from scenarios import SCENARIOS, build_participants
+    start, stop, step = (float(v) for v in args.grid.split(':'))
+    grid = [round(start + i * step, 6) for i in range(int(round((stop - start) / step)) + 1)]
+    jobs = []
+    for name in SCENARIOS:
+        players, enemies = build_participants(name)
+        for attack_multiplier in grid:
+            for defense_multiplier in grid:
+                jobs.append(Job(f"{name} | atk {attack_multiplier} | def {defense_multiplier}", players, enemies,
+                                attack_multiplier, defense_multiplier, args.runs, args.seed, args.engine))
+    address = _parse_address(args.address)
+    authkey = resolve_authkey(args.authkey)
+    if authkey is None:
+        if not is_loopback(address[0]):
+            print(f"error: listening on {address[0]} needs --authkey or {AUTHKEY_ENV}; the broker accepts "
+                  f"pickled calls from anyone who knows the key", file=sys.stderr)
+            sys.exit(2)
+        authkey = secrets.token_hex(16).encode()
+        print(f"Generated authkey {authkey.decode()}; pass it to workers with --authkey or {AUTHKEY_ENV}")
+    print(f"{Fore.CYAN}Sweeping {len(jobs)} configurations x {args.runs} runs{Style.RESET_ALL}")
+    telemetry, stop_telemetry = start_telemetry(args)
+    try:
+        results = run_distributed(
+            jobs, address=address, authkey=authkey,
+            local_workers=args.local_workers, checkpoint=args.checkpoint, telemetry=telemetry,
+            on_listening=lambda bound: print(f"Coordinator listening on {bound[0]}:{bound[1]}; start workers with "
+                                             f"'python main.py --mode worker --address {bound[0]}:{bound[1]}'"))
+    finally:
+        stop_telemetry()
+    if args.output.endswith(('.csv', '.parquet')):
+        from report import SWEEP_COLUMNS, write_report
+        rows = ({'configuration': job.name, 'attack_multiplier': job.attack_multiplier,
+                 'defense_multiplier': job.defense_multiplier, **dict(zip(METRIC_NAMES, results[job.name].means()))}
+                for job in jobs)
+        target = 'csv_path' if args.output.endswith('.csv') else 'parquet_path'
+        writer = write_report(rows, columns=SWEEP_COLUMNS, top_n=args.top, rank_by=lambda row: row['victory'],
+                              **{target: args.output})
+        print(writer.table())
+        print(writer.summary_table())
+    else:
+        with open(args.output, 'w') as f:
+            json.dump({name: dict(zip(METRIC_NAMES, acc.means())) for name, acc in results.items()}, f, indent=2)
+    print(f"\n{Fore.GREEN}Sweep complete. Results saved to '{args.output}'.{Style.RESET_ALL}")
+
+def run_worker_mode(args):
+    """Pull simulation chunks from a coordinator until its sweep is finished."""
+    from distributed import AUTHKEY_ENV, resolve_authkey, run_worker
+    authkey = resolve_authkey(args.authkey)
+    if authkey is None:
+        print(f"error: workers need the coordinator's --authkey (or {AUTHKEY_ENV})", file=sys.stderr)
+        sys.exit(2)
+    completed = run_worker(_parse_address(args.address), authkey=authkey)
+    print(f"Worker finished after {completed} chunks.")
+
+def run_simulate_command(args):
+    """Run scenarios headlessly and stream one JSON result per scenario to stdout as it completes."""
+    import json
+    import time
+    from accumulators import METRIC_NAMES
+    from parallel import Job, iter_parallel_jobs
+    from scenarios import build_participants, resolve_scenarios
+    try:
+        scenarios = resolve_scenarios(args.scenarios)
+    except (ValueError, OSError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        sys.exit(2)
+    jobs = []
+    for index, scenario in enumerate(scenarios):
+        players, enemies = build_participants(scenario)
+        attack_multiplier = scenario.attack_multiplier if args.attack_multiplier is None else args.attack_multiplier
+        defense_multiplier = scenario.defense_multiplier if args.defense_multiplier is None else args.defense_multiplier
+        jobs.append(Job(index, players, enemies, attack_multiplier, defense_multiplier, args.simulate_runs,
+                        args.simulate_seed, args.simulate_engine))
+    start = time.perf_counter()
+    records = []
+    telemetry, stop_telemetry = start_telemetry(args)
+    try:
+        for job, acc in iter_parallel_jobs(jobs, workers=args.simulate_workers, chunk_size=args.chunk_size,
+                                           telemetry=telemetry):
+            record = {
+                'scenario': scenarios[job.name].name,
+                'attack_multiplier': job.attack_multiplier,
+                'defense_multiplier': job.defense_multiplier,
+                'engine': job.engine,
+                'runs': acc.count,
+                'seed': job.seed,
+                'elapsed_s': round(time.perf_counter() - start, 6),
+                'metrics': dict(zip(METRIC_NAMES, acc.means())),
+                'distribution': acc.distribution(),
+            }
+            if args.format == 'ndjson':
+                print(json.dumps(record), flush=True)
+            else:
+                records.append(record)
+    finally:
+        stop_telemetry()
+    if args.format == 'json':
+        print(json.dumps(records, indent=2))
+
+def build_simulate_parser(subparsers):
+    """Add the headless 'simulate' subcommand."""
+    from parallel import CHUNK_SIZE, ENGINES
+    simulate = subparsers.add_parser(
+        'simulate', help="Run scenarios headlessly and stream results as NDJSON.",
+        description="Run scenario files or registered scenarios and print one JSON object per scenario "
+                    "to stdout as soon as it completes.")
+    simulate.add_argument('scenarios', nargs='+', help="Scenario JSON files or registered scenario names.")
+    # Own dests, so these defaults never overwrite the top-level --runs/--seed/--workers/--engine and vice versa
+    simulate.add_argument('--runs', dest='simulate_runs', type=int, default=1000, help="Fights per scenario.")
+    simulate.add_argument('--seed', dest='simulate_seed', type=int, default=0,
+                          help="Master seed; run i uses a seed derived from (seed, i).")
+    simulate.add_argument('--workers', dest='simulate_workers', type=int, default=1, help="Worker processes.")
+    simulate.add_argument('--engine', dest='simulate_engine', choices=list(ENGINES), default='reference',
+                          help="Simulation engine.")
+    simulate.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Fights per work unit.")
+    simulate.add_argument('--attack-multiplier', type=float, help="Override every scenario's attack multiplier.")
+    simulate.add_argument('--defense-multiplier', type=float, help="Override every scenario's defense multiplier.")
+    simulate.add_argument('--format', choices=['ndjson', 'json'], default='ndjson',
+                          help="'ndjson' streams a line per scenario; 'json' prints one array at the end.")
+    add_telemetry_arguments(simulate, default=argparse.SUPPRESS)
+
+def run_replay_command(args):
+    """Replay one run of a seeded batch turn by turn, without simulating the runs before it."""
+    from accumulators import METRIC_NAMES
+    from combat import replay_fight
+    from scenarios import build_participants, resolve_scenarios
+    try:
+        scenario = resolve_scenarios([args.scenario])[0]
+    except (ValueError, OSError, IndexError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        sys.exit(2)
+    players, enemies = build_participants(scenario)
+    attack_multiplier = scenario.attack_multiplier if args.attack_multiplier is None else args.attack_multiplier
+    defense_multiplier = scenario.defense_multiplier if args.defense_multiplier is None else args.defense_multiplier
+
+    def show(event):
+        line = (f"Round {event.round:3d}: {event.attacker.name} hits {event.target.name} for {event.damage} "
+                f"({event.target_hp}/{event.target.max_hp} HP)")
+        print(line + (" - defeated!" if event.target_hp == 0 else ""))
+
+    print(f"{scenario.name}, seed {args.replay_seed}, run {args.run} "
+          f"(attack x{attack_multiplier}, defense x{defense_multiplier})")
+    result = replay_fight(players, enemies, attack_multiplier, defense_multiplier, args.replay_seed, args.run, show)
+    print("Victory!" if result[0] else "Defeat.")
+    for name, value in zip(METRIC_NAMES, result):
+        print(f"  {name}: {value}")
+
+def build_replay_parser(subparsers):
+    """Add the 'replay' subcommand."""
+    replay = subparsers.add_parser(
+        'replay', help="Replay one fight of a seeded batch turn by turn.",
+        description="Reproduce run RUN of a 'simulate' batch (reference engine) from its master seed and run "
+                    "index alone and print every blow.")
+    replay.add_argument('scenario', help="Scenario JSON file or registered scenario name.")
+    replay.add_argument('--seed', dest='replay_seed', type=int, default=0, help="Master seed of the batch.")
+    replay.add_argument('--run', type=int, required=True, help="Index of the run within the batch.")
+    replay.add_argument('--attack-multiplier', type=float, help="Override the scenario's attack multiplier.")
+    replay.add_argument('--defense-multiplier', type=float, help="Override the scenario's defense multiplier.")
+
+def run_gradio_mode(metrics_port=None):
+    """Launch only the Gradio UI in interactive mode, optionally serving its telemetry to Prometheus."""
+    from ui import TELEMETRY, build_demo
+    if metrics_port is not None:
+        from telemetry import serve_metrics
+        serve_metrics(TELEMETRY, ('127.0.0.1', metrics_port))
+    build_demo().launch(server_name="0.0.0.0", server_port=7860, share=False)
 
 if __name__ == "__main__":
+    from parallel import ENGINES
     parser = argparse.ArgumentParser(description="RPG Combat Simulator - Choose operating mode.")
-    parser.add_argument('--mode', choices=['terminal', 'gradio'], default='both',
-                        help="Operating mode: 'terminal' for tests and report, 'gradio' for UI, or 'both' (default) for both.")
+    subparsers = parser.add_subparsers(dest='command', metavar='{simulate,replay}',
+                                       help="Headless subcommand; omit to use --mode.")
+    build_simulate_parser(subparsers)
+    build_replay_parser(subparsers)
+    parser.add_argument('--mode', choices=['terminal', 'gradio', 'both', 'tune', 'sensitivity', 'coordinator', 'worker'],
+                        default='both',
+                        help="Operating mode: 'terminal' for tests and report, 'gradio' for UI, 'tune' to search "
+                             "for balanced multipliers/stats, 'sensitivity' to rank which stats drive the metrics, "
+                             "'coordinator'/'worker' for distributed sweeps, "
+                             "or 'both' (default) for terminal and UI.")
+    sim_group = parser.add_argument_group("simulation options (tune, sensitivity, coordinator)")
+    sim_group.add_argument('--runs', type=int, default=2000, help="Fights per configuration.")
+    sim_group.add_argument('--seed', type=int, default=0, help="Master seed.")
+    sim_group.add_argument('--workers', type=int, default=1, help="Worker processes (tune and sensitivity modes).")
+    tune_group = parser.add_argument_group("tune mode")
+    tune_group.add_argument('--scenario', default="Boss Fight", help="Registered scenario name (see scenarios.py).")
+    tune_group.add_argument('--parameter', default='attack_multiplier',
+                            help="'attack_multiplier', 'defense_multiplier' or '<Name>.<stat>', e.g. 'Dragon.attack'.")
+    tune_group.add_argument('--bounds', default='0.5,2.0', help="Search range as 'low,high'.")
+    tune_group.add_argument('--target', default='0.2,0.3', help="Target victory rate band as 'low,high'.")
+    tune_group.add_argument('--flow-band', help="Optional Flow State band as 'low,high'.")
+    tune_group.add_argument('--ntr-band', help="Optional NTR band as 'low,high'.")
+    sens_group = parser.add_argument_group("sensitivity mode (also uses --scenario, --seed, --workers, --engine)")
+    sens_group.add_argument('--metrics', default='victory,ntr', help="Comma-separated metrics to analyse.")
+    sens_group.add_argument('--samples', type=int, default=256, help="Rows of each quasi-random design matrix.")
+    sens_group.add_argument('--sample-runs', type=int, default=200, help="Fights per sampled stat combination.")
+    sens_group.add_argument('--spread', type=float, default=0.25, help="Vary each stat by +-this fraction.")
+    dist_group = parser.add_argument_group("distributed sweeps (coordinator, worker)")
+    dist_group.add_argument('--grid', default='0.5:2.0:0.25',
+                            help="Attack and defense multiplier grid as 'start:stop:step'.")
+    dist_group.add_argument('--engine', choices=list(ENGINES), default='compiled', help="Simulation engine.")
+    dist_group.add_argument('--address', default='127.0.0.1:50000', help="Coordinator 'host:port'.")
+    dist_group.add_argument('--authkey',
+                            help="Shared secret between coordinator and workers (default: $RPG_COMBAT_AUTHKEY). "
+                                 "Required for workers and for coordinators listening beyond loopback.")
+    dist_group.add_argument('--local-workers', type=int, default=0,
+                            help="Worker processes the coordinator starts on this machine.")
+    dist_group.add_argument('--output', default='sweep_results.json',
+                            help="Where the coordinator saves results: JSON, or streamed rows if it ends in "
+                                 ".csv or .parquet.")
+    dist_group.add_argument('--top', type=int, default=20,
+                            help="Configurations with the highest victory rate shown after a CSV/Parquet sweep.")
+    dist_group.add_argument('--checkpoint', help="Checkpoint file; a restarted coordinator resumes the sweep from it.")
+    telemetry_group = parser.add_argument_group("telemetry (coordinator; --metrics-port also gradio)")
+    add_telemetry_arguments(telemetry_group)
     
     args = parser.parse_args()
     
+    if args.command == 'simulate':
+        run_simulate_command(args)
+        sys.exit(0)
+    if args.command == 'replay':
+        run_replay_command(args)
+        sys.exit(0)
+    
+    _init_colors()
+    
+    if args.mode == 'tune':
+        run_tune_mode(args)
+    
+    if args.mode == 'sensitivity':
+        run_sensitivity_mode(args)
+    
+    if args.mode == 'coordinator':
+        run_coordinator_mode(args)
+    
+    if args.mode == 'worker':
+        run_worker_mode(args)
+    
     if args.mode in ['terminal', 'both']:
         run_terminal_mode()
     
     if args.mode in ['gradio', 'both']:
-        run_gradio_mode()
\ No newline at end of file
+        run_gradio_mode(args.metrics_port)
\ No newline at end of file
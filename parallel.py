@@ -0,0 +1,249 @@
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import abilities
+import combat
+import combat_jit
+import horde
+import scheduler
+import targeting
+from accumulators import MetricAccumulator, SlotStats
+from checkpoint import Checkpoint, batch_fingerprint
+from participant import Participant
+from seeding import run_seed
+from telemetry import describe_batch
+
+# Fights per work unit. Chunks are always merged in index order, so results for a given seed are
+# identical regardless of worker count; changing this changes float rounding in the sums.
+CHUNK_SIZE = 1000
+
+# One named simulation batch (a scenario at given multipliers), as used by sweeps and the CLI
+Job = namedtuple('Job', ['name', 'players', 'enemies', 'attack_multiplier', 'defense_multiplier',
+                         'num_runs', 'seed', 'engine'])
+
+def _copy(participants):
+    """Fresh, fully healed copies of participants."""
+    return [Participant(p.name, p.max_hp, p.attack, p.defense, p.speed, p.behavior, p.targeting) for p in participants]
+
+def _reference_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None, slots=None):
+    """Results of combat.simulate_combat, one fight per seed."""
+    if slots is not None:
+        raise ValueError("Per-participant statistics need the 'compiled' engine")
+    rng = random.Random()
+    results = []
+    for seed in seeds:
+        rng.seed(seed)
+        fighters = _copy(players)
+        results.append(combat.simulate_combat(fighters, _copy(enemies), attack_multiplier,
+                                              defense_multiplier, rng))
+        if party_hp is not None:
+            party_hp.append(sum(p.hp for p in fighters))
+    return results
+
+def _compiled_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None, slots=None):
+    """Results of the compiled engine (Numba when installed), one fight per seed."""
+    encounter = combat_jit.compile_encounter(players, enemies, attack_multiplier, defense_multiplier)
+    return combat_jit.simulate_runs(encounter, seeds, party_hp=party_hp, slots=slots)
+
+def _group_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None, slots=None):
+    """Results of the unit-group engine, one fight per seed."""
+    if slots is not None:
+        raise ValueError("Per-participant statistics need the 'compiled' engine")
+    player_groups = horde.group_participants(players)
+    enemy_groups = horde.group_participants(enemies)
+    rng = random.Random()
+    results = []
+    for seed in seeds:
+        rng.seed(seed)
+        fighters = [g.copy() for g in player_groups]
+        results.append(horde.simulate_group_combat(fighters, [g.copy() for g in enemy_groups],
+                                                   attack_multiplier, defense_multiplier, rng))
+        if party_hp is not None:
+            party_hp.append(sum(g.total_hp for g in fighters))
+    return results
+
+def _ability_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None, slots=None):
+    """Results of the ability engine (each participant's behavior; Numba when installed), one fight per seed."""
+    if slots is not None:
+        raise ValueError("Per-participant statistics need the 'compiled' engine")
+    encounter = abilities.compile_abilities(players, enemies, attack_multiplier, defense_multiplier)
+    return abilities.simulate_runs(encounter, seeds, party_hp=party_hp)
+
+def _targeted_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None, slots=None):
+    """Results of the targeting-policy engine (each participant's targeting), one fight per seed."""
+    if slots is not None:
+        raise ValueError("Per-participant statistics need the 'compiled' engine")
+    return targeting.simulate_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=party_hp)
+
+def _event_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None, slots=None):
+    """Results of the event-driven (ATB) scheduler, one fight per seed."""
+    if slots is not None:
+        raise ValueError("Per-participant statistics need the 'compiled' engine")
+    return scheduler.simulate_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=party_hp)
+
+# Engine name -> function(players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp=None,
+# slots=None) -> list of metric tuples; if party_hp is a list, each fight's remaining player HP is
+# appended to it, and if slots is an accumulators.SlotStats, per-participant totals are added to it
+ENGINES = {
+    'reference': _reference_runs,
+    'compiled': _compiled_runs,
+    'group': _group_runs,
+    'abilities': _ability_runs,
+    'targeted': _targeted_runs,
+    'event': _event_runs,
+}
+
+def simulate_chunk(engine, players, enemies, attack_multiplier, defense_multiplier, master_seed, start, stop,
+                   histograms=None, slot_stats=False):
+    """Simulate runs start..stop-1 of a batch and return their MetricAccumulator.
+
+    Top-level so it can be sent to worker processes. histograms is an optional empty
+    OutcomeHistograms; a copy with the same bins is filled for this chunk. slot_stats=True also
+    collects per-participant SlotStats (compiled engine only).
+    """
+    seeds = [run_seed(master_seed, i) for i in range(start, stop)]
+    acc = MetricAccumulator(None if histograms is None else histograms.empty(),
+                            SlotStats.for_participants(players, enemies) if slot_stats else None)
+    party_hp = None if histograms is None else []
+    results = ENGINES[engine](players, enemies, attack_multiplier, defense_multiplier, seeds, party_hp, acc.slots)
+    if party_hp is None:
+        for result in results:
+            acc.add(result)
+    else:
+        for result, hp in zip(results, party_hp):
+            acc.add(result, hp)
+    return acc
+
+def chunk_bounds(num_runs, chunk_size=CHUNK_SIZE):
+    """Split range(num_runs) into (start, stop) work units."""
+    return [(start, min(start + chunk_size, num_runs)) for start in range(0, num_runs, chunk_size)]
+
+def run_parallel_simulations(players, enemies, attack_multiplier, defense_multiplier, num_runs=1000, seed=0,
+                             workers=1, engine='reference', executor=None, chunk_size=CHUNK_SIZE,
+                             histograms=None, slot_stats=False, checkpoint=None, telemetry=None, label=None):
+    """Run a batch of fights split into chunks, optionally across worker processes.
+
+    Args:
+        players (list): Player Participant objects (not modified).
+        enemies (list): Enemy Participant objects (not modified).
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+        num_runs (int): Number of fights.
+        seed (int): Master seed; run i uses run_seed(seed, i).
+        workers (int): Worker processes to use when no executor is given (1 runs in-process).
+        engine (str): Key of ENGINES.
+        executor (Executor): Optional pool to reuse across calls, e.g. during a parameter search.
+        chunk_size (int): Fights per work unit.
+        histograms (OutcomeHistograms): Optional empty histograms (see OutcomeHistograms.for_encounter)
+            to fill alongside the sums; they end up on the result's .histograms.
+        slot_stats (bool): Also collect per-participant SlotStats on the result's .slots
+            (compiled engine only).
+        checkpoint (str): Optional checkpoint file. Completed chunks are saved to it periodically
+            and skipped when the same batch is started again, with identical final results; the
+            file is deleted once the batch completes.
+        telemetry (Telemetry): Optional telemetry.Telemetry to report progress, throughput and
+            running means to as chunks complete.
+        label (str): Job name for telemetry; defaults to telemetry.describe_batch() of the batch.
+
+    Returns:
+        MetricAccumulator: Merged metrics; call .means() for run_multiple_simulations-style averages.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Choose from: {', '.join(ENGINES)}")
+    bounds = chunk_bounds(num_runs, chunk_size)
+    args = [(engine, players, enemies, attack_multiplier, defense_multiplier, seed, start, stop, histograms,
+             slot_stats) for start, stop in bounds]
+    fingerprint = {} if checkpoint is None else batch_fingerprint(
+        players, enemies, attack_multiplier, defense_multiplier, num_runs, seed, engine, chunk_size,
+        histograms=None if histograms is None else histograms.to_dict(), slot_stats=slot_stats)
+    store = Checkpoint(checkpoint, fingerprint)
+    progress = store.job('batch', MetricAccumulator(None if histograms is None else histograms.empty(),
+                                                    SlotStats.for_participants(players, enemies) if slot_stats else None))
+    remaining = [c for c in range(len(args)) if not progress.done(c)]
+    if telemetry is not None:
+        label = label or describe_batch(players, enemies, attack_multiplier, defense_multiplier, seed)
+        telemetry.start_job(label, num_runs, sum(stop - start for c, (start, stop) in enumerate(bounds)
+                                                 if progress.done(c)))
+        telemetry.set_queue(max(0, len(remaining) - max(workers, 1)), min(len(remaining), max(workers, 1)))
+
+    def record(c, acc):
+        store.record('batch', c, acc)
+        if telemetry is not None:
+            telemetry.record(label, acc.count, acc.sums[1], progress.merged.means())
+            left = len(bounds) - progress.completed
+            telemetry.set_queue(max(0, left - max(workers, 1)), min(left, max(workers, 1)))
+
+    if executor is None and workers <= 1:
+        for c in remaining:
+            record(c, simulate_chunk(*args[c]))
+    elif remaining:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            # map() yields in submission order, so chunks always merge in the same order
+            for c, acc in zip(remaining, executor.map(simulate_chunk, *zip(*[args[c] for c in remaining]))):
+                record(c, acc)
+        finally:
+            if own_executor:
+                executor.shutdown()
+    store.remove()
+    if telemetry is not None:
+        telemetry.finish_job(label)
+    return progress.merged
+
+def iter_parallel_jobs(jobs, workers=1, chunk_size=CHUNK_SIZE, telemetry=None):
+    """Run several jobs on one pool and yield (job, MetricAccumulator) as each job completes.
+
+    Chunks of all jobs share the pool, so short jobs are reported while long ones are still
+    running. Each job's chunks are merged in chunk order, so its result equals
+    run_parallel_simulations with the same seed and chunk size. Progress goes to telemetry
+    (a telemetry.Telemetry) if given.
+    """
+    def describe(job):
+        return describe_batch(job.players, job.enemies, job.attack_multiplier, job.defense_multiplier,
+                              job.seed, job.name)
+
+    if workers <= 1:
+        for job in jobs:
+            yield job, run_parallel_simulations(job.players, job.enemies, job.attack_multiplier,
+                                                job.defense_multiplier, job.num_runs, job.seed,
+                                                engine=job.engine, chunk_size=chunk_size, telemetry=telemetry,
+                                                label=describe(job))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        chunks = {}
+        labels = {}
+        for j, job in enumerate(jobs):
+            bounds = chunk_bounds(job.num_runs, chunk_size)
+            if not bounds:
+                yield job, MetricAccumulator()
+                continue
+            chunks[j] = [None] * len(bounds)
+            if telemetry is not None:
+                labels[j] = describe(job)
+                telemetry.start_job(labels[j], job.num_runs)
+            for c, (start, stop) in enumerate(bounds):
+                future = executor.submit(simulate_chunk, job.engine, job.players, job.enemies, job.attack_multiplier,
+                                         job.defense_multiplier, job.seed, start, stop)
+                futures[future] = (j, c)
+        running = {j: MetricAccumulator() for j in chunks}  # Merged in completion order, for display only
+        if telemetry is not None:
+            telemetry.set_queue(max(0, len(futures) - workers), min(len(futures), workers))
+        for done, future in enumerate(as_completed(futures), 1):
+            j, c = futures[future]
+            chunks[j][c] = future.result()
+            if telemetry is not None:
+                running[j].merge(chunks[j][c])
+                telemetry.record(labels[j], chunks[j][c].count, chunks[j][c].sums[1], running[j].means())
+                left = len(futures) - done
+                telemetry.set_queue(max(0, left - workers), min(left, workers))
+            if all(acc is not None for acc in chunks[j]):
+                total = MetricAccumulator()
+                for acc in chunks.pop(j):
+                    total.merge(acc)
+                running.pop(j)
+                if telemetry is not None:
+                    telemetry.finish_job(labels[j])
+                yield jobs[j], total
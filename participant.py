@@ -3,7 +3,7 @@ import random
 class Participant:
     """Represents a combat participant with stats and actions."""
     
-    def __init__(self, name, hp, attack, defense, speed):
+    def __init__(self, name, hp, attack, defense, speed, behavior=None, targeting=None):
         """Initialize a participant with combat stats.
         
         Args:
@@ -12,6 +12,10 @@ class Participant:
             attack (int): Attack stat for damage dealing.
             defense (int): Defense stat for damage mitigation.
             speed (int): Speed stat for turn order.
+            behavior: Abilities used by the 'abilities' engine: a tuple of abilities.Rule, a name from
+                abilities.BEHAVIORS, or None to always attack.
+            targeting (str): Target selection policy for the 'targeted' engine, one of
+                targeting.POLICIES (None means 'random').
         """
         self.name = name
         self.hp = hp
@@ -19,26 +23,108 @@ class Participant:
         self.attack = attack
         self.defense = defense
         self.speed = speed
+        self.behavior = behavior
+        self.targeting = targeting
         self.alive = True
 
-    def take_turn(self, targets, attack_multiplier, defense_multiplier):
+    def take_turn(self, targets, attack_multiplier, defense_multiplier, rng=random, trace=None):
         """Perform a turn, dealing damage to a random target with multipliers.
         
         Args:
             targets (list): List of potential targets.
             attack_multiplier (float): Multiplier for attack stat.
             defense_multiplier (float): Multiplier for defense stat.
+            rng: Random source for target selection (the random module or a random.Random).
+            trace: Optional callable(attacker, target, damage), called after the blow lands.
         
         Returns:
             int: Damage dealt (0 if no valid targets or not alive).
         """
         if not self.alive or not targets:
             return 0
-        target = random.choice(targets)
+        target = rng.choice(targets)
         attack_value = int(self.attack * attack_multiplier)
         defense_value = int(target.defense * defense_multiplier)
         damage = max(1, attack_value - defense_value)
         target.hp = max(0, target.hp - damage)
         if target.hp == 0:
             target.alive = False
-        return damage
\ No newline at end of file
+        if trace is not None:
+            trace(self, target, damage)
+        return damage
+
+class UnitGroup:
+    """A group of identical combat participants sharing one stat block.
+
+    Living members are tracked as a histogram of HP levels rather than one entry per member.
+    Members at the same HP are interchangeable, so a blow aimed at a random living member only
+    has to find its HP level, and the group's size never shows up in the cost of a hit.
+    """
+
+    def __init__(self, name, hp, attack, defense, speed, count):
+        """Initialize a group of count identical members.
+
+        Args:
+            name (str): Name shared by every member.
+            hp (int): Hit points of each member.
+            attack (int): Attack stat of each member.
+            defense (int): Defense stat of each member.
+            speed (int): Speed stat of the group for turn order.
+            count (int): Number of members.
+        """
+        self.name = name
+        self.max_hp = hp
+        self.attack = attack
+        self.defense = defense
+        self.speed = speed
+        self.count = count
+        self.levels = {hp: count} if count else {}  # HP -> number of living members at that HP
+        self.alive_count = count
+
+    @classmethod
+    def from_participant(cls, participant, count=1):
+        """Create a group of count copies of a participant's stat block."""
+        return cls(participant.name, participant.max_hp, participant.attack,
+                   participant.defense, participant.speed, count)
+
+    @property
+    def alive(self):
+        """True while at least one member is alive."""
+        return self.alive_count > 0
+
+    @property
+    def total_hp(self):
+        """Combined HP of the living members."""
+        return sum(hp * n for hp, n in self.levels.items())
+
+    def copy(self):
+        """Return a fresh, fully healed copy of the group."""
+        return UnitGroup(self.name, self.max_hp, self.attack, self.defense, self.speed, self.count)
+
+    def count_below(self, ratio):
+        """Number of living members whose HP is below ratio of their maximum."""
+        return sum(n for hp, n in self.levels.items() if hp / self.max_hp < ratio)
+
+    def strike(self, index, damage):
+        """Deal one blow to the index-th living member.
+
+        Args:
+            index (int): Living member to hit, 0 <= index < alive_count.
+            damage (int): Damage of the blow.
+
+        Returns:
+            bool: True if the blow killed the member.
+        """
+        for hp, n in self.levels.items():
+            if index < n:
+                break
+            index -= n
+        if n == 1:
+            del self.levels[hp]
+        else:
+            self.levels[hp] = n - 1
+        if hp > damage:
+            self.levels[hp - damage] = self.levels.get(hp - damage, 0) + 1
+            return False
+        self.alive_count -= 1
+        return True
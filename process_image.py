@@ -4,32 +4,50 @@
 # Comprehensive post-processing ensures variety, even with a small set of cellphone images, and detailed comments make it reusable.
 
 # Import necessary libraries
+import hashlib
+import json
+import math
 import os
 import random
+import re
+import time
 import numpy as np
-from PIL import Image, ImageEnhance, ImageOps, ImageFilter
+from PIL import Image, ImageEnhance, ImageFilter
 
 # Define the input and output directories
 INPUT_DIR = 'original_dice_images/'  # Directory containing original dice images (e.g., from your cellphone)
 OUTPUT_DIR = 'augmented_dice_dataset/'  # Directory to save augmented images
 TARGET_SIZE = (224, 224)  # Standard size for model input (common for deep learning models like CNNs)
 
-# Ensure output directory exists
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-
 # Define the number of augmented images to generate per original image
 AUGMENTATIONS_PER_IMAGE = 50  # Adjust this to control dataset size
 
+# Master seed for augmentation; each source image derives its own seed from this and its content hash
+SEED = 42
+
+# Bump whenever augment_image or output naming changes so previously generated outputs are rebuilt
+PIPELINE_VERSION = 4
+
+# Sources are decoded once into a working copy this many times the target size; every
+# augmentation of that source resamples from the working copy instead of the full-resolution photo
+WORKING_SCALE = 2
+
+# Manifest recording which outputs were generated from which source (enables incremental regeneration)
+MANIFEST_FILENAME = 'manifest.json'
+
 # List of dice types (assumes images are named with dice type prefix, e.g., 'd6_1.jpg')
 DICE_TYPES = ['d4', 'd6', 'd8', 'd10', 'd12', 'd20']  # Common polyhedral dice types
 
 # Function to load images from the input directory
-def load_images(input_dir):
+def load_images(input_dir, validated_manifest=None):
     """
     Loads dice images from the input directory and organizes them by dice type.
     Assumes filenames start with dice type (e.g., 'd6_1.jpg').
+    If validated_manifest is the path of a cleaned manifest written by validate_images.py, only
+    the sources it accepted (and that still exist) are returned instead.
     """
+    if validated_manifest is not None:
+        return load_validated(validated_manifest)[0]
     images = {}
     for filename in os.listdir(input_dir):
         if filename.lower().endswith(('.jpg', '.jpeg', '.png')):  # Support common image formats
@@ -40,32 +58,26 @@ def load_images(input_dir):
                 images[dice_type].append(os.path.join(input_dir, filename))
     return images
 
-# Function to apply random rotation
-def random_rotation(image):
+# Function to read the cleaned manifest written by validate_images.py
+def load_validated(validated_manifest):
     """
-    Rotates the image by a random angle between -45 and 45 degrees to simulate different orientations.
+    Returns (images, hashes) from a cleaned manifest: the accepted sources that still exist, by
+    dice type, and the content hash validation computed for each of them. Passing hashes to
+    generate_dataset saves hashing every source a second time.
     """
-    angle = random.randint(-45, 45)
-    return image.rotate(angle, expand=True)  # Expand ensures the entire rotated image is kept
-
-# Function to apply random skewing
-def random_skew(image):
-    """
-    Skews the image to mimic perspective changes, common in cellphone photos taken at angles.
-    """
-    width, height = image.size
-    skew_factor = random.uniform(-0.2, 0.2)  # Moderate skew to keep it realistic
-    new_width = int(width + abs(skew_factor * height))
-    skewed = image.transform((new_width, height), Image.AFFINE, (1, skew_factor, 0, 0, 1, 0))
-    return skewed
+    with open(validated_manifest) as f:
+        validated = json.load(f)
+    images = {dice_type: [path for path in paths if os.path.exists(path)]
+              for dice_type, paths in validated['images'].items()}
+    return images, validated['hashes']
 
 # Function to add Gaussian noise
-def add_gaussian_noise(image):
+def add_gaussian_noise(image, std=25):
     """
     Adds Gaussian noise to simulate real-world imperfections like graininess in cellphone images.
     """
     img_array = np.array(image)
-    noise = np.random.normal(0, 25, img_array.shape)  # Mean 0, std dev 25
+    noise = np.random.normal(0, std, img_array.shape)  # Mean 0, std dev 25 at source resolution
     noisy_img = img_array + noise
     noisy_img = np.clip(noisy_img, 0, 255).astype(np.uint8)  # Ensure values stay in valid range
     return Image.fromarray(noisy_img)
@@ -103,97 +115,374 @@ def random_color_balance(image):
     return Image.merge('RGB', (r, g, b))
 
 # Function to apply random Gaussian blur
-def random_blur(image):
+def random_blur(image, scale=1.0):
     """
     Applies blur to vary sharpness, simulating out-of-focus cellphone shots.
+    The radius is chosen at source resolution and divided by scale when applied to a downsampled image.
     """
     radius = random.uniform(0, 2)  # Light to moderate blur
-    return image.filter(ImageFilter.GaussianBlur(radius))
+    return image.filter(ImageFilter.GaussianBlur(radius / scale))
 
-# Function to randomly crop the image
-def random_crop(image, crop_ratio=0.8):
+# Function to decode a source into a downscaled working copy
+def load_working_copy(image_path, scale=WORKING_SCALE):
     """
-    Crops the image randomly to focus on different parts of the dice, increasing variety.
+    Decodes a source image into an RGB working copy whose sides are at least
+    scale times TARGET_SIZE, returning (working_image, original_size).
+    JPEG sources are decoded directly at reduced size via draft mode, so 12MP phone photos
+    never get fully decoded. generate_dataset decodes each source once and reuses the working
+    copy for all of its augmentations.
     """
-    width, height = image.size
-    new_width = int(width * crop_ratio)
-    new_height = int(height * crop_ratio)
-    left = random.randint(0, width - new_width)
-    top = random.randint(0, height - new_height)
-    right = left + new_width
-    bottom = top + new_height
-    return image.crop((left, top, right, bottom))
+    image = Image.open(image_path)
+    original_size = image.size
+    min_size = (TARGET_SIZE[0] * scale, TARGET_SIZE[1] * scale)
+    image.draft('RGB', min_size)
+    image = image.convert('RGB')
+    factor = min(image.width / min_size[0], image.height / min_size[1])
+    if factor > 1:
+        image = image.resize((round(image.width / factor), round(image.height / factor)),
+                             Image.LANCZOS, reducing_gap=3.0)
+    return image, original_size
 
-# Function to resize image to target size
-def resize_image(image, size=TARGET_SIZE):
+# Affine helpers: every geometric transform is expressed as the 3x3 inverse mapping PIL uses
+# (output pixel -> input pixel), so a whole chain composes into one resampling call
+def _compose(first, second):
     """
-    Resizes the image to a standard size for model input, using high-quality Lanczos resampling.
+    Returns the inverse mapping of applying the transform `first` and then `second`.
     """
-    return image.resize(size, Image.LANCZOS)
+    return [[sum(first[i][k] * second[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
 
-# Augmentation pipeline
-def augment_image(image):
+def rotation_matrix(angle, size):
     """
-    Combines various transformations into a pipeline to create a unique augmented image.
-    Each transformation is applied randomly to ensure diversity.
+    Inverse mapping and output size of image.rotate(angle, expand=True), matching PIL exactly.
+    """
+    w, h = size
+    radians = -math.radians(angle)
+    cos, sin = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    a, b, d, e = cos, sin, -sin, cos
+    c = a * -w / 2 + b * -h / 2 + w / 2
+    f = d * -w / 2 + e * -h / 2 + h / 2
+    xs = [a * x + b * y + c for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    ys = [d * x + e * y + f for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    nw = math.ceil(max(xs)) - math.floor(min(xs))
+    nh = math.ceil(max(ys)) - math.floor(min(ys))
+    tx, ty = -(nw - w) / 2.0, -(nh - h) / 2.0
+    return [[a, b, a * tx + b * ty + c], [d, e, d * tx + e * ty + f], [0, 0, 1]], (nw, nh)
+
+def skew_matrix(skew_factor, size):
+    """
+    Inverse mapping and output size of a horizontal skew by skew_factor (a perspective-like shear).
+    """
+    w, h = size
+    return [[1, skew_factor, 0], [0, 1, 0], [0, 0, 1]], (int(w + abs(skew_factor * h)), h)
+
+def mirror_matrix(size):
+    """
+    Inverse mapping of a horizontal flip.
+    """
+    return [[-1, 0, size[0]], [0, 1, 0], [0, 0, 1]], size
+
+def flip_matrix(size):
     """
-    # Geometric transformations
+    Inverse mapping of a vertical flip.
+    """
+    return [[1, 0, 0], [0, -1, size[1]], [0, 0, 1]], size
+
+def crop_matrix(left, top, new_size):
+    """
+    Inverse mapping of cropping a new_size box whose top-left corner is (left, top).
+    """
+    return [[1, 0, left], [0, 1, top], [0, 0, 1]], new_size
+
+def resize_matrix(size, new_size):
+    """
+    Inverse mapping of resizing an image from size to new_size.
+    """
+    return [[size[0] / new_size[0], 0, 0], [0, size[1] / new_size[1], 0], [0, 0, 1]], new_size
+
+# Function to draw the random geometric part of the pipeline as one affine matrix
+def random_geometry(source_size):
+    """
+    Draws rotation, skew, flips, crop and the final resize for an image of source_size and
+    composes them into a single inverse mapping from TARGET_SIZE output pixels to source pixels.
+    Each step is drawn with probability 0.5: rotation by a whole angle in [-45, 45] degrees,
+    horizontal skew in [-0.2, 0.2], horizontal and vertical flips, and a crop keeping 70-100%
+    of each side; the resize to TARGET_SIZE is always applied.
+    """
+    matrix = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    size = source_size
+    steps = []
+    if random.random() < 0.5:
+        steps.append(rotation_matrix(random.randint(-45, 45), size))
+        size = steps[-1][1]
     if random.random() < 0.5:
-        image = random_rotation(image)
+        steps.append(skew_matrix(random.uniform(-0.2, 0.2), size))  # Moderate skew to keep it realistic
+        size = steps[-1][1]
     if random.random() < 0.5:
-        image = random_skew(image)
+        steps.append(mirror_matrix(size))  # Horizontal flip
     if random.random() < 0.5:
-        image = ImageOps.mirror(image)  # Horizontal flip
+        steps.append(flip_matrix(size))    # Vertical flip
     if random.random() < 0.5:
-        image = ImageOps.flip(image)    # Vertical flip
+        crop_ratio = random.uniform(0.7, 1.0)  # Crop between 70-100% of original size
+        new_size = (int(size[0] * crop_ratio), int(size[1] * crop_ratio))
+        left = random.randint(0, size[0] - new_size[0])
+        top = random.randint(0, size[1] - new_size[1])
+        steps.append(crop_matrix(left, top, new_size))
+        size = new_size
+    steps.append(resize_matrix(size, TARGET_SIZE))
+    for step, _ in steps:
+        matrix = _compose(matrix, step)
+    return matrix
+
+# Function to record stage timings when instrumentation is enabled
+def _lap(timings, stage, start):
+    """
+    Appends the seconds elapsed since start to timings[stage] (if timings is a dict) and
+    returns the current time, so consecutive stages can be timed with one running clock.
+    """
+    now = time.perf_counter()
+    if timings is not None:
+        timings.setdefault(stage, []).append(now - start)
+    return now
+
+# Augmentation pipeline
+def augment_image(image, source_size=None, timings=None):
+    """
+    Combines various transformations into a pipeline to create a unique augmented image.
+    Each transformation is applied randomly to ensure diversity.
+    image may be a downscaled working copy of a source whose full size is source_size; all
+    geometric transforms are composed into one affine resampling step straight to TARGET_SIZE
+    (preceded by a Lanczos reduction when it would shrink the working copy), and the color, noise and blur stages then run on the small output image.
+    Pass a dict as timings to collect per-stage durations in seconds (see benchmark_augmentation.py); the
+    geometry is timed as drawing and composing the matrix, the Lanczos reduction and the affine resample.
+    """
+    if source_size is None:
+        source_size = image.size
+    start = time.perf_counter()
+
+    # Geometric transformations (rotation, skew, flips, crop and resize in one pass)
+    matrix = random_geometry(source_size)
+    # Source pixels per output pixel; noise and blur are specified at source resolution
+    scale = max(1.0, math.sqrt(abs(matrix[0][0] * matrix[1][1] - matrix[0][1] * matrix[1][0])))
+    to_working = [[image.width / source_size[0], 0, 0], [0, image.height / source_size[1], 0], [0, 0, 1]]
+    matrix = _compose(to_working, matrix)
+    start = _lap(timings, 'geometry_matrix', start)
+    # A single BICUBIC affine only samples the neighbourhood of each output pixel, so it aliases
+    # when it shrinks the image; shrink the working copy with Lanczos first so the affine resamples
+    # at roughly 1:1 and the output keeps the antialiasing of a Lanczos resize
+    shrink = math.sqrt(abs(matrix[0][0] * matrix[1][1] - matrix[0][1] * matrix[1][0]))
+    if shrink > 1:
+        reduced_size = (max(1, round(image.width / shrink)), max(1, round(image.height / shrink)))
+        to_reduced = [[reduced_size[0] / image.width, 0, 0], [0, reduced_size[1] / image.height, 0], [0, 0, 1]]
+        matrix = _compose(to_reduced, matrix)
+        image = image.resize(reduced_size, Image.LANCZOS)
+        start = _lap(timings, 'geometry_reduce', start)
+    coefficients = tuple(matrix[0]) + tuple(matrix[1])
+    image = image.transform(TARGET_SIZE, Image.AFFINE, coefficients, resample=Image.BICUBIC)
+    start = _lap(timings, 'geometry_resample', start)
 
     # Color and lighting variations
     image = random_brightness(image)
+    start = _lap(timings, 'brightness', start)
     image = random_contrast(image)
+    start = _lap(timings, 'contrast', start)
     image = random_color_balance(image)
+    start = _lap(timings, 'color_balance', start)
 
     # Noise and distortion
     if random.random() < 0.3:
-        image = add_gaussian_noise(image)
+        image = add_gaussian_noise(image, std=25 / scale)
+        start = _lap(timings, 'noise', start)
     if random.random() < 0.3:
-        image = random_blur(image)
-
-    # Randomly crop and resize
-    if random.random() < 0.5:
-        crop_ratio = random.uniform(0.7, 1.0)  # Crop between 70-100% of original size
-        image = random_crop(image, crop_ratio)
-    image = resize_image(image)
+        image = random_blur(image, scale)
+        start = _lap(timings, 'blur', start)
 
     return image
 
+# Function to hash a source image's contents
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file's contents, read in chunks to keep memory flat.
+    Used to detect changed sources independently of filenames and timestamps.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to describe the augmentation settings that affect generated outputs
+def augmentation_config(augmentations_per_image, seed):
+    """
+    Returns the settings that determine what a source image produces.
+    Any change here invalidates that source's outputs on the next run.
+    """
+    return {
+        'augmentations_per_image': augmentations_per_image,
+        'target_size': list(TARGET_SIZE),
+        'pipeline_version': PIPELINE_VERSION,
+        'seed': seed,
+    }
+
+# Function to derive a per-source random seed
+def source_seed(content_hash, seed):
+    """
+    Derives a deterministic seed from the master seed and a source's content hash,
+    so regenerating one source never depends on which other sources were processed.
+    """
+    digest = hashlib.sha256(f"{seed}:{content_hash}".encode()).digest()
+    return int.from_bytes(digest[:4], 'big')
+
+# Function to load the dataset manifest
+def load_manifest(manifest_path):
+    """
+    Loads the manifest of previously generated outputs, or an empty one if none exists yet.
+    Manifest layout: {'sources': {source_path: {'hash', 'config', 'outputs'}}}.
+    """
+    if not os.path.exists(manifest_path):
+        return {'sources': {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+# Function to save the dataset manifest
+def save_manifest(manifest, manifest_path):
+    """
+    Writes the manifest atomically so an interrupted run never leaves a truncated file behind.
+    """
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# Function to name an augmented output
+def output_name(dice_type, image_path, aug_idx):
+    """
+    Returns the output path (relative to the output directory) of one augmentation of a source.
+    The source's extension is part of the name, so 'd6_1.jpg' and 'd6_1.png' never share outputs.
+    """
+    stem, extension = os.path.splitext(os.path.basename(image_path))
+    return os.path.join(dice_type, f"{stem}_{extension.lstrip('.')}_{aug_idx}.jpg")
+
+# Function to delete outputs written before the dataset had a manifest
+def remove_legacy_outputs(output_dir, keep):
+    """
+    Deletes '{dice_type}_{idx}_{aug}.jpg' files left by the original, non-incremental generator,
+    which no manifest entry ever recorded, and returns how many were deleted. Files whose relative
+    path is in keep are left alone. Current outputs always contain the source extension, so they
+    never match the legacy pattern.
+    """
+    removed = 0
+    for dice_type in DICE_TYPES:
+        type_output_dir = os.path.join(output_dir, dice_type)
+        if not os.path.isdir(type_output_dir):
+            continue
+        pattern = re.compile(rf"{re.escape(dice_type)}_\d+_\d+\.jpg")
+        for filename in os.listdir(type_output_dir):
+            if pattern.fullmatch(filename) and os.path.join(dice_type, filename) not in keep:
+                os.remove(os.path.join(type_output_dir, filename))
+                removed += 1
+    return removed
+
+# Function to delete outputs recorded for a source
+def remove_outputs(output_dir, outputs):
+    """
+    Deletes previously generated files (paths relative to output_dir), ignoring ones already gone.
+    """
+    for rel_path in outputs:
+        path = os.path.join(output_dir, rel_path)
+        if os.path.exists(path):
+            os.remove(path)
+
 # Function to generate augmented dataset
-def generate_dataset(images, output_dir, augmentations_per_image):
+def generate_dataset(images, output_dir, augmentations_per_image, seed=SEED, hashes=None):
     """
     Generates the augmented dataset by applying the augmentation pipeline to each original image.
     Saves results in a structured directory by dice type.
+    Regeneration is incremental: sources whose content hash and augmentation config match the
+    manifest are skipped, changed sources are rebuilt and outputs of removed sources are deleted.
+    Stale outputs are deleted before anything is generated, so they can never take new outputs with them.
+    hashes optionally maps source paths to content hashes already computed for this run (see
+    load_validated); sources missing from it are hashed here.
+    Returns a dict counting 'generated', 'skipped' and 'removed' sources, plus 'legacy' files
+    deleted from before the manifest existed.
     """
+    hashes = hashes or {}
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+    previous = manifest['sources']
+    current = {}
+    config = augmentation_config(augmentations_per_image, seed)
+    summary = {'generated': 0, 'skipped': 0, 'removed': 0}
+
+    # Drop outputs of sources that were deleted from the input directory
+    sources = {image_path for image_paths in images.values() for image_path in image_paths}
+    for image_path, entry in previous.items():
+        if image_path not in sources:
+            remove_outputs(output_dir, entry['outputs'])
+            summary['removed'] += 1
+    recorded = {p for image_path, entry in previous.items() if image_path in sources for p in entry['outputs']}
+    summary['legacy'] = remove_legacy_outputs(output_dir, recorded)
+
     for dice_type, image_paths in images.items():
         type_output_dir = os.path.join(output_dir, dice_type)
         if not os.path.exists(type_output_dir):
             os.makedirs(type_output_dir)
-        for idx, image_path in enumerate(image_paths):
-            original_image = Image.open(image_path).convert('RGB')  # Ensure RGB format
+        for image_path in image_paths:
+            content_hash = hashes.get(image_path) or hash_file(image_path)
+            entry = previous.get(image_path)
+            if (entry is not None and entry['hash'] == content_hash and entry['config'] == config
+                    and all(os.path.exists(os.path.join(output_dir, p)) for p in entry['outputs'])):
+                current[image_path] = entry
+                summary['skipped'] += 1
+                continue
+            if entry is not None:
+                remove_outputs(output_dir, entry['outputs'])
+
+            # Seed both RNGs per source so its outputs are reproducible in isolation
+            per_source_seed = source_seed(content_hash, seed)
+            random.seed(per_source_seed)
+            np.random.seed(per_source_seed)
+
+            working_image, source_size = load_working_copy(image_path)
+            outputs = []
             for aug_idx in range(augmentations_per_image):
-                augmented_image = augment_image(original_image.copy())  # Work on a copy
-                save_path = os.path.join(type_output_dir, f"{dice_type}_{idx}_{aug_idx}.jpg")
-                augmented_image.save(save_path, quality=95)  # High-quality JPEG
+                augmented_image = augment_image(working_image, source_size)
+                rel_path = output_name(dice_type, image_path, aug_idx)
+                augmented_image.save(os.path.join(output_dir, rel_path), quality=95)  # High-quality JPEG
+                outputs.append(rel_path)
+            current[image_path] = {'hash': content_hash, 'config': config, 'outputs': outputs}
+            summary['generated'] += 1
+
+    manifest['sources'] = current
+    save_manifest(manifest, manifest_path)
+    return summary
 
 # Main function
 def main():
     """
     Executes the dataset generation process.
+    Sources are validated first (see validate_images.py) so corrupt, tiny or duplicate photos
+    are never augmented.
     """
+    import validate_images  # Imported here because validate_images imports this module
     images = load_images(INPUT_DIR)
-    if not images:
+    hashes = {}
+    if images:
+        _, rejected = validate_images.validate_sources(images, OUTPUT_DIR)
+        for path, reason in sorted(rejected.items()):
+            print(f"Skipping {path}: {reason}")
+        images, hashes = load_validated(os.path.join(OUTPUT_DIR, validate_images.VALIDATED_FILENAME))
+    # Runs even with no valid sources left, so outputs of removed or newly rejected sources are deleted
+    summary = generate_dataset(images, OUTPUT_DIR, AUGMENTATIONS_PER_IMAGE, hashes=hashes)
+    if not any(images.values()):
         print("No valid images found in the input directory. Please add images and try again.")
+        if summary['removed']:
+            print(f"Deleted the outputs of {summary['removed']} sources that are gone or no longer valid.")
         return
-    generate_dataset(images, OUTPUT_DIR, AUGMENTATIONS_PER_IMAGE)
-    print(f"Augmented dataset generated in {OUTPUT_DIR} with {AUGMENTATIONS_PER_IMAGE} images per original.")
+    print(f"Augmented dataset updated in {OUTPUT_DIR} with {AUGMENTATIONS_PER_IMAGE} images per original "
+          f"({summary['generated']} regenerated, {summary['skipped']} unchanged, {summary['removed']} removed).")
+    if summary['legacy']:
+        print(f"Deleted {summary['legacy']} outputs left over from before the manifest existed.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
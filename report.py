@@ -0,0 +1,182 @@
+import csv
+import heapq
+import importlib.util
+import itertools
+from collections import namedtuple
+from accumulators import METRIC_NAMES
+
+# pyarrow is optional and slow to import, so only check it is installed here; it is imported
+# the first time a Parquet file is written
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+TOP_N = 20               # Rows kept for the terminal table
+BUFFER_SIZE = 1 << 20    # Bytes of CSV output buffered before each write to disk
+BATCH_SIZE = 10000       # Rows per Parquet row group
+
+# Running statistics of one numeric field over every row written
+FieldSummary = namedtuple('FieldSummary', ['field', 'count', 'mean', 'minimum', 'maximum'])
+
+# Columns of the combat report: (header, function(result) -> formatted cell).
+# Results are the dicts built by TestCombatScenarios.run_scenario: metric means plus distribution metrics.
+COMBAT_COLUMNS = [
+    ("Scenario", lambda r: r['scenario']),
+    ("Victory Rate", lambda r: f"{r['victory']:.2%}"),
+    ("Rounds", lambda r: f"{r['rounds']:.2f}"),
+    ("Damage (P/E)", lambda r: f"{r['dmg_players']:.2f} / {r['dmg_enemies']:.2f}"),
+    ("Tension Index", lambda r: f"{r['tension_index']:.2%}"),
+    ("Eng. Var.", lambda r: f"{r['engagement_variability']:.3f}"),
+    ("Flow State", lambda r: f"{r['flow_state']:.2f}"),
+    ("Dec. Impact", lambda r: f"{r['decision_impact']:.2f}%"),
+    ("NTR", lambda r: f"{r['ntr']:.2f}"),
+    ("Victory Entropy", lambda r: f"{r['victory_entropy']:.3f}"),
+    ("Damage SD (P/E)", lambda r: f"{r['dmg_players_std']:.2f} / {r['dmg_enemies_std']:.2f}"),
+    ("Round Var.", lambda r: f"{r['rounds_variance']:.2f}"),
+]
+
+# Columns of a multiplier sweep report.
+# Rows are {'configuration', 'attack_multiplier', 'defense_multiplier', **metric means}.
+SWEEP_COLUMNS = [
+    ("Configuration", lambda r: r['configuration']),
+    ("Attack", lambda r: r['attack_multiplier']),
+    ("Defense", lambda r: r['defense_multiplier']),
+] + [(name, lambda r, name=name: f"{r[name]:.6g}") for name in METRIC_NAMES]
+
+class ReportWriter:
+    """Streams result rows to CSV and/or Parquet while keeping a bounded amount in memory.
+
+    Each row is written as soon as it is added: the CSV gets the formatted cells of columns, the
+    Parquet file gets the raw result fields (buffered into row groups of batch_size rows). Only
+    top_n rows are kept for the terminal table, plus running count/mean/min/max per numeric field,
+    so memory stays constant however many rows are written.
+
+    Usable as a context manager; the files are complete once close() has been called.
+    """
+
+    def __init__(self, csv_path=None, parquet_path=None, columns=COMBAT_COLUMNS, top_n=TOP_N, rank_by=None,
+                 buffer_size=BUFFER_SIZE, batch_size=BATCH_SIZE):
+        """Open the output files.
+
+        Args:
+            csv_path (str): CSV file of formatted rows, or None.
+            parquet_path (str): Parquet file of raw rows, or None (needs pyarrow).
+            columns (list): (header, formatter) pairs for the CSV and the terminal table.
+            top_n (int): Rows kept for the terminal table.
+            rank_by (callable): Key of a result; the table shows the top_n largest. None keeps the first top_n.
+            buffer_size (int): CSV write buffer in bytes.
+            batch_size (int): Rows per Parquet row group.
+
+        Raises:
+            ImportError: parquet_path was given but pyarrow is not installed.
+        """
+        if parquet_path is not None and not HAVE_PYARROW:
+            raise ImportError("Parquet output needs pyarrow; install it or write CSV only")
+        self.columns = columns
+        self.headers = [header for header, _ in columns]
+        self.top_n = top_n
+        self.rank_by = rank_by
+        self.count = 0
+        self._top = []  # Heap of (key, sequence, cells) when ranking, else the first top_n cells
+        self._sequence = itertools.count()
+        self._fields = {}  # field -> [count, total, minimum, maximum]
+        self._csv_file = None
+        self._csv = None
+        if csv_path is not None:
+            self._csv_file = open(csv_path, 'w', newline='', buffering=buffer_size)
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(self.headers)
+        self.parquet_path = parquet_path
+        self.batch_size = batch_size
+        self._batch = []
+        self._parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, result):
+        """Write one result row and update the preview and the running statistics."""
+        cells = [formatter(result) for _, formatter in self.columns]
+        if self._csv is not None:
+            self._csv.writerow(cells)
+        if self.parquet_path is not None:
+            self._batch.append(result)
+            if len(self._batch) >= self.batch_size:
+                self._flush_parquet()
+        if self.rank_by is None:
+            if len(self._top) < self.top_n:
+                self._top.append(cells)
+        else:
+            entry = (self.rank_by(result), next(self._sequence), cells)
+            if len(self._top) < self.top_n:
+                heapq.heappush(self._top, entry)
+            elif entry[0] > self._top[0][0]:
+                heapq.heapreplace(self._top, entry)
+        for field, value in result.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats = self._fields.get(field)
+                if stats is None:
+                    self._fields[field] = [1, value, value, value]
+                else:
+                    stats[0] += 1
+                    stats[1] += value
+                    stats[2] = min(stats[2], value)
+                    stats[3] = max(stats[3], value)
+        self.count += 1
+
+    def extend(self, results):
+        """Add every result of an iterable, consuming it lazily."""
+        for result in results:
+            self.add(result)
+
+    def _flush_parquet(self):
+        """Write the buffered raw rows as one Parquet row group."""
+        if not self._batch:
+            return
+        import pyarrow
+        import pyarrow.parquet
+        table = pyarrow.Table.from_pylist(self._batch)
+        if self._parquet is None:
+            self._parquet = pyarrow.parquet.ParquetWriter(self.parquet_path, table.schema)
+        self._parquet.write_table(table)
+        self._batch = []
+
+    def close(self):
+        """Flush and close the output files."""
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = self._csv = None
+        if self.parquet_path is not None:
+            self._flush_parquet()
+            if self._parquet is not None:
+                self._parquet.close()
+                self._parquet = None
+
+    def rows(self):
+        """Formatted cells of the preview rows (largest rank_by first when ranking)."""
+        if self.rank_by is None:
+            return list(self._top)
+        return [cells for _, _, cells in sorted(self._top, key=lambda entry: (-entry[0], entry[1]))]
+
+    def summary(self):
+        """FieldSummary of every numeric field, in the order fields were first seen."""
+        return [FieldSummary(field, count, total / count, minimum, maximum)
+                for field, (count, total, minimum, maximum) in self._fields.items()]
+
+    def table(self, **options):
+        """The preview rows as a tabulate table; options go to tabulate."""
+        from tabulate import tabulate
+        return tabulate(self.rows(), headers=self.headers, **options)
+
+    def summary_table(self, **options):
+        """The running statistics of every numeric field as a tabulate table."""
+        from tabulate import tabulate
+        return tabulate([[s.field, s.count, f"{s.mean:.4g}", f"{s.minimum:.4g}", f"{s.maximum:.4g}"]
+                         for s in self.summary()], headers=["Field", "Rows", "Mean", "Min", "Max"], **options)
+
+def write_report(results, csv_path=None, parquet_path=None, **options):
+    """Stream an iterable of results into a ReportWriter and return it, closed, for its table and summary."""
+    with ReportWriter(csv_path, parquet_path, **options) as writer:
+        writer.extend(results)
+    return writer
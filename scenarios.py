@@ -0,0 +1,88 @@
+import json
+import os
+from collections import namedtuple
+from participant import Participant
+
+# A registered encounter: stat blocks are (name, hp, attack, defense, speed[, behavior, targeting]) tuples
+# so every run can build fresh Participant objects, plus the multipliers and victory band used in tests.py
+Scenario = namedtuple(
+    'Scenario',
+    ['name', 'players', 'enemies', 'attack_multiplier', 'defense_multiplier', 'expected_victory_range']
+)
+
+WARRIOR = ("Warrior", 50, 10, 5, 10)
+MAGE = ("Mage", 30, 8, 3, 12)
+THIEF = ("Thief", 25, 7, 2, 15)
+GOBLIN = ("Goblin", 20, 5, 2, 8)
+DRAGON = ("Dragon", 100, 15, 8, 9)
+WOLF = ("Wolf", 30, 8, 3, 10)
+IMP = ("Imp", 15, 4, 1, 7)
+
+SCENARIOS = {
+    "Solo Warrior vs. Goblin": Scenario("Solo Warrior vs. Goblin", [WARRIOR], [GOBLIN], 1.0, 1.0, (0.9, 1.0)),
+    "Party vs. Mob": Scenario("Party vs. Mob", [WARRIOR, MAGE], [GOBLIN] * 3, 1.5, 1.0, (0.8, 1.0)),
+    "Boss Fight": Scenario("Boss Fight", [WARRIOR, MAGE], [DRAGON], 1.0, 1.2, (0.0, 0.3)),
+    "Underdog Challenge": Scenario("Underdog Challenge", [THIEF], [WOLF] * 2, 0.8, 1.2, (0.0, 0.1)),
+    "Attrition Test": Scenario("Attrition Test", [WARRIOR], [IMP] * 5, 1.5, 0.8, (0.9, 1.0)),
+}
+
+def build_participants(scenario):
+    """Create fresh participants for a scenario.
+
+    Args:
+        scenario (Scenario or str): A Scenario or the name of a registered one.
+
+    Returns:
+        tuple: (players, enemies) lists of new Participant objects.
+    """
+    if isinstance(scenario, str):
+        scenario = SCENARIOS[scenario]
+    players = [Participant(*stats) for stats in scenario.players]
+    enemies = [Participant(*stats) for stats in scenario.enemies]
+    return players, enemies
+
+def _stat_blocks(entries):
+    """Expand scenario-file participant entries ({'name', 'hp', 'attack', 'defense', 'speed', 'count',
+    'behavior', 'targeting'})."""
+    blocks = []
+    for entry in entries:
+        stats = (entry['name'], entry['hp'], entry['attack'], entry['defense'], entry['speed'])
+        if 'behavior' in entry or 'targeting' in entry:
+            stats += (entry.get('behavior'), entry.get('targeting'))
+        blocks.extend([stats] * entry.get('count', 1))
+    return blocks
+
+def load_scenario_file(path):
+    """Load scenarios from a JSON file holding one scenario object or a list of them.
+
+    Each object has 'name', 'players' and 'enemies' (lists of participant objects with 'name', 'hp',
+    'attack', 'defense', 'speed', an optional 'count', an optional 'behavior' naming one of
+    abilities.BEHAVIORS for the 'abilities' engine and an optional 'targeting' policy from
+    targeting.POLICIES for the 'targeted' engine), plus optional 'attack_multiplier',
+    'defense_multiplier' and 'expected_victory_range'.
+
+    Returns:
+        list: Scenario tuples.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    scenarios = []
+    for item in data if isinstance(data, list) else [data]:
+        victory_range = item.get('expected_victory_range', (0.0, 1.0))
+        scenarios.append(Scenario(item['name'], _stat_blocks(item['players']), _stat_blocks(item['enemies']),
+                                  item.get('attack_multiplier', 1.0), item.get('defense_multiplier', 1.0),
+                                  tuple(victory_range)))
+    return scenarios
+
+def resolve_scenarios(specs):
+    """Turn command-line scenario arguments (file paths or registered names) into Scenario tuples."""
+    scenarios = []
+    for spec in specs:
+        if os.path.isfile(spec):
+            scenarios.extend(load_scenario_file(spec))
+        elif spec in SCENARIOS:
+            scenarios.append(SCENARIOS[spec])
+        else:
+            raise ValueError(f"'{spec}' is neither a scenario file nor a registered scenario "
+                             f"({', '.join(SCENARIOS)})")
+    return scenarios
@@ -0,0 +1,17 @@
+# Counter-based seeding shared by every engine, so any fight of a batch can be replayed on its own
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+def _mix64(z):
+    """SplitMix64 finalizer: scramble a 64-bit integer into a well-distributed one."""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+def run_seed(master_seed, run_index):
+    """Counter-based seed for one fight, computed from (master_seed, run_index) alone.
+
+    Any run can be reproduced without replaying the runs before it, and two configurations
+    simulated with the same master seed see the same random numbers run for run.
+    """
+    return _mix64((_mix64(master_seed & _MASK64) + (run_index + 1) * _GOLDEN) & _MASK64)
@@ -0,0 +1,178 @@
+import math
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from accumulators import METRIC_NAMES
+from parallel import ENGINES
+from participant import Participant
+from seeding import run_seed
+from tuner import STATS
+
+# Sobol indices of one parameter for one metric, with bootstrap confidence intervals (low, high).
+# first_order is the share of the metric's variance the parameter explains alone; total also counts
+# every interaction it takes part in, so total - first_order measures how much it acts through others.
+SobolIndex = namedtuple('SobolIndex', ['parameter', 'metric', 'first_order', 'first_order_ci', 'total', 'total_ci'])
+
+# One varied stat: '<Name>.<stat>' applied to every participant with that name, sampled uniformly
+# over the integers low..high
+StatRange = namedtuple('StatRange', ['parameter', 'name', 'stat', 'low', 'high'])
+
+_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97, 101,
+           103, 107, 109, 113, 127, 131, 137, 139, 149, 151, 157, 163, 167, 173, 179, 181, 191, 193, 197, 199)
+
+def scrambled_halton(count, dimensions, seed=0):
+    """First count points of a digit-permuted (scrambled) Halton sequence in [0, 1)^dimensions.
+
+    Dimension j uses the j-th prime as its base, with its own random permutation of the digits
+    applied to every digit position. Scrambling breaks up the correlated stripes plain Halton
+    points form in higher dimensions while keeping their low discrepancy.
+    """
+    if dimensions > len(_PRIMES):
+        raise ValueError(f"At most {len(_PRIMES)} dimensions are supported")
+    rng = random.Random(seed)
+    columns = []
+    for base in _PRIMES[:dimensions]:
+        digits = math.ceil(53 / math.log2(base))  # Enough digits to fill a double's mantissa
+        permutations = [rng.sample(range(base), base) for _ in range(digits)]
+        column = []
+        for index in range(count):
+            value, scale, n = 0.0, 1.0 / base, index
+            for permutation in permutations:
+                value += permutation[n % base] * scale
+                n //= base
+                scale /= base
+            column.append(min(value, 1.0 - 1e-16))
+        columns.append(column)
+    return [list(point) for point in zip(*columns)]
+
+def stat_ranges(players, enemies, spread=0.25, stats=STATS):
+    """Vary each distinct participant's stats by +-spread around their current values.
+
+    Returns:
+        list: StatRange per (distinct name, stat); HP and speed never go below 1.
+    """
+    ranges = []
+    seen = set()
+    for p in list(players) + list(enemies):
+        if p.name in seen:
+            continue
+        seen.add(p.name)
+        base = {'hp': p.max_hp, 'attack': p.attack, 'defense': p.defense, 'speed': p.speed}
+        for stat in stats:
+            floor = 1 if stat in ('hp', 'speed') else 0
+            low = max(floor, math.floor(base[stat] * (1 - spread)))
+            high = max(low, math.ceil(base[stat] * (1 + spread)))
+            ranges.append(StatRange(f"{p.name}.{stat}", p.name, stat, low, high))
+    return ranges
+
+def apply_sample(players, enemies, ranges, point):
+    """Build (players, enemies) with each range's stat set from its coordinate of a unit-cube point."""
+    values = {}
+    for r, u in zip(ranges, point):
+        values[(r.name, r.stat)] = r.low + min(int(u * (r.high - r.low + 1)), r.high - r.low)
+
+    def rebuild(p):
+        stats = [values.get((p.name, stat), current) for stat, current in
+                 zip(('hp', 'attack', 'defense', 'speed'), (p.max_hp, p.attack, p.defense, p.speed))]
+        return Participant(p.name, *stats, p.behavior, p.targeting)
+
+    return [rebuild(p) for p in players], [rebuild(e) for e in enemies]
+
+def evaluate_points(players, enemies, attack_multiplier, defense_multiplier, ranges, points, runs, seed, engine):
+    """Mean metrics of runs fights at each sample point.
+
+    Top-level so it can be sent to worker processes. Every point uses the same run seeds (common
+    random numbers), so differences between points come from the stats rather than from noise.
+    """
+    seeds = [run_seed(seed, i) for i in range(runs)]
+    outputs = []
+    for point in points:
+        sample_players, sample_enemies = apply_sample(players, enemies, ranges, point)
+        results = ENGINES[engine](sample_players, sample_enemies, attack_multiplier, defense_multiplier, seeds)
+        outputs.append(tuple(sum(values) / runs for values in zip(*results)))
+    return outputs
+
+def _indices(f_a, f_b, f_ab, rows):
+    """Saltelli (2010) first-order and Jansen total indices over the given sample rows."""
+    pooled = [f_a[r] for r in rows] + [f_b[r] for r in rows]
+    mean = sum(pooled) / len(pooled)
+    variance = sum((y - mean) ** 2 for y in pooled) / len(pooled)
+    if variance == 0:
+        return [0.0] * len(f_ab), [0.0] * len(f_ab)
+    first, total = [], []
+    for column in f_ab:
+        first.append(sum(f_b[r] * (column[r] - f_a[r]) for r in rows) / len(rows) / variance)
+        total.append(sum((f_a[r] - column[r]) ** 2 for r in rows) / (2 * len(rows)) / variance)
+    return first, total
+
+def sobol_indices(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0, metrics=('victory', 'ntr'),
+                  samples=256, runs=200, spread=0.25, seed=0, engine='compiled', workers=1, bootstrap=200,
+                  confidence=0.95, chunk_size=64):
+    """First-order and total Sobol indices of every participant stat for the given metrics.
+
+    Uses the Saltelli design: two independent quasi-random sample matrices A and B (the halves of
+    one scrambled Halton sequence) and, for each parameter i, A with column i taken from B. That
+    is samples * (parameters + 2) evaluations, each a batch of runs fights through parallel.ENGINES,
+    split into chunks of chunk_size points across worker processes. Confidence intervals are
+    bootstrap percentiles over resampled rows of the design.
+
+    Args:
+        players (list): Player Participant objects (not modified).
+        enemies (list): Enemy Participant objects (not modified).
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+        metrics (tuple): Metric names (see accumulators.METRIC_NAMES) to analyse.
+        samples (int): Rows of each design matrix.
+        runs (int): Fights per evaluation.
+        spread (float): Each stat varies by +-spread around its current value.
+        seed (int): Seed for the sample sequence, its scrambling, the bootstrap and the fights.
+        engine (str): Simulation engine (see parallel.ENGINES).
+        workers (int): Worker processes.
+        bootstrap (int): Bootstrap resamples for the confidence intervals.
+        confidence (float): Confidence level of the intervals.
+        chunk_size (int): Sample points per work unit.
+
+    Returns:
+        dict: Metric name -> list of SobolIndex, one per parameter, sorted by total index (largest first).
+    """
+    for metric in metrics:
+        if metric not in METRIC_NAMES:
+            raise ValueError(f"Unknown metric '{metric}'. Choose from: {', '.join(METRIC_NAMES)}")
+    ranges = stat_ranges(players, enemies, spread)
+    d = len(ranges)
+    sequence = scrambled_halton(samples, 2 * d, seed)
+    a = [point[:d] for point in sequence]
+    b = [point[d:] for point in sequence]
+    design = a + b
+    for i in range(d):
+        design += [row_a[:i] + [row_b[i]] + row_a[i + 1:] for row_a, row_b in zip(a, b)]
+
+    chunks = [design[start:start + chunk_size] for start in range(0, len(design), chunk_size)]
+    args = [(players, enemies, attack_multiplier, defense_multiplier, ranges, chunk, runs, seed, engine)
+            for chunk in chunks]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = [y for chunk in executor.map(evaluate_points, *zip(*args)) for y in chunk]
+    else:
+        outputs = [y for chunk_args in args for y in evaluate_points(*chunk_args)]
+
+    rng = random.Random(seed)
+    resamples = [[rng.randrange(samples) for _ in range(samples)] for _ in range(bootstrap)]
+    tail = (1 - confidence) / 2
+    report = {}
+    for metric in metrics:
+        m = METRIC_NAMES.index(metric)
+        y = [output[m] for output in outputs]
+        f_a, f_b = y[:samples], y[samples:2 * samples]
+        f_ab = [y[(2 + i) * samples:(3 + i) * samples] for i in range(d)]
+        first, total = _indices(f_a, f_b, f_ab, range(samples))
+        draws = [_indices(f_a, f_b, f_ab, rows) for rows in resamples]
+
+        def interval(k, i):
+            values = sorted(draw[k][i] for draw in draws)
+            return (values[int(tail * (len(values) - 1))], values[int((1 - tail) * (len(values) - 1))])
+
+        indices = [SobolIndex(r.parameter, metric, first[i], interval(0, i), total[i], interval(1, i))
+                   for i, r in enumerate(ranges)]
+        report[metric] = sorted(indices, key=lambda index: index.total, reverse=True)
+    return report
@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from accumulators import METRIC_NAMES, MetricAccumulator
+from parallel import CHUNK_SIZE, ENGINES, chunk_bounds, simulate_chunk
+from participant import Participant
+
+# Stat table layout: one int64 row per participant slot (players first, then enemies)
+STAT_COLUMNS = ('hp', 'attack', 'defense', 'speed')
+# Result table layout: one float64 row per chunk holding the fight count, then the metric sums, then the sums of squares
+RESULT_WIDTH = 1 + 2 * len(METRIC_NAMES)
+# Metrics whose sums are integers (victory, rounds and damage); float64 holds them exactly below 2**53
+_INTEGER_METRICS = 4
+
+class SharedEncounter:
+    """Participant stat table in a shared memory block.
+
+    The coordinator writes the table once; workers attach to it by name, so tasks only carry
+    chunk indices instead of pickled Participant lists. Names, behaviors and targeting policies
+    are small and travel once, in spec().
+
+    The engines simulate Participant objects, not raw stat rows, so each worker copies the table
+    into Participants once, in its initializer (participants()); the saving is in per-task IPC,
+    not in a zero-copy read by the fight kernels.
+    """
+
+    def __init__(self, shm, names, num_players, owner, behaviors=None, policies=None):
+        """Wrap an open shared memory block; use create() or attach() instead."""
+        self.shm = shm
+        self.names = names
+        self.behaviors = behaviors or (None,) * len(names)
+        self.policies = policies or (None,) * len(names)
+        self.num_players = num_players
+        self.owner = owner
+        self.table = shm.buf.cast('q')  # Flat int64 view, len(names) * len(STAT_COLUMNS) long
+
+    @classmethod
+    def create(cls, players, enemies):
+        """Allocate a block and write every participant's stats into it."""
+        participants = list(players) + list(enemies)
+        width = len(STAT_COLUMNS)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(participants) * width * 8))
+        encounter = cls(shm, tuple(p.name for p in participants), len(players), owner=True,
+                        behaviors=tuple(p.behavior for p in participants),
+                        policies=tuple(p.targeting for p in participants))
+        for slot, p in enumerate(participants):
+            for column, value in enumerate((p.max_hp, p.attack, p.defense, p.speed)):
+                encounter.table[slot * width + column] = value
+        return encounter
+
+    @classmethod
+    def attach(cls, spec):
+        """Attach to a table from its spec() in another process."""
+        name, names, num_players, behaviors, policies = spec
+        return cls(shared_memory.SharedMemory(name=name), names, num_players, owner=False, behaviors=behaviors,
+                   policies=policies)
+
+    def spec(self):
+        """Small picklable description workers need to attach: block name, names, num_players, behaviors, policies."""
+        return self.shm.name, self.names, self.num_players, self.behaviors, self.policies
+
+    def participants(self):
+        """Build fresh (players, enemies) Participant lists from a copy of the shared stats.
+
+        Called once per worker process; the copy is four integers per participant.
+        """
+        width = len(STAT_COLUMNS)
+        built = [Participant(name, *self.table[slot * width:(slot + 1) * width].tolist(), self.behaviors[slot],
+                             self.policies[slot])
+                 for slot, name in enumerate(self.names)]
+        return built[:self.num_players], built[self.num_players:]
+
+    def close(self):
+        """Release this process's view; the creating process also frees the block."""
+        self.table.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class SharedResults:
+    """Per-chunk result rows in a shared memory block.
+
+    Each worker writes its chunk's count, sums and sums of squares into the chunk's own row, so no
+    result is pickled back; the coordinator merges the rows in place, in chunk order.
+    """
+
+    def __init__(self, shm, num_chunks, owner):
+        """Wrap an open shared memory block; use create() or attach() instead."""
+        self.shm = shm
+        self.num_chunks = num_chunks
+        self.owner = owner
+        self.rows = shm.buf.cast('d')  # Flat float64 view, num_chunks * RESULT_WIDTH long
+
+    @classmethod
+    def create(cls, num_chunks):
+        """Allocate zeroed rows for num_chunks chunks."""
+        shm = shared_memory.SharedMemory(create=True, size=max(1, num_chunks * RESULT_WIDTH * 8))
+        shm.buf[:] = bytes(len(shm.buf))
+        return cls(shm, num_chunks, owner=True)
+
+    @classmethod
+    def attach(cls, spec):
+        """Attach to result rows from their spec() in another process."""
+        name, num_chunks = spec
+        return cls(shared_memory.SharedMemory(name=name), num_chunks, owner=False)
+
+    def spec(self):
+        """Small picklable description workers need to attach: (block name, number of chunks)."""
+        return self.shm.name, self.num_chunks
+
+    def write(self, chunk, acc):
+        """Store a chunk's MetricAccumulator in its row."""
+        offset = chunk * RESULT_WIDTH
+        self.rows[offset] = acc.count
+        for m in range(len(METRIC_NAMES)):
+            self.rows[offset + 1 + m] = acc.sums[m]
+            self.rows[offset + 1 + len(METRIC_NAMES) + m] = acc.squares[m]
+
+    def read(self, chunk):
+        """Rebuild a chunk's MetricAccumulator from its row (integer metrics come back as ints)."""
+        offset = chunk * RESULT_WIDTH
+        n = len(METRIC_NAMES)
+        acc = MetricAccumulator()
+        acc.count = int(self.rows[offset])
+        acc.sums = [self.rows[offset + 1 + m] for m in range(n)]
+        acc.squares = [self.rows[offset + 1 + n + m] for m in range(n)]
+        for m in range(_INTEGER_METRICS):
+            acc.sums[m] = int(acc.sums[m])
+            acc.squares[m] = int(acc.squares[m])
+        return acc
+
+    def merged(self):
+        """Merge every chunk row in chunk order, matching parallel.run_parallel_simulations."""
+        total = MetricAccumulator()
+        for chunk in range(self.num_chunks):
+            total.merge(self.read(chunk))
+        return total
+
+    def close(self):
+        """Release this process's view; the creating process also frees the block."""
+        self.rows.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+# Per-worker state set up once by _init_worker, so tasks only carry chunk bounds
+_worker = {}
+
+def _init_worker(encounter_spec, results_spec, engine, attack_multiplier, defense_multiplier, master_seed):
+    """Pool initializer: attach to the shared tables and build the participants once per process."""
+    encounter = SharedEncounter.attach(encounter_spec)
+    _worker.update(encounter=encounter, results=SharedResults.attach(results_spec), engine=engine,
+                   participants=encounter.participants(), attack_multiplier=attack_multiplier,
+                   defense_multiplier=defense_multiplier, master_seed=master_seed)
+
+def _run_chunk(chunk, start, stop):
+    """Simulate one chunk in a worker and write its sums into the shared result rows."""
+    players, enemies = _worker['participants']
+    acc = simulate_chunk(_worker['engine'], players, enemies, _worker['attack_multiplier'],
+                         _worker['defense_multiplier'], _worker['master_seed'], start, stop)
+    _worker['results'].write(chunk, acc)
+
+def run_shared_simulations(players, enemies, attack_multiplier, defense_multiplier, num_runs=1000, seed=0,
+                           workers=2, engine='reference', chunk_size=CHUNK_SIZE):
+    """Run a batch across worker processes, passing stats and results through shared memory.
+
+    Same results as parallel.run_parallel_simulations with the same seed and chunk size, but
+    participants are written once to a shared stat table instead of being pickled with every
+    task, and each chunk's sums land in a shared row instead of being pickled back. Per-task
+    IPC is three integers each way regardless of encounter size.
+
+    Result rows hold only the count, sums and sums of squares, so this path does not collect
+    outcome histograms or per-participant slot statistics; use run_parallel_simulations with
+    histograms= or slot_stats=True for those.
+
+    Args:
+        players (list): Player Participant objects (not modified).
+        enemies (list): Enemy Participant objects (not modified).
+        attack_multiplier (float): Multiplier for attack stats.
+        defense_multiplier (float): Multiplier for defense stats.
+        num_runs (int): Number of fights.
+        seed (int): Master seed; run i uses parallel.run_seed(seed, i).
+        workers (int): Worker processes.
+        engine (str): Key of parallel.ENGINES.
+        chunk_size (int): Fights per work unit.
+
+    Returns:
+        MetricAccumulator: Merged metrics.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Choose from: {', '.join(ENGINES)}")
+    bounds = chunk_bounds(num_runs, chunk_size)
+    if not bounds:
+        return MetricAccumulator()
+    encounter = SharedEncounter.create(players, enemies)
+    results = SharedResults.create(len(bounds))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(encounter.spec(), results.spec(), engine, attack_multiplier,
+                                           defense_multiplier, seed)) as executor:
+            # list() waits for every chunk and re-raises the first worker error
+            list(executor.map(_run_chunk, range(len(bounds)), *zip(*bounds)))
+        return results.merged()
+    finally:
+        results.close()
+        encounter.close()
@@ -0,0 +1,208 @@
+import threading
+from bisect import bisect_right
+from collections import deque
+from accumulators import METRIC_NAMES
+from parallel import run_parallel_simulations, simulate_chunk
+from scenarios import SCENARIOS, build_participants
+
+# Multiplier grid pre-simulated for every scenario; spans the UI sliders (0.5 to 2.0) in steps of 0.125
+GRID = tuple(0.5 + 0.125 * i for i in range(13))
+GRID_RUNS = 400  # Fights per grid node
+REFINE_LIMIT = 8 * GRID_RUNS  # refine() stops adding fights to a node once it holds this many
+
+class SurrogateGrid:
+    """Metric means pre-simulated on an attack x defense multiplier grid, interpolated bilinearly.
+
+    Every node is simulated with the same master seed, so neighbouring nodes share their random
+    numbers and the interpolated surface is smooth rather than jagged with sampling noise.
+    predict() is a handful of arithmetic operations, so it answers in microseconds. refine()
+    simulates more fights at the corners of one cell, e.g. after a real simulation there, so the
+    parts of the grid that are actually explored become more precise.
+    """
+
+    def __init__(self, attack_values, defense_values, nodes, players=None, enemies=None, seed=0, engine='compiled'):
+        """Wrap simulated nodes; nodes[a][d] is the MetricAccumulator at (attack_values[a], defense_values[d]).
+
+        players, enemies, seed and engine are what the nodes were simulated with; refine() needs them.
+        """
+        self.attack_values = list(attack_values)
+        self.defense_values = list(defense_values)
+        self.nodes = nodes
+        self.players = players
+        self.enemies = enemies
+        self.seed = seed
+        self.engine = engine
+        self.means = [[acc.means() for acc in row] for row in nodes]
+        # Squared standard error of each node's means
+        self.errors = [[tuple(v / acc.count for v in acc.variances()) for acc in row] for row in nodes]
+        self._refining = threading.Lock()  # One refine() at a time
+        self._lock = threading.Lock()  # Guards means and errors, so predict() never sees a half-refined cell
+
+    @classmethod
+    def build(cls, players, enemies, attack_values=GRID, defense_values=GRID, runs=GRID_RUNS, seed=0,
+              engine='compiled', telemetry=None):
+        """Simulate every grid node with run_parallel_simulations (progress to telemetry) and return the grid."""
+        nodes = [[run_parallel_simulations(players, enemies, am, dm, num_runs=runs, seed=seed, engine=engine,
+                                           telemetry=telemetry)
+                  for dm in defense_values] for am in attack_values]
+        return cls(attack_values, defense_values, nodes, players, enemies, seed, engine)
+
+    def refine(self, attack_multiplier, defense_multiplier, runs=GRID_RUNS, limit=REFINE_LIMIT):
+        """Simulate runs more fights at each corner of the cell holding a multiplier pair.
+
+        Each corner continues its own run sequence (runs count..count+runs-1 of the grid's seed),
+        so the added fights are new, and all four corners get the same run indices. Corners that
+        already hold limit fights are left alone.
+
+        Returns:
+            int: Fights added over all four corners.
+        """
+        if self.players is None:
+            raise ValueError("This grid was built without its participants, so it cannot be refined")
+        a, _ = self._cell(self.attack_values, attack_multiplier)
+        d, _ = self._cell(self.defense_values, defense_multiplier)
+        added = 0
+        with self._refining:
+            refined = []
+            for i, j in ((a, d), (a + 1, d), (a, d + 1), (a + 1, d + 1)):
+                acc = self.nodes[i][j]
+                stop = min(acc.count + runs, limit)
+                if stop <= acc.count:
+                    continue
+                added += stop - acc.count
+                acc.merge(simulate_chunk(self.engine, self.players, self.enemies, self.attack_values[i],
+                                         self.defense_values[j], self.seed, acc.count, stop))
+                refined.append((i, j, acc.means(), tuple(v / acc.count for v in acc.variances())))
+            # Simulate without the lock so predictions keep answering, then publish all corners at once
+            with self._lock:
+                for i, j, means, errors in refined:
+                    self.means[i][j] = means
+                    self.errors[i][j] = errors
+        return added
+
+    @staticmethod
+    def _cell(values, x):
+        """Index i of the cell [values[i], values[i+1]] holding x (clamped to the grid) and the position t in it."""
+        x = min(max(x, values[0]), values[-1])
+        i = min(bisect_right(values, x) - 1, len(values) - 2)
+        return i, (x - values[i]) / (values[i + 1] - values[i])
+
+    def _jump(self, m, a, d, along_attack):
+        """Absolute change of metric m across the grid cell edge starting at node (a, d) along one axis."""
+        if along_attack:
+            return abs(self.means[a + 1][d][m] - self.means[a][d][m])
+        return abs(self.means[a][d + 1][m] - self.means[a][d][m])
+
+    def predict(self, attack_multiplier, defense_multiplier):
+        """Interpolated metric means and their uncertainty at a multiplier pair.
+
+        The uncertainty (one standard deviation) is a conservative bound: the largest standard error
+        of the four corner nodes plus the interpolation error. Every node shares the master seed, so
+        the corners' errors are positively correlated and can add up rather than cancel; the
+        weighted sum of their standard errors is the fully correlated worst case, and the largest
+        one bounds it. Stats are truncated to integers, so metrics are step functions of the
+        multipliers and may jump anywhere inside a cell; for a jump at a uniformly random position
+        the RMS error of linear interpolation is sqrt(t(1 - t)) times the jump. It vanishes at the
+        nodes and peaks mid-cell.
+
+        Returns:
+            tuple: (means, uncertainties), each a tuple in METRIC_NAMES order.
+        """
+        a, u = self._cell(self.attack_values, attack_multiplier)
+        d, v = self._cell(self.defense_values, defense_multiplier)
+        corners = ((a, d, (1 - u) * (1 - v)), (a + 1, d, u * (1 - v)), (a, d + 1, (1 - u) * v), (a + 1, d + 1, u * v))
+        means, uncertainties = [], []
+        with self._lock:
+            for m in range(len(METRIC_NAMES)):
+                means.append(sum(w * self.means[i][j][m] for i, j, w in corners))
+                sampling = max(self.errors[i][j][m] for i, j, w in corners if w) ** 0.5
+                interpolation = ((u * (1 - u)) ** 0.5 * max(self._jump(m, a, j, True) for j in (d, d + 1))
+                                 + (v * (1 - v)) ** 0.5 * max(self._jump(m, i, d, False) for i in (a, a + 1)))
+                uncertainties.append(sampling + interpolation)
+        return tuple(means), tuple(uncertainties)
+
+class SurrogateBuilder:
+    """Builds a SurrogateGrid for every registered scenario in a background thread.
+
+    get() returns a scenario's grid as soon as it is ready and None before that, so callers
+    can fall back to a real simulation while the grids are still being built. refine() queues a
+    SurrogateGrid.refine() for the same thread, so callers never wait on the extra fights.
+    """
+
+    def __init__(self, scenario_names=None, **options):
+        """Prepare to build grids for scenario_names (default: every registered scenario); options go to build()."""
+        self.scenario_names = list(scenario_names or SCENARIOS)
+        self.options = options
+        self.grids = {}
+        self.error = None
+        self._thread = None
+        self._started = False
+        self._pending = deque()  # (grid, attack multiplier, defense multiplier) waiting to be refined
+        self._lock = threading.Lock()  # Guards _thread and _pending
+
+    def start(self):
+        """Start building in a daemon thread (once); returns self."""
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self._spawn(build=True)
+        return self
+
+    def _spawn(self, build):
+        """Start the worker thread; called with _lock held."""
+        self._thread = threading.Thread(target=self._work, args=(build,), name="surrogate-builder", daemon=True)
+        self._thread.start()
+
+    def _work(self, build):
+        """Build the grids if asked, then refine queued cells until none are left."""
+        if build:
+            self._build_all()
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                grid, attack_multiplier, defense_multiplier = self._pending.popleft()
+            try:
+                grid.refine(attack_multiplier, defense_multiplier)
+            except Exception as exc:  # Same as a failed build: reported, never raised into the UI
+                self.error = exc
+
+    def _build_all(self):
+        """Build each scenario's grid in turn, publishing it as soon as it is done."""
+        try:
+            for name in self.scenario_names:
+                scenario = SCENARIOS[name]
+                self.grids[name] = SurrogateGrid.build(*build_participants(scenario), **self.options)
+        except Exception as exc:  # Surfaced through .error; the UI keeps working with real simulations
+            self.error = exc
+
+    def get(self, name):
+        """The scenario's grid, or None while it is still being built."""
+        return self.grids.get(name)
+
+    def refine(self, name, attack_multiplier, defense_multiplier):
+        """Queue a refinement of the scenario's grid around a multiplier pair on the builder thread.
+
+        Returns:
+            bool: True if it was queued, False while the scenario's grid is not built yet.
+        """
+        grid = self.get(name)
+        if grid is None:
+            return False
+        with self._lock:
+            self._pending.append((grid, attack_multiplier, defense_multiplier))
+            if self._thread is None:
+                self._spawn(build=False)
+        return True
+
+    def join(self, timeout=None):
+        """Wait for the builder thread to finish building and refining."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    @property
+    def ready(self):
+        """Number of scenarios whose grid is available."""
+        return len(self.grids)
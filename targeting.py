@@ -0,0 +1,193 @@
+import heapq
+import random
+from combat_jit import fight_metrics
+
+# Targeting policies a participant can use (Participant.targeting; None means 'random')
+POLICIES = ('random', 'lowest_hp', 'highest_threat', 'focus_fire', 'weighted_random')
+
+class Fenwick:
+    """Binary indexed tree over non-negative integer weights: O(log n) updates, prefix sums and sampling."""
+
+    def __init__(self, weights):
+        """Build the tree from a list of weights in O(n)."""
+        self.size = len(weights)
+        self.tree = [0] + list(weights)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(weights)
+        self._top = 1 << self.size.bit_length()
+
+    def add(self, index, delta):
+        """Add delta to the weight at index."""
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """Return the smallest index whose prefix sum exceeds value (0 <= value < total)."""
+        pos = 0
+        step = self._top
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= value:
+                pos = nxt
+                value -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+class SideTargets:
+    """Indexed view of one side's living participants for target selection.
+
+    Positions are the side's slots in order (0 .. count-1). Every query and update is O(log n):
+    Fenwick trees for uniform and attack-weighted sampling, and lazily invalidated heaps for the
+    lowest-HP and highest-threat targets (stale entries are skipped when they reach the top).
+    """
+
+    def __init__(self, hp, attack):
+        """Index count participants with the given current HP and attack stats."""
+        self.hp = list(hp)
+        self.threat = [0] * len(hp)
+        self.alive = Fenwick([1] * len(hp))
+        self.weights = [max(1, a) for a in attack]
+        self.weighted = Fenwick(self.weights)
+        self.by_hp = [(h, i) for i, h in enumerate(self.hp)]
+        heapq.heapify(self.by_hp)
+        self.by_threat = [(0, i) for i in range(len(hp))]
+        self.focus = None
+
+    @property
+    def count(self):
+        """Number of living participants."""
+        return self.alive.total
+
+    def damage(self, position, new_hp):
+        """Record a participant's new HP, removing it from every index when it reaches 0."""
+        self.hp[position] = new_hp
+        if new_hp == 0:
+            self.alive.add(position, -1)
+            self.weighted.add(position, -self.weights[position])
+        else:
+            heapq.heappush(self.by_hp, (new_hp, position))
+
+    def add_threat(self, position, amount):
+        """Add damage dealt by a participant of this side to its threat."""
+        self.threat[position] += amount
+        heapq.heappush(self.by_threat, (-self.threat[position], position))
+
+    def pick(self, policy, rng):
+        """Return the position of the target chosen by policy (the side must have a living member)."""
+        if policy == 'random':
+            # randrange(count) draws exactly like random.choice over the living list in slot order
+            return self.alive.find(rng.randrange(self.alive.total))
+        if policy == 'lowest_hp':
+            heap = self.by_hp
+            while heap[0][0] != self.hp[heap[0][1]] or self.hp[heap[0][1]] == 0:
+                heapq.heappop(heap)
+            return heap[0][1]
+        if policy == 'highest_threat':
+            heap = self.by_threat
+            while -heap[0][0] != self.threat[heap[0][1]] or self.hp[heap[0][1]] == 0:
+                heapq.heappop(heap)
+            return heap[0][1]
+        if policy == 'focus_fire':
+            if self.focus is None or self.hp[self.focus] == 0:
+                self.focus = self.alive.find(rng.randrange(self.alive.total))
+            return self.focus
+        if policy == 'weighted_random':
+            return self.weighted.find(rng.randrange(self.weighted.total))
+        raise ValueError(f"Unknown targeting policy '{policy}'. Choose from: {', '.join(POLICIES)}")
+
+def _fight(max_hp, attacks, attack_values, defense_values, order, num_players, policies, rng, party_hp=None):
+    """Fight kernel choosing each attacker's target with its policy in O(log n) per turn.
+
+    Damage is computed per blow from scaled attack and defense values rather than from a damage
+    matrix, so setup stays O(n) for large hordes. With every policy 'random' it consumes rng
+    exactly like combat.simulate_combat.
+    """
+    hp = list(max_hp)
+    sides = (SideTargets(max_hp[:num_players], attacks[:num_players]),
+             SideTargets(max_hp[num_players:], attacks[num_players:]))
+    offsets = (0, num_players)
+
+    rounds = 0
+    damage_by_players = 0
+    damage_by_enemies = 0
+    tension_count = 0
+    total_turns = 0
+    damage_distribution = {}
+
+    while sides[0].count and sides[1].count:
+        rounds += 1
+        for i in order:
+            if hp[i] == 0:
+                continue
+            own = 0 if i < num_players else 1
+            targets = sides[1 - own]
+            if not targets.count:
+                continue
+            position = targets.pick(policies[i], rng)
+            j = position + offsets[1 - own]
+            dealt = max(1, attack_values[i] - defense_values[j])
+            hp[j] = max(0, hp[j] - dealt)
+            targets.damage(position, hp[j])
+            sides[own].add_threat(i - offsets[own], dealt)
+            damage_distribution[dealt] = damage_distribution.get(dealt, 0) + 1
+            total_turns += 1
+            if hp[i] / max_hp[i] < 0.2:
+                tension_count += 1
+            if own == 0:
+                damage_by_players += dealt
+            else:
+                damage_by_enemies += dealt
+
+    if party_hp is not None:
+        party_hp.append(sum(hp[:num_players]))
+    return fight_metrics(sides[0].count > 0, rounds, damage_by_players, damage_by_enemies, tension_count,
+                         total_turns, damage_distribution.values(), 0, sides[0].count)
+
+def policies_for(participants):
+    """Each participant's targeting policy, validated."""
+    policies = [getattr(p, 'targeting', None) or 'random' for p in participants]
+    for policy in policies:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown targeting policy '{policy}'. Choose from: {', '.join(POLICIES)}")
+    return policies
+
+def simulate_combat(players, enemies, attack_multiplier=1.0, defense_multiplier=1.0, rng=random, party_hp=None):
+    """Simulate a single fight where every participant targets by its policy (Participant.targeting).
+
+    Policies: 'random' (like the reference), 'lowest_hp', 'highest_threat' (whoever has dealt the
+    most damage this fight), 'focus_fire' (the whole side hits one target until it falls) and
+    'weighted_random' (chance proportional to attack stat). Participants are not modified.
+
+    Returns:
+        tuple: Same metrics as combat.simulate_combat.
+    """
+    return simulate_runs(players, enemies, attack_multiplier, defense_multiplier, [None], rng, party_hp)[0]
+
+def simulate_runs(players, enemies, attack_multiplier, defense_multiplier, seeds, rng=None, party_hp=None):
+    """Run one policy-driven fight per seed and return the metric tuples.
+
+    rng is reseeded before each fight; a seed of None keeps drawing from it instead.
+    If party_hp is a list, the players' remaining HP after each fight is appended to it.
+    """
+    participants = list(players) + list(enemies)
+    policies = policies_for(participants)
+    max_hp = [p.max_hp for p in participants]
+    attacks = [p.attack for p in participants]
+    attack_values = [int(p.attack * attack_multiplier) for p in participants]
+    defense_values = [int(p.defense * defense_multiplier) for p in participants]
+    # Same stable speed ordering as combat.simulate_combat
+    order = sorted(range(len(participants)), key=lambda i: participants[i].speed, reverse=True)
+    rng = rng or random.Random()
+    results = []
+    for seed in seeds:
+        if seed is not None:
+            rng.seed(seed)
+        results.append(_fight(max_hp, attacks, attack_values, defense_values, order, len(players), policies, rng,
+                              party_hp))
+    return results
@@ -0,0 +1,326 @@
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from accumulators import METRIC_NAMES
+
+THROUGHPUT_WINDOW = 10.0  # Seconds of history behind the current fights/sec and rounds/sec
+STALL_AFTER = 30.0  # A worker busy on one chunk, or silent while work remains, this long is reported as stalled
+JOB_HISTORY = 20  # Finished jobs kept for display; older ones are dropped so memory stays bounded
+RECORD_STRIDE = 100  # Fights between updates from run-by-run loops such as combat.run_multiple_simulations
+
+def describe_batch(players, enemies, attack_multiplier, defense_multiplier, seed=None, job=None):
+    """Job label for a batch, e.g. '[2] Warrior, Mage vs Goblin x3 | atk 1.5 | def 1.0 | seed 7'.
+
+    Telemetry tracks jobs by label, so the seed and the job's name (when given) are part of it:
+    two batches of the same fight in one run would otherwise overwrite each other's progress.
+    """
+    def side(participants):
+        counts = OrderedDict()
+        for p in participants:
+            counts[p.name] = counts.get(p.name, 0) + 1
+        return ', '.join(name if n == 1 else f"{name} x{n}" for name, n in counts.items())
+    label = f"{side(players)} vs {side(enemies)} | atk {attack_multiplier} | def {defense_multiplier}"
+    if seed is not None:
+        label += f" | seed {seed}"
+    return label if job is None else f"[{job}] {label}"
+
+class Telemetry:
+    """Thread-safe live progress and throughput of simulation jobs.
+
+    Engines report completed fights with record(); the distributed broker also reports which
+    worker holds which chunk and how deep the queue is. snapshot() turns that into rates, ETA,
+    per-worker utilisation and stall flags, and is what the terminal view, the Gradio panel and
+    the Prometheus endpoint all read. Throughput is measured in fights and combat rounds, the
+    units every engine's accumulator sums; individual turns are not reported, because the metric
+    tuple the engines share carries no turn count and adding one would change it for every engine
+    and caller. Memory is bounded: a window of rate samples, the workers seen, and at most
+    JOB_HISTORY finished jobs.
+    """
+
+    def __init__(self, window=THROUGHPUT_WINDOW, stall_after=STALL_AFTER, clock=time.monotonic):
+        """Start with no jobs; clock is injectable for tests."""
+        self._lock = threading.Lock()
+        self._clock = clock
+        self.window = window
+        self.stall_after = stall_after
+        self.started = clock()
+        self.fights = 0
+        self.rounds = 0
+        self.pending = 0
+        self.leased = 0
+        self._samples = deque([(self.started, 0, 0)])  # (time, fights, rounds) within the window
+        self._jobs = OrderedDict()  # name -> {'total', 'fights', 'means', 'finished'}
+        self._workers = {}  # id -> {'first_seen', 'last_seen', 'busy_since', 'busy_seconds', 'chunks'}
+
+    def start_job(self, name, total_fights, completed=0):
+        """Register a job of total_fights fights, completed of which were already done (e.g. from a checkpoint)."""
+        with self._lock:
+            self._jobs.pop(name, None)
+            self._jobs[name] = {'total': total_fights, 'fights': completed, 'means': None, 'finished': False}
+            self._trim_jobs()
+
+    def record(self, name, fights, rounds, means=None):
+        """Count fights (and their total rounds) completed for job name; means is the job's running metric means."""
+        with self._lock:
+            now = self._clock()
+            self.fights += fights
+            self.rounds += rounds
+            self._samples.append((now, self.fights, self.rounds))
+            self._prune(now)
+            job = self._jobs.get(name)
+            if job is not None:
+                job['fights'] += fights
+                if means is not None:
+                    job['means'] = tuple(means)
+
+    def _prune(self, now):
+        """Drop rate samples older than the window except the newest of them, the rate baseline (lock held)."""
+        while len(self._samples) > 1 and self._samples[1][0] <= now - self.window:
+            self._samples.popleft()
+
+    def finish_job(self, name):
+        """Mark job name as done."""
+        with self._lock:
+            if name in self._jobs:
+                self._jobs[name]['finished'] = True
+                self._trim_jobs()
+
+    def _trim_jobs(self):
+        """Drop the oldest finished jobs beyond JOB_HISTORY (call with the lock held)."""
+        finished = [name for name, job in self._jobs.items() if job['finished']]
+        for name in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self._jobs[name]
+
+    def _worker(self, worker_id, now):
+        """State of a worker, created on first sight (call with the lock held)."""
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            worker = self._workers[worker_id] = {'first_seen': now, 'last_seen': now, 'busy_since': None,
+                                                 'busy_seconds': 0.0, 'chunks': 0}
+        worker['last_seen'] = now
+        return worker
+
+    def worker_seen(self, worker_id):
+        """Note that a worker is alive (e.g. it asked for work)."""
+        with self._lock:
+            self._worker(worker_id, self._clock())
+
+    def worker_busy(self, worker_id):
+        """Note that a worker started a chunk."""
+        with self._lock:
+            now = self._clock()
+            worker = self._worker(worker_id, now)
+            if worker['busy_since'] is not None:
+                worker['busy_seconds'] += now - worker['busy_since']
+            worker['busy_since'] = now
+
+    def worker_idle(self, worker_id, completed=True):
+        """Note that a worker finished (or, with completed=False, gave up) its chunk."""
+        with self._lock:
+            now = self._clock()
+            worker = self._worker(worker_id, now)
+            if worker['busy_since'] is not None:
+                worker['busy_seconds'] += now - worker['busy_since']
+                worker['busy_since'] = None
+            worker['chunks'] += completed
+
+    def set_queue(self, pending, leased=0):
+        """Chunks waiting to be handed out and chunks currently being simulated."""
+        with self._lock:
+            self.pending = pending
+            self.leased = leased
+
+    def snapshot(self):
+        """Current state as plain data.
+
+        Returns:
+            dict: Totals ('fights', 'rounds', 'elapsed'), windowed and average rates, queue depth,
+            'eta_seconds' (None while nothing is running), 'workers' (id -> utilisation, chunks,
+            busy, seconds_since_seen, stalled) and 'jobs' (name -> total, fights, progress,
+            finished and the latest metric means by name).
+        """
+        with self._lock:
+            now = self._clock()
+            self._prune(now)
+            base_time, base_fights, base_rounds = self._samples[0]
+            span = now - base_time
+            fights_rate = (self.fights - base_fights) / span if span > 0 else 0.0
+            rounds_rate = (self.rounds - base_rounds) / span if span > 0 else 0.0
+            elapsed = now - self.started
+            remaining = sum(max(0, job['total'] - job['fights']) for job in self._jobs.values() if not job['finished'])
+            workers = {}
+            for worker_id, w in self._workers.items():
+                busy = w['busy_since'] is not None
+                busy_seconds = w['busy_seconds'] + (now - w['busy_since'] if busy else 0.0)
+                lifetime = now - w['first_seen']
+                silent = now - w['last_seen']
+                workers[worker_id] = {
+                    'utilisation': busy_seconds / lifetime if lifetime > 0 else float(busy),
+                    'chunks': w['chunks'],
+                    'busy': busy,
+                    'seconds_since_seen': silent,
+                    'stalled': (busy and now - w['busy_since'] > self.stall_after)
+                               or (silent > self.stall_after and (self.pending > 0 or self.leased > 0)),
+                }
+            jobs = {name: {'total': job['total'], 'fights': job['fights'],
+                           'progress': job['fights'] / job['total'] if job['total'] else 1.0,
+                           'finished': job['finished'],
+                           'means': None if job['means'] is None else dict(zip(METRIC_NAMES, job['means']))}
+                    for name, job in self._jobs.items()}
+            return {
+                'elapsed': elapsed,
+                'fights': self.fights,
+                'rounds': self.rounds,
+                'fights_per_second': fights_rate,
+                'rounds_per_second': rounds_rate,
+                'average_fights_per_second': self.fights / elapsed if elapsed > 0 else 0.0,
+                'pending': self.pending,
+                'leased': self.leased,
+                'eta_seconds': remaining / fights_rate if remaining and fights_rate > 0 else None,
+                'workers': workers,
+                'jobs': jobs,
+            }
+
+def _label(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_prometheus(snapshot):
+    """Render a snapshot in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP rpg_combat_{name} {help_text}")
+        lines.append(f"# TYPE rpg_combat_{name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(v)}"' for key, v in labels.items())
+            value = 'NaN' if value is None else repr(float(value))
+            lines.append(f"rpg_combat_{name}{{{label_text}}} {value}" if label_text else f"rpg_combat_{name} {value}")
+
+    metric('fights_total', 'counter', "Fights simulated.", [({}, snapshot['fights'])])
+    metric('rounds_total', 'counter', "Combat rounds simulated.", [({}, snapshot['rounds'])])
+    metric('fights_per_second', 'gauge', "Fights per second over the recent window.",
+           [({}, snapshot['fights_per_second'])])
+    metric('rounds_per_second', 'gauge', "Combat rounds per second over the recent window.",
+           [({}, snapshot['rounds_per_second'])])
+    metric('queue_pending', 'gauge', "Chunks waiting to be handed out.", [({}, snapshot['pending'])])
+    metric('queue_leased', 'gauge', "Chunks being simulated.", [({}, snapshot['leased'])])
+    metric('eta_seconds', 'gauge', "Estimated seconds until every running job finishes.",
+           [({}, snapshot['eta_seconds'])])
+    workers = snapshot['workers']
+    metric('worker_utilisation', 'gauge', "Share of its lifetime a worker spent simulating.",
+           [({'worker': w}, s['utilisation']) for w, s in workers.items()])
+    metric('worker_chunks_total', 'counter', "Chunks a worker completed.",
+           [({'worker': w}, s['chunks']) for w, s in workers.items()])
+    metric('worker_seconds_since_seen', 'gauge', "Seconds since a worker last contacted the coordinator.",
+           [({'worker': w}, s['seconds_since_seen']) for w, s in workers.items()])
+    metric('worker_stalled', 'gauge', "1 if a worker is stuck on a chunk or silent while work remains.",
+           [({'worker': w}, int(s['stalled'])) for w, s in workers.items()])
+    jobs = snapshot['jobs']
+    metric('job_progress_ratio', 'gauge', "Share of a job's fights completed.",
+           [({'job': j}, s['progress']) for j, s in jobs.items()])
+    metric('job_metric_mean', 'gauge', "Running mean of a fight metric for a job.",
+           [({'job': j, 'metric': m}, v) for j, s in jobs.items() if s['means'] for m, v in s['means'].items()])
+    return '\n'.join(lines) + '\n'
+
+def _duration(seconds):
+    """Format seconds as h:mm:ss, or '--' when unknown."""
+    if seconds is None or math.isinf(seconds):
+        return '--'
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def format_status(snapshot, max_jobs=5):
+    """Render a snapshot as a few lines of plain text for the terminal or the UI."""
+    lines = [f"{snapshot['fights']:,} fights in {_duration(snapshot['elapsed'])} | "
+             f"{snapshot['fights_per_second']:,.0f} fights/s, {snapshot['rounds_per_second']:,.0f} rounds/s "
+             f"(average {snapshot['average_fights_per_second']:,.0f} fights/s) | "
+             f"queue {snapshot['pending']} pending, {snapshot['leased']} running | "
+             f"ETA {_duration(snapshot['eta_seconds'])}"]
+    for worker_id, w in sorted(snapshot['workers'].items()):
+        state = 'STALLED' if w['stalled'] else 'busy' if w['busy'] else 'idle'
+        lines.append(f"  worker {worker_id}: {state}, {w['utilisation']:.0%} utilised, {w['chunks']} chunks, "
+                     f"seen {w['seconds_since_seen']:.0f}s ago")
+    running = [(name, job) for name, job in snapshot['jobs'].items() if not job['finished']]
+    for name, job in running[:max_jobs]:
+        line = f"  {name}: {job['progress']:.0%} of {job['total']:,}"
+        if job['means']:
+            line += f" | victory {job['means']['victory']:.2%}, rounds {job['means']['rounds']:.2f}"
+        lines.append(line)
+    if len(running) > max_jobs:
+        lines.append(f"  ... and {len(running) - max_jobs} more jobs")
+    return '\n'.join(lines)
+
+class LiveView:
+    """Redraws format_status in place every interval seconds from a background thread."""
+
+    def __init__(self, telemetry, interval=1.0, stream=None):
+        """Prepare a view of telemetry written to stream (default: stderr, so stdout stays clean)."""
+        self.telemetry = telemetry
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self._stop = threading.Event()
+        self._thread = None
+        self._lines = 0
+
+    def _draw(self):
+        """Replace the previous frame with the current status (appends instead when not a terminal)."""
+        text = format_status(self.telemetry.snapshot())
+        if self._lines and self.stream.isatty():
+            self.stream.write(f"\x1b[{self._lines}F\x1b[J")  # Cursor up to the frame's start, clear below
+        self.stream.write(text + '\n')
+        self.stream.flush()
+        self._lines = text.count('\n') + 1
+
+    def _run(self):
+        """Draw until stopped."""
+        while not self._stop.wait(self.interval):
+            self._draw()
+
+    def start(self):
+        """Start redrawing; returns self."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry-view", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop redrawing and draw the final state once."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._draw()
+
+def serve_metrics(telemetry, address=('127.0.0.1', 0)):
+    """Serve telemetry at http://host:port/metrics in Prometheus text format from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server; .server_address is the bound (host, port) and
+        .shutdown() stops it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only needed when serving
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        """Answers GET /metrics; everything else is 404."""
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = format_prometheus(telemetry.snapshot()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the terminal
+
+    server = ThreadingHTTPServer(address, _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="telemetry-http", daemon=True).start()
+    return server
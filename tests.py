@@ -1,9 +1,21 @@
+import os
+import random
+import tempfile
+import time
 import unittest
-from combat import run_multiple_simulations
+from combat import run_multiple_simulations, simulate_combat
 from participant import Participant
+import combat_jit
+import comparison
+import distributed
+import horde
+import parallel
+import scenarios
+import tuner
+from participant import UnitGroup
+from report import write_report
 import colorama
 from colorama import Fore, Style
-from tabulate import tabulate
 
 colorama.init()
 
@@ -30,8 +42,8 @@ class TestCombatScenarios(unittest.TestCase):
     def run_scenario(self, players, enemies, scenario_name, expected_victory_range):
         """Helper method to run a scenario and store results silently."""
         (avg_victory, avg_rounds, avg_dmg_players, avg_dmg_enemies, 
-         avg_tension, avg_engagement, avg_flow, avg_dec_impact, avg_ntr) = run_multiple_simulations(
-            players, enemies, self.attack_multiplier, self.defense_multiplier
+         avg_tension, avg_engagement, avg_flow, avg_dec_impact, avg_ntr, distribution) = run_multiple_simulations(
+            players, enemies, self.attack_multiplier, self.defense_multiplier, distribution_metrics=True
         )
         
         # Store results for final report and CSV
@@ -45,7 +57,8 @@ class TestCombatScenarios(unittest.TestCase):
             'engagement_variability': avg_engagement,
             'flow_state': avg_flow,
             'decision_impact': avg_dec_impact,
-            'ntr': avg_ntr
+            'ntr': avg_ntr,
+            **distribution
         })
         
         self.assertGreaterEqual(avg_victory, expected_victory_range[0])
@@ -56,33 +69,9 @@ class TestCombatScenarios(unittest.TestCase):
         if self.test_results:
             self.print_section_header("Combat Test Results Summary")
             
-            # Prepare data for table
-            table_data = []
-            for result in self.test_results:
-                table_data.append([
-                    result['scenario'],
-                    f"{result['victory']:.2%}",
-                    f"{result['rounds']:.2f}",
-                    f"{result['dmg_players']:.2f} / {result['dmg_enemies']:.2f}",
-                    f"{result['tension_index']:.2%}",
-                    f"{result['engagement_variability']:.3f}",
-                    f"{result['flow_state']:.2f}",
-                    f"{result['decision_impact']:.2f}%",
-                    f"{result['ntr']:.2f}"
-                ])
-            
-            # Print table with tabulate
-            headers = ["Scenario", "Victory Rate", "Rounds", "Damage (P/E)", "Tension Index", 
-                      "Eng. Var.", "Flow State", "Dec. Impact", "NTR"]
-            print(tabulate(table_data, headers=headers, tablefmt="grid", maxcolwidths=[30, 12, 12, 20, 12, 12, 12, 12, 12]))
-            
-            # Save to CSV for model training
-            import csv
-            with open('combat_results.csv', 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
-                writer.writeheader()
-                for row in table_data:
-                    writer.writerow(dict(zip(headers, row)))
+            # Stream rows to the CSV; only a bounded preview is kept for the table
+            writer = write_report(self.test_results, csv_path='combat_results.csv')
+            print(writer.table(tablefmt="grid", maxcolwidths=[30, 12, 12, 20, 12, 12, 12, 12, 12, 12, 20, 12]))
             
             print("\nResults saved to 'combat_results.csv' for model training.")
             
@@ -135,4 +124,873 @@ class TestCombatScenarios(unittest.TestCase):
         self.defense_multiplier = 0.8  # Adjusted to balance difficulty
         warrior = Participant("Warrior", 50, 10, 5, 10)
         imps = [Participant("Imp", 15, 4, 1, 7) for _ in range(5)]
-        self.run_scenario([warrior], imps, "Attrition Test (Extreme)", (0.9, 1.0))
\ No newline at end of file
+        self.run_scenario([warrior], imps, "Attrition Test (Extreme)", (0.9, 1.0))
+
+class TestCompiledEngine(unittest.TestCase):
+    """Checks the compiled combat engine against the reference simulate_combat."""
+
+    def _party_vs_mob(self):
+        """Build fresh participants for the Party vs. Mob scenario."""
+        players = [Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 12)]
+        enemies = [Participant("Goblin", 20, 5, 2, 8) for _ in range(3)]
+        return players, enemies
+
+    def test_python_kernel_matches_reference_per_fight(self):
+        """The pure-Python kernel replays the reference fight exactly for the same seed."""
+        for seed in range(100):
+            random.seed(seed)
+            expected = simulate_combat(*self._party_vs_mob(), 1.5, 1.0)
+            random.seed(seed)
+            actual = combat_jit.simulate_combat(*self._party_vs_mob(), 1.5, 1.0, use_jit=False)
+            self.assertEqual(expected, actual)
+
+    @unittest.skipUnless(combat_jit.HAVE_NUMBA, "Numba is not installed")
+    def test_jit_batch_matches_reference_statistically(self):
+        """The Numba batch kernel reproduces the reference averages within sampling error."""
+        players, enemies = self._party_vs_mob()
+        reference = run_multiple_simulations(players, enemies, 1.0, 1.0, num_runs=4000)
+        compiled = combat_jit.run_multiple_simulations(players, enemies, 1.0, 1.0, num_runs=4000, seed=7)
+        self.assertAlmostEqual(reference[0], compiled[0], delta=0.05)  # Victory rate
+        self.assertAlmostEqual(reference[1], compiled[1], delta=0.2)   # Rounds
+
+class TestUnitGroups(unittest.TestCase):
+    """Checks the group-granularity engine used for horde encounters."""
+
+    def test_singleton_groups_match_reference(self):
+        """Groups of one replay the reference fight exactly for the same seed."""
+        for seed in range(100):
+            players = [Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 12)]
+            enemies = [Participant("Goblin", 20, 5, 2, 8) for _ in range(3)]
+            random.seed(seed)
+            expected = simulate_combat(players, enemies, 1.5, 1.0)
+            random.seed(seed)
+            players = [Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 12)]
+            enemies = [Participant("Goblin", 20, 5, 2, 8) for _ in range(3)]
+            actual = horde.simulate_group_combat([UnitGroup.from_participant(p) for p in players],
+                                                 [UnitGroup.from_participant(e) for e in enemies], 1.5, 1.0)
+            self.assertEqual(expected, actual)
+
+    def test_group_participants_merges_identical_units(self):
+        """Identical stat blocks collapse into one group with the right headcount."""
+        imps = [Participant("Imp", 15, 4, 1, 7) for _ in range(5)]
+        groups = horde.group_participants([Participant("Warrior", 50, 10, 5, 10)] + imps)
+        self.assertEqual([(g.name, g.count) for g in groups], [("Warrior", 1), ("Imp", 5)])
+
+    def test_strike_moves_one_member_between_hp_levels(self):
+        """A blow wounds or kills exactly one member and leaves the rest untouched."""
+        group = UnitGroup("Imp", 15, 4, 1, 7, 4)
+        self.assertFalse(group.strike(2, 10))
+        self.assertEqual(group.levels, {15: 3, 5: 1})
+        self.assertTrue(group.strike(3, 10))  # Index 3 is the wounded imp, after the three at full HP
+        self.assertEqual((group.levels, group.alive_count, group.total_hp), ({15: 3}, 3, 45))
+        self.assertEqual(group.count_below(0.2), 0)
+
+    def test_multi_member_groups_match_reference_distribution(self):
+        """Groups with several members pass the TOST check on every metric against the reference."""
+        import conformance
+        wave = scenarios.load_scenario_file('scenario_files/wave_battle.json')[0]
+        for scenario in (scenarios.SCENARIOS["Party vs. Mob"], wave):
+            result = conformance.check_engine('group (multi-member)', scenario, statistical_runs=4000)
+            self.assertTrue(result.passed, f"{scenario.name}: {result.detail}")
+
+class TestAbilities(unittest.TestCase):
+    """Checks the ability engine's opcode kernels."""
+
+    def test_default_behavior_matches_reference_per_fight(self):
+        """With plain attacks the Python ability kernel reproduces combat.simulate_combat for the same seed."""
+        import abilities
+        for name, scenario in scenarios.SCENARIOS.items():
+            encounter = abilities.compile_abilities(*scenarios.build_participants(name), scenario.attack_multiplier,
+                                                    scenario.defense_multiplier)
+            for seed in range(50):
+                expected = simulate_combat(*scenarios.build_participants(name), scenario.attack_multiplier,
+                                           scenario.defense_multiplier, random.Random(seed))
+                self.assertEqual(abilities.simulate_runs(encounter, [seed], use_jit=False)[0], expected, name)
+
+    def test_jit_kernel_matches_python_kernel_statistically(self):
+        """Both ability kernels agree on an encounter using every opcode, and decisions now shift."""
+        import abilities
+        scenario = scenarios.load_scenario_file('scenario_files/ability_party.json')[0]
+        encounter = abilities.compile_abilities(*scenarios.build_participants(scenario))
+        self.assertEqual(set(op for row in encounter.opcodes for op in row), set(range(len(abilities.OPCODE_NAMES))))
+        seeds = [parallel.run_seed(1, i) for i in range(4000)]
+        python = parallel.MetricAccumulator()
+        for result in abilities.simulate_runs(encounter, seeds, use_jit=False):
+            python.add(result)
+        jit = parallel.MetricAccumulator()
+        for result in abilities.simulate_runs(encounter, seeds):
+            jit.add(result)
+        for m in (1, 2, 3, 7):  # Rounds, damage and decision impact
+            tolerance = 4 * (python.variances()[m] / python.count) ** 0.5 * 2 ** 0.5 + 1e-9
+            self.assertAlmostEqual(python.means()[m], jit.means()[m], delta=tolerance)
+        self.assertGreater(python.means()[7], 0)
+
+class TestTargeting(unittest.TestCase):
+    """Checks indexed targeting policies."""
+
+    def test_random_policy_matches_reference_per_fight(self):
+        """Fenwick-indexed uniform targeting draws exactly like random.choice in combat.simulate_combat."""
+        import targeting
+        for name, scenario in scenarios.SCENARIOS.items():
+            seeds = list(range(50))
+            results = targeting.simulate_runs(*scenarios.build_participants(name), scenario.attack_multiplier,
+                                              scenario.defense_multiplier, seeds)
+            for seed, result in zip(seeds, results):
+                expected = simulate_combat(*scenarios.build_participants(name), scenario.attack_multiplier,
+                                           scenario.defense_multiplier, random.Random(seed))
+                self.assertEqual(result, expected, name)
+
+    def test_indexed_picks_match_linear_scans(self):
+        """Heaps and Fenwick trees pick the same targets as brute-force scans while units take damage and die."""
+        import targeting
+        rng = random.Random(3)
+        hp = [rng.randint(5, 40) for _ in range(60)]
+        attack = [rng.randint(1, 12) for _ in range(60)]
+        side = targeting.SideTargets(hp, attack)
+        threat = [0] * 60
+        while side.count:
+            living = [i for i in range(60) if hp[i] > 0]
+            self.assertEqual(side.pick('lowest_hp', rng), min(living, key=lambda i: (hp[i], i)))
+            self.assertEqual(side.pick('highest_threat', rng), min(living, key=lambda i: (-threat[i], i)))
+            draw = rng.randrange(sum(attack[i] for i in living))
+            cumulative = 0
+            for i in living:
+                cumulative += attack[i]
+                if draw < cumulative:
+                    break
+            self.assertEqual(side.weighted.find(draw), i)
+            victim = rng.choice(living)
+            hp[victim] = max(0, hp[victim] - rng.randint(1, 15))
+            side.damage(victim, hp[victim])
+            dealer = rng.choice(living)
+            threat[dealer] += 3
+            side.add_threat(dealer, 3)
+
+class TestEventScheduler(unittest.TestCase):
+    """Checks the event-driven initiative scheduler."""
+
+    def test_equal_speeds_match_reference_per_fight(self):
+        """When everyone is equally fast, the event queue replays the round-based reference exactly."""
+        import scheduler
+        for seed in range(100):
+            party = [Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 10)]
+            mob = [Participant("Goblin", 20, 5, 2, 10) for _ in range(4)]
+            expected = simulate_combat(party, mob, 1.0, 1.0, random.Random(seed))
+            party = [Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 10)]
+            mob = [Participant("Goblin", 20, 5, 2, 10) for _ in range(4)]
+            self.assertEqual(scheduler.simulate_runs(party, mob, 1.0, 1.0, [seed])[0], expected)
+
+    def test_faster_units_act_more_often(self):
+        """A unit twice as fast gets two actions for each of the slower unit's."""
+        import scheduler
+        hare = Participant("Hare", 100, 1, 0, 20)
+        tortoise = Participant("Tortoise", 100, 1, 0, 10)
+        victory, rounds, dmg_players, dmg_enemies = scheduler.simulate_runs([hare], [tortoise], 1.0, 1.0, [0])[0][:4]
+        self.assertTrue(victory)
+        self.assertEqual((dmg_players, dmg_enemies), (100, 49))
+        self.assertEqual(rounds, 100)
+        for speed in (0, 1.5, 'fast'):
+            with self.assertRaises(ValueError):
+                scheduler.simulate_runs([hare], [Participant("Snail", 100, 1, 0, speed)], 1.0, 1.0, [0])
+
+class TestConformance(unittest.TestCase):
+    """Checks the differential conformance harness between the reference and the fast engines."""
+
+    def test_exact_engines_replay_reference_on_generated_scenarios(self):
+        """Every same-stream engine matches combat.simulate_combat fight for fight where its parity holds."""
+        import conformance
+        exact = [name for name, (_, mode, _) in conformance.CHECKS.items() if mode == 'exact']
+        results = conformance.run_conformance(conformance.generate_scenarios(6, seed=5), exact, runs=100, seed=5)
+        self.assertEqual({r.engine for r in results}, set(exact))  # Every engine had an applicable scenario
+        for r in results:
+            self.assertTrue(r.passed, f"{r.engine} on {r.scenario}: {r.detail}")
+
+    def test_equivalence_test_flags_balance_changes(self):
+        """TOST accepts an independent stream of the same fights and rejects a 10% attack change."""
+        import conformance
+        scenario = scenarios.SCENARIOS["Party vs. Mob"]
+        if combat_jit.HAVE_NUMBA:
+            result = conformance.check_engine('compiled', scenario, statistical_runs=4000)
+            self.assertEqual(result.mode, 'statistical')
+            self.assertTrue(result.passed, result.detail)
+        players, enemies = scenarios.build_participants(scenario)
+        seeds = [parallel.run_seed(2, i) for i in range(4000)]
+        baseline = parallel.ENGINES['reference'](players, enemies, 1.5, 1.0, seeds)
+        buffed = parallel.ENGINES['reference'](players, enemies, 1.65, 1.0, seeds)
+        self.assertIsNotNone(conformance.exact_mismatch(baseline, buffed))
+        reference, candidate = parallel.MetricAccumulator(), parallel.MetricAccumulator()
+        for a, b in zip(baseline, buffed):
+            reference.add(a)
+            candidate.add(b)
+        self.assertFalse(all(t.equivalent for t in conformance.equivalence_test(reference, candidate)))
+
+class TestReplay(unittest.TestCase):
+    """Checks seekable replay of single fights from (seed, run index)."""
+
+    def test_replay_matches_batch_run_and_traces_every_blow(self):
+        """replay_fight reproduces any run of a seeded batch, and its trace adds up to the fight's damage."""
+        from combat import replay_fight
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        batch = parallel.ENGINES['reference'](players, enemies, 1.5, 1.0, [parallel.run_seed(4, i) for i in range(300)])
+        events = []
+        for run in (0, 137, 299):
+            events.clear()
+            self.assertEqual(replay_fight(players, enemies, 1.5, 1.0, 4, run, events.append), batch[run])
+            self.assertEqual(sum(e.damage for e in events if e.attacker.name in ("Warrior", "Mage")), batch[run][2])
+            self.assertEqual(len({e.round for e in events}), batch[run][1])
+        seeded = run_multiple_simulations(players, enemies, 1.5, 1.0, num_runs=300, seed=4)
+        self.assertEqual(seeded, parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=300, seed=4).means())
+
+class TestSurrogate(unittest.TestCase):
+    """Checks the interpolated multiplier grid behind the UI's instant estimates."""
+
+    def test_grid_reproduces_nodes_and_brackets_real_runs(self):
+        """Predictions equal simulated nodes exactly and land within their uncertainty between nodes."""
+        import surrogate
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        grid = surrogate.SurrogateGrid.build(players, enemies, (1.0, 1.5, 2.0), (0.75, 1.0, 1.25), runs=400, seed=3)
+        node = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=400, seed=3, engine='compiled')
+        self.assertEqual(grid.predict(1.5, 1.0)[0], node.means())
+        means, errors = grid.predict(1.3, 0.9)
+        real = parallel.run_parallel_simulations(players, enemies, 1.3, 0.9, num_runs=4000, seed=8, engine='compiled')
+        for m in (0, 1, 2, 3):  # Victory, rounds and damage
+            self.assertLessEqual(abs(means[m] - real.means()[m]), 3 * errors[m] + 1e-9, m)
+            # Never tighter than any corner's own sampling error
+            self.assertGreaterEqual(errors[m], max(grid.errors[i][j][m] ** 0.5 for i in (0, 1) for j in (0, 1)), m)
+        self.assertEqual(grid.predict(5.0, 0.1), grid.predict(2.0, 0.75))  # Clamped to the grid
+
+    def test_refine_extends_the_cell_corners(self):
+        """Refining adds new runs to the four corners of a cell, matching a longer build at those nodes."""
+        import surrogate
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        grid = surrogate.SurrogateGrid.build(players, enemies, (1.0, 1.5, 2.0), (0.75, 1.0, 1.25), runs=200, seed=3)
+        before = grid.errors[1][1]
+        self.assertEqual(grid.refine(1.3, 0.9, runs=600, limit=600), 4 * 400)
+        self.assertEqual(grid.refine(1.3, 0.9, runs=600, limit=600), 0)
+        longer = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=600, seed=3, engine='compiled')
+        for refined, real in zip(grid.predict(1.5, 1.0)[0], longer.means()):
+            self.assertAlmostEqual(refined, real)
+        self.assertEqual(grid.nodes[2][2].count, 200)  # Outside the refined cell
+        self.assertLess(grid.errors[1][1][3], before[3])  # Damage by enemies
+
+    def test_builder_publishes_grids_in_background(self):
+        """The background builder makes each scenario's grid available once it is simulated."""
+        import surrogate
+        builder = surrogate.SurrogateBuilder(["Solo Warrior vs. Goblin"], attack_values=(0.5, 2.0),
+                                             defense_values=(0.5, 2.0), runs=50)
+        self.assertIsNone(builder.get("Solo Warrior vs. Goblin"))
+        builder.start().join(timeout=60)
+        self.assertIsNone(builder.error)
+        self.assertEqual(builder.ready, 1)
+        grid = builder.get("Solo Warrior vs. Goblin")
+        self.assertIsNotNone(grid)
+        self.assertFalse(builder.refine("Boss Fight", 1.0, 1.0))  # Not one of its scenarios
+        self.assertTrue(builder.refine("Solo Warrior vs. Goblin", 1.0, 1.0))
+        builder.join(timeout=60)
+        self.assertIsNone(builder.error)
+        self.assertEqual([acc.count for row in grid.nodes for acc in row], [50 + surrogate.GRID_RUNS] * 4)
+
+class TestSensitivity(unittest.TestCase):
+    """Checks the Sobol sensitivity analysis over participant stats."""
+
+    def test_estimators_recover_known_indices(self):
+        """On f = 4 x0 + 2 x1 (x2 inert) the indices approach the exact 0.8, 0.2 and 0."""
+        import sensitivity
+        points = sensitivity.scrambled_halton(512, 6, seed=1)
+        f = lambda x: 4 * x[0] + 2 * x[1]
+        a, b = [p[:3] for p in points], [p[3:] for p in points]
+        f_ab = [[f(ra[:i] + [rb[i]] + ra[i + 1:]) for ra, rb in zip(a, b)] for i in range(3)]
+        first, total = sensitivity._indices([f(r) for r in a], [f(r) for r in b], f_ab, range(512))
+        for estimate, exact in zip(first + total, [0.8, 0.2, 0.0] * 2):
+            self.assertAlmostEqual(estimate, exact, delta=0.03)
+
+    def test_party_vs_mob_rounds_are_driven_by_combat_stats(self):
+        """Every stat gets an index with a bracketing interval; speed barely matters, and workers don't change results."""
+        import sensitivity
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        options = dict(metrics=('rounds',), samples=64, runs=50, bootstrap=50, seed=2)
+        report = sensitivity.sobol_indices(players, enemies, 1.5, 1.0, **options)['rounds']
+        self.assertEqual(len(report), 12)  # Warrior, Mage and Goblin x 4 stats
+        for index in report:
+            self.assertLessEqual(index.total_ci[0], index.total_ci[1])
+        self.assertNotIn('speed', report[0].parameter)
+        self.assertLess(max(i.total for i in report if i.parameter.endswith('speed')), report[0].total / 10)
+        parallel_report = sensitivity.sobol_indices(players, enemies, 1.5, 1.0, workers=2, chunk_size=200, **options)
+        self.assertEqual(parallel_report['rounds'], report)
+
+class TestParallelBackend(unittest.TestCase):
+    """Checks seeding and chunk merging of the parallel simulation backend."""
+
+    def test_results_do_not_depend_on_worker_count(self):
+        """Chunks merge in order, so one worker and two workers give identical sums."""
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        single = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=2500, seed=3)
+        multi = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=2500, seed=3, workers=2)
+        self.assertEqual(single.to_dict(), multi.to_dict())
+
+    def test_reference_engine_matches_seeded_simulate_combat(self):
+        """Run i of a batch is simulate_combat with random.Random(run_seed(seed, i))."""
+        players, enemies = scenarios.build_participants("Underdog Challenge")
+        acc = parallel.run_parallel_simulations(players, enemies, 0.8, 1.2, num_runs=1, seed=11)
+        expected = simulate_combat(*scenarios.build_participants("Underdog Challenge"), 0.8, 1.2,
+                                   random.Random(parallel.run_seed(11, 0)))
+        self.assertEqual(acc.means(), expected)
+
+    def test_distribution_metrics_match_stored_runs(self):
+        """Streaming victory entropy, damage spread and round variance equal a two-pass computation."""
+        import statistics
+        from accumulators import victory_entropy
+        players, enemies = scenarios.build_participants("Boss Fight")
+        rng = random.Random(5)
+        runs = [combat_jit.simulate_combat(players, enemies, 1.0, 1.2, use_jit=False, rng=rng) for _ in range(3000)]
+        halves = [parallel.MetricAccumulator(), parallel.MetricAccumulator()]
+        for i, result in enumerate(runs):
+            halves[i % 2].add(result)
+        distribution = halves[0].merge(halves[1]).distribution()
+        self.assertAlmostEqual(distribution['victory_entropy'], victory_entropy(sum(r[0] for r in runs) / len(runs)))
+        self.assertAlmostEqual(distribution['dmg_players_std'], statistics.stdev(r[2] for r in runs))
+        self.assertAlmostEqual(distribution['dmg_enemies_std'], statistics.stdev(r[3] for r in runs))
+        self.assertAlmostEqual(distribution['rounds_variance'], statistics.variance(r[1] for r in runs))
+
+    def test_histograms_merge_across_workers_and_engines(self):
+        """Histograms are identical for any worker count and match between reference and compiled engines."""
+        from accumulators import OutcomeHistograms
+        players, enemies = scenarios.build_participants("Boss Fight")
+        template = OutcomeHistograms.for_encounter(players, enemies, 1.0, 1.2)
+        single = parallel.run_parallel_simulations(players, enemies, 1.0, 1.2, num_runs=2500, seed=2,
+                                                   histograms=template)
+        multi = parallel.run_parallel_simulations(players, enemies, 1.0, 1.2, num_runs=2500, seed=2, workers=2,
+                                                  histograms=template)
+        self.assertEqual(single.to_dict(), multi.to_dict())
+        for name in ('rounds', 'dmg_players', 'dmg_enemies', 'party_hp', 'ntr'):
+            hist = single.histograms[name]
+            self.assertEqual(sum(hist.counts), 2500, name)  # Ranges cover every possible outcome
+        if not combat_jit.HAVE_NUMBA:
+            compiled = parallel.run_parallel_simulations(players, enemies, 1.0, 1.2, num_runs=2500, seed=2,
+                                                         engine='compiled', histograms=template)
+            self.assertEqual(compiled.to_dict(), single.to_dict())
+
+    def test_slot_stats_add_up_to_side_totals(self):
+        """Per-participant damage, kills and deaths agree with side-level metrics on both kernels."""
+        from accumulators import SlotStats
+        players, enemies = scenarios.build_participants("Boss Fight")
+        encounter = combat_jit.compile_encounter(players, enemies, 1.0, 1.2)
+        seeds = [parallel.run_seed(9, i) for i in range(2000)]
+        for use_jit in (False, True):
+            slots = SlotStats.for_participants(players, enemies)
+            runs = combat_jit.simulate_runs(encounter, seeds, use_jit=use_jit, slots=slots)
+            dealt, taken, turns, deaths, death_rounds, first_deaths, kills, rounds_alive = slots.totals
+            self.assertEqual(slots.fights, len(seeds))
+            self.assertEqual(sum(dealt[:2]), sum(r[2] for r in runs))
+            self.assertEqual(sum(dealt[2:]), sum(r[3] for r in runs))
+            self.assertEqual(sum(dealt), sum(taken))
+            self.assertEqual(sum(kills), sum(deaths))
+            self.assertEqual(deaths[2], sum(1 for r in runs if r[0]))  # The dragon dies exactly when players win
+            self.assertLessEqual(sum(first_deaths[:2]), len(seeds))
+            # The dragon survives every round of the fights it doesn't die in
+            self.assertEqual(rounds_alive[2] - death_rounds[2], sum(r[1] for r in runs if not r[0]))
+        merged = parallel.run_parallel_simulations(players, enemies, 1.0, 1.2, num_runs=2500, seed=9,
+                                                   engine='compiled', workers=2, slot_stats=True)
+        single = parallel.run_parallel_simulations(players, enemies, 1.0, 1.2, num_runs=2500, seed=9,
+                                                   engine='compiled', slot_stats=True)
+        self.assertEqual(merged.slots.to_dict(), single.slots.to_dict())
+
+    def test_shared_memory_transport_matches_pickled_chunks(self):
+        """Stats and results passed through shared memory give the same sums as pickled chunks."""
+        import shared_tables
+        players, enemies = scenarios.build_participants("Attrition Test")
+        shared = shared_tables.run_shared_simulations(players, enemies, 1.5, 0.8, num_runs=2500, seed=6, workers=2)
+        pickled = parallel.run_parallel_simulations(players, enemies, 1.5, 0.8, num_runs=2500, seed=6)
+        self.assertEqual(shared.to_dict(), pickled.to_dict())
+
+class TestTuner(unittest.TestCase):
+    """Checks the automatic difficulty tuner."""
+
+    def test_tune_boss_fight_dragon_hp(self):
+        """Bisection finds a Dragon HP giving the Boss Fight a 40-60% victory rate."""
+        scenario = scenarios.SCENARIOS["Boss Fight"]
+        players, enemies = scenarios.build_participants(scenario)
+        result = tuner.tune(players, enemies, 'Dragon.hp', (1, 100), (0.4, 0.6),
+                            defense_multiplier=scenario.defense_multiplier, num_runs=1000, engine='reference')
+        self.assertTrue(result.in_band['victory'])
+        self.assertLessEqual(len(result.evaluations), 20)
+
+class TestPairedComparison(unittest.TestCase):
+    """Checks the common-random-numbers comparison mode."""
+
+    def test_paired_difference_matches_difference_of_means(self):
+        """The mean paired difference equals the difference of the two seeded batch means."""
+        players, enemies = scenarios.build_participants("Boss Fight")
+        report = comparison.compare_configurations(players, enemies, [(1.0, 1.0), (1.0, 1.25)],
+                                                   num_runs=1500, seed=5)
+        base = parallel.run_parallel_simulations(players, enemies, 1.0, 1.0, num_runs=1500, seed=5).means()
+        other = parallel.run_parallel_simulations(players, enemies, 1.0, 1.25, num_runs=1500, seed=5).means()
+        self.assertAlmostEqual(report[0]['rounds'].mean, other[1] - base[1])
+        self.assertLessEqual(report[0]['rounds'].ci_low, report[0]['rounds'].ci_high)
+
+    def test_identical_configurations_have_zero_variance(self):
+        """Replaying the same random numbers against the same settings gives exactly zero difference."""
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        report = comparison.compare_configurations(players, enemies, [(1.5, 1.0), (1.5, 1.0)], num_runs=500)
+        for difference in report[0].values():
+            self.assertEqual(difference.mean, 0.0)
+            self.assertEqual(difference.std_error, 0.0)
+
+class TestDistributedSweeps(unittest.TestCase):
+    """Checks the coordinator/worker work queue."""
+
+    def _job(self, num_runs=1200):
+        """A small Party vs. Mob job."""
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        return distributed.Job("Party vs. Mob", players, enemies, 1.5, 1.0, num_runs, 9, 'reference')
+
+    def test_failed_and_expired_chunks_are_retried(self):
+        """A reported failure and an expired lease both put the chunk back on the queue."""
+        broker = distributed.WorkBroker([self._job()], chunk_size=500)
+        first = broker.get_task("a")
+        broker.report_failure(first['task_id'], "boom", "a")
+        self.assertEqual(broker.get_task("b")['task_id'], first['task_id'])
+
+        expiring = distributed.WorkBroker([self._job()], chunk_size=500, lease_timeout=0.0)
+        held = expiring.get_task("a")
+        time.sleep(0.01)
+        self.assertEqual(expiring.get_task("b")['task_id'], held['task_id'])
+
+    def test_stale_failure_report_leaves_new_lease_alone(self):
+        """A worker whose lease expired cannot requeue the chunk out from under its new holder."""
+        broker = distributed.WorkBroker([self._job(100)], lease_timeout=0.0, max_attempts=3)
+        held = broker.get_task("a")
+        time.sleep(0.01)
+        broker.lease_timeout = 60.0
+        self.assertEqual(broker.get_task("b")['task_id'], held['task_id'])
+        broker.report_failure(held['task_id'], "late", "a")
+        status = broker.status()
+        self.assertEqual((status['leased'], status['pending']), (1, 0))
+        broker.report_failure(held['task_id'], "boom", "b")  # The holder's report still counts
+        self.assertEqual(broker.get_task("c")['task_id'], held['task_id'])
+
+    def test_chunk_is_abandoned_after_max_attempts(self):
+        """A chunk that keeps failing aborts the sweep instead of looping forever."""
+        broker = distributed.WorkBroker([self._job(100)], max_attempts=2)
+        for _ in range(2):
+            task = broker.get_task("a")
+            broker.report_failure(task['task_id'], "boom", "a")
+        self.assertEqual(broker.get_task("a")['status'], 'done')
+        with self.assertRaises(RuntimeError):
+            broker.merged_results()
+
+    def test_distributed_results_match_single_node(self):
+        """Merged worker results equal a single-node run with the same seed."""
+        job = self._job()
+        results = distributed.run_distributed([job], local_workers=2, chunk_size=500, poll_interval=0.05)
+        single = parallel.run_parallel_simulations(job.players, job.enemies, 1.5, 1.0, num_runs=job.num_runs,
+                                                   seed=job.seed, chunk_size=500)
+        self.assertEqual(results[job.name].to_dict(), single.to_dict())
+
+    def test_public_bind_needs_an_authkey(self):
+        """Without a key (argument or environment) only loopback addresses may be served."""
+        from unittest import mock
+        with mock.patch.dict('os.environ', {distributed.AUTHKEY_ENV: ''}):
+            with self.assertRaises(ValueError):
+                distributed.run_distributed([self._job(100)], address=('0.0.0.0', 0))
+            self.assertIsNone(distributed.resolve_authkey())
+        with mock.patch.dict('os.environ', {distributed.AUTHKEY_ENV: 'secret'}):
+            self.assertEqual(distributed.resolve_authkey(), b'secret')
+        self.assertTrue(distributed.is_loopback('127.0.0.1'))
+        self.assertFalse(distributed.is_loopback('0.0.0.0'))
+
+class TemporaryDirectoryMixin:
+    """Gives every test a fresh temporary directory, self.directory, removed after the test."""
+
+    def setUp(self):
+        """Create the temporary directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+class TestCheckpoints(TemporaryDirectoryMixin, unittest.TestCase):
+    """Checks checkpoint and resume of long batches and sweeps."""
+
+    def setUp(self):
+        """Use a fresh checkpoint path in a temporary directory."""
+        super().setUp()
+        self.path = f"{self.directory.name}/checkpoint.json"
+
+    def test_resumed_batch_matches_uninterrupted_run(self):
+        """A batch restarted from saved chunks (one finished out of order) ends with identical sums."""
+        from checkpoint import Checkpoint, batch_fingerprint
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        uninterrupted = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=1200, seed=5,
+                                                          chunk_size=300)
+        interrupted = Checkpoint(self.path, batch_fingerprint(players, enemies, 1.5, 1.0, 1200, 5, 'reference', 300,
+                                                              histograms=None, slot_stats=False))
+        for chunk in (0, 2):
+            interrupted.record('batch', chunk, parallel.simulate_chunk('reference', players, enemies, 1.5, 1.0, 5,
+                                                                       chunk * 300, chunk * 300 + 300))
+        interrupted.save()
+        self.assertEqual(interrupted.job('batch').next_chunk, 1)
+        with self.assertRaises(ValueError):
+            parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=1200, seed=6, chunk_size=300,
+                                              checkpoint=self.path)
+        resumed = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=1200, seed=5, chunk_size=300,
+                                                    checkpoint=self.path)
+        self.assertEqual(resumed.to_dict(), uninterrupted.to_dict())
+        self.assertFalse(os.path.exists(self.path))  # A finished batch is not resumed again
+
+    def test_finished_unseeded_batch_runs_afresh(self):
+        """Re-running a completed unseeded batch simulates new fights instead of restoring an old generator state."""
+        players, enemies = scenarios.build_participants("Boss Fight")
+        random.seed(3)
+        first = run_multiple_simulations(players, enemies, 1.0, 1.2, num_runs=200, checkpoint=self.path)
+        self.assertFalse(os.path.exists(self.path))
+        state = random.getstate()
+        second = run_multiple_simulations(players, enemies, 1.0, 1.2, num_runs=200, checkpoint=self.path)
+        random.setstate(state)
+        self.assertEqual(second, run_multiple_simulations(players, enemies, 1.0, 1.2, num_runs=200))
+        self.assertNotEqual(first, second)
+
+    def test_restarted_coordinator_skips_completed_chunks(self):
+        """A new broker on the same checkpoint only hands out the chunks the old one never finished."""
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        job = distributed.Job("Party vs. Mob", players, enemies, 1.5, 1.0, 1200, 9, 'reference')
+        crashed = distributed.WorkBroker([job], chunk_size=300, checkpoint=self.path, checkpoint_interval=0.0)
+        for _ in range(2):
+            task = crashed.get_task("a")
+            crashed.put_result(task['task_id'], parallel.simulate_chunk(*task['args']).to_dict())
+        restarted = distributed.WorkBroker([job], chunk_size=300, checkpoint=self.path)
+        self.assertEqual(restarted.status()['completed'], 2)
+        while (task := restarted.get_task("b"))['status'] == 'task':
+            self.assertGreaterEqual(task['task_id'][1], 2)
+            restarted.put_result(task['task_id'], parallel.simulate_chunk(*task['args']).to_dict())
+        single = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=1200, seed=9, chunk_size=300)
+        self.assertEqual(restarted.merged_results()[job.name].to_dict(), single.to_dict())
+        self.assertFalse(os.path.exists(self.path))
+
+class TestReport(TemporaryDirectoryMixin, unittest.TestCase):
+    """Checks the streaming report writer."""
+
+    def setUp(self):
+        """Write reports into a temporary directory."""
+        super().setUp()
+        self.path = f"{self.directory.name}/results.csv"
+
+    def test_streams_every_row_but_keeps_a_bounded_preview(self):
+        """All rows reach the CSV from a generator; the table keeps the top 3 and the summary covers every row."""
+        import csv
+        import report
+        columns = [("Scenario", lambda r: r['scenario']), ("Victory Rate", lambda r: f"{r['victory']:.2%}")]
+        rows = ({'scenario': f"Sweep {i}", 'victory': (i * 37 % 1000) / 1000} for i in range(5000))
+        writer = report.write_report(rows, csv_path=self.path, columns=columns, top_n=3,
+                                     rank_by=lambda r: r['victory'], buffer_size=4096)
+        with open(self.path, newline='') as f:
+            lines = list(csv.reader(f))
+        self.assertEqual(lines[0], ["Scenario", "Victory Rate"])
+        self.assertEqual(len(lines), 5001)
+        self.assertEqual(lines[1], ["Sweep 0", "0.00%"])
+        self.assertEqual(writer.count, 5000)
+        self.assertEqual([cells[1] for cells in writer.rows()], ["99.90%"] * 3)
+        (victory,) = writer.summary()
+        self.assertEqual((victory.count, victory.minimum, victory.maximum), (5000, 0.0, 0.999))
+        self.assertAlmostEqual(victory.mean, 0.4995)
+
+    @unittest.skipUnless(__import__('report').HAVE_PYARROW, "pyarrow is not installed")
+    def test_parquet_holds_raw_rows_in_row_groups(self):
+        """Parquet output keeps unformatted values and is written in batch_size row groups."""
+        import pyarrow.parquet
+        import report
+        path = f"{self.directory.name}/results.parquet"
+        rows = ({'scenario': f"Sweep {i}", 'victory': i / 250} for i in range(250))
+        report.write_report(rows, parquet_path=path, columns=[("Scenario", lambda r: r['scenario'])], batch_size=100)
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        self.assertEqual(parquet.read().column('victory').to_pylist()[:2], [0.0, 0.004])
+
+class TestTelemetry(unittest.TestCase):
+    """Checks live throughput and progress telemetry."""
+
+    def test_rates_eta_and_stalled_workers(self):
+        """Windowed rates, ETA and utilisation follow the clock; a worker stuck on a chunk is flagged."""
+        import telemetry
+        now = [0.0]
+        live = telemetry.Telemetry(window=10.0, stall_after=30.0, clock=lambda: now[0])
+        live.start_job("sweep", 10000)
+        live.worker_busy("a")
+        live.worker_busy("b")
+        now[0] = 5.0
+        live.record("sweep", 1000, 6000, [0.5] * 9)
+        live.worker_idle("a")
+        live.set_queue(8, 1)
+        snapshot = live.snapshot()
+        self.assertAlmostEqual(snapshot['fights_per_second'], 200.0)
+        self.assertAlmostEqual(snapshot['rounds_per_second'], 1200.0)
+        self.assertAlmostEqual(snapshot['eta_seconds'], 45.0)
+        self.assertEqual(snapshot['jobs']["sweep"]['means']['victory'], 0.5)
+        now[0] = 40.0
+        live.worker_busy("a")
+        snapshot = live.snapshot()
+        self.assertEqual(snapshot['fights_per_second'], 0.0)  # Nothing finished in the last 10 seconds
+        self.assertIsNone(snapshot['eta_seconds'])
+        self.assertFalse(snapshot['workers']["a"]['stalled'])
+        self.assertTrue(snapshot['workers']["b"]['stalled'])
+        self.assertAlmostEqual(snapshot['workers']["a"]['utilisation'], 5.0 / 40.0)
+        text = telemetry.format_prometheus(snapshot)
+        self.assertIn('rpg_combat_worker_stalled{worker="b"} 1.0', text)
+        self.assertIn('rpg_combat_job_progress_ratio{job="sweep"} 0.1', text)
+        self.assertIn('rpg_combat_eta_seconds NaN', text)
+
+    def test_batch_progress_is_served_over_http(self):
+        """A batch reports every fight and its final means, and /metrics serves them in Prometheus format."""
+        import urllib.request
+        import telemetry
+        live = telemetry.Telemetry()
+        players, enemies = scenarios.build_participants("Party vs. Mob")
+        result = parallel.run_parallel_simulations(players, enemies, 1.5, 1.0, num_runs=1200, seed=3, chunk_size=300,
+                                                   telemetry=live)
+        snapshot = live.snapshot()
+        (job,) = snapshot['jobs'].values()
+        self.assertEqual((snapshot['fights'], job['fights'], job['finished']), (1200, 1200, True))
+        self.assertEqual(snapshot['rounds'], result.sums[1])
+        self.assertEqual(tuple(job['means'].values()), result.means())
+        server = telemetry.serve_metrics(live)
+        try:
+            host, port = server.server_address[:2]
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+        self.assertIn("rpg_combat_fights_total 1200.0", body)
+        self.assertIn('job="Warrior, Mage vs Goblin x3 | atk 1.5 | def 1.0 | seed 3",metric="victory"', body)
+
+    def test_identical_jobs_keep_separate_progress(self):
+        """Two jobs with the same fight and seed get their own labels instead of overwriting one another."""
+        import telemetry
+        live = telemetry.Telemetry()
+        players, enemies = scenarios.build_participants("Boss Fight")
+        jobs = [parallel.Job(name, players, enemies, 1.0, 1.0, 400, 5, 'reference') for name in (0, 1)]
+        for _ in parallel.iter_parallel_jobs(jobs, workers=1, chunk_size=200, telemetry=live):
+            pass
+        progress = live.snapshot()['jobs']
+        self.assertEqual(sorted(progress), ["[0] Warrior, Mage vs Dragon | atk 1.0 | def 1.0 | seed 5",
+                                            "[1] Warrior, Mage vs Dragon | atk 1.0 | def 1.0 | seed 5"])
+        self.assertEqual([job['fights'] for job in progress.values()], [400, 400])
+
+    def test_metrics_port_works_before_and_after_the_subcommand(self):
+        """--metrics-port starts the endpoint whether it is given before or after 'simulate'."""
+        import subprocess
+        import sys
+        simulate = ['simulate', "Boss Fight", '--runs', '10']
+        for argv in (['--metrics-port', '0'] + simulate, simulate + ['--metrics-port', '0'], simulate):
+            process = subprocess.run([sys.executable, 'main.py'] + argv, capture_output=True, text=True, check=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+            self.assertEqual("Prometheus metrics at" in process.stderr, '--metrics-port' in argv, argv)
+            self.assertIn('"scenario": "Boss Fight"', process.stdout)
+
+class TestScenarioFiles(unittest.TestCase):
+    """Checks scenario files and job streaming used by the headless CLI."""
+
+    def test_load_scenario_file_expands_counts(self):
+        """Entries with a count become that many identical stat blocks."""
+        scenario = scenarios.load_scenario_file('scenario_files/wave_battle.json')[0]
+        self.assertEqual(scenario.name, "Wave Battle")
+        self.assertEqual(len(scenario.enemies), 10)
+        self.assertEqual(scenario.attack_multiplier, 1.5)
+
+    def test_scenario_files_land_in_their_declared_victory_range(self):
+        """Every shipped scenario file's reference victory rate lies inside its expected_victory_range."""
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenario_files')
+        for filename in sorted(os.listdir(directory)):
+            for scenario in scenarios.load_scenario_file(os.path.join(directory, filename)):
+                players, enemies = scenarios.build_participants(scenario)
+                result = parallel.run_parallel_simulations(players, enemies, scenario.attack_multiplier,
+                                                           scenario.defense_multiplier, 2000, seed=3)
+                low, high = scenario.expected_victory_range
+                self.assertTrue(low <= result.means()[0] <= high, f"{scenario.name}: {result.means()[0]:.3f}")
+
+    def test_streamed_jobs_match_single_runs(self):
+        """Jobs streamed from a shared pool give the same results as separate runs."""
+        jobs = []
+        for name in ("Boss Fight", "Attrition Test"):
+            players, enemies = scenarios.build_participants(name)
+            jobs.append(parallel.Job(name, players, enemies, 1.0, 1.0, 1500, 4, 'reference'))
+        streamed = {job.name: acc.to_dict() for job, acc in parallel.iter_parallel_jobs(jobs, workers=2)}
+        for job in jobs:
+            single = parallel.run_parallel_simulations(job.players, job.enemies, 1.0, 1.0, job.num_runs, job.seed)
+            self.assertEqual(streamed[job.name], single.to_dict())
+
+class TestStartup(unittest.TestCase):
+    """Checks that headless entry points don't import heavy optional dependencies."""
+
+    def test_headless_imports_stay_light(self):
+        """The CLI, worker and UI modules load no UI, JIT or test-suite dependencies at import time."""
+        import benchmark_startup
+        for module in ('main', 'parallel', 'distributed', 'ui'):
+            _, heavy = benchmark_startup.heavy_imports(module)
+            self.assertEqual(heavy, [], module)
+
+class TestDatasetGeneration(TemporaryDirectoryMixin, unittest.TestCase):
+    """Checks incremental regeneration of the augmented dice dataset."""
+
+    def setUp(self):
+        """Use fresh source and dataset directories inside a temporary directory."""
+        super().setUp()
+        self.input_dir = f"{self.directory.name}/sources"
+        self.output_dir = f"{self.directory.name}/dataset"
+        os.makedirs(self.input_dir)
+
+    def _image(self, path, shade):
+        """Write a small solid-color image to path and return the path."""
+        from PIL import Image
+        Image.new('RGB', (64, 48), (shade, 255 - shade, 90)).save(path)
+        return path
+
+    def test_skip_regenerate_and_remove(self):
+        """Same-stem sources keep separate outputs; unchanged sources are skipped and stale outputs removed."""
+        import process_image
+        self._image(f"{self.input_dir}/d6_1.jpg", 40)
+        png = self._image(f"{self.input_dir}/d6_1.png", 200)
+        os.makedirs(f"{self.output_dir}/d6")
+        self._image(f"{self.output_dir}/d6/d6_0_0.jpg", 0)  # Left by the generator before it had a manifest
+        generate = lambda: process_image.generate_dataset(process_image.load_images(self.input_dir),
+                                                          self.output_dir, 2)
+        summary = generate()
+        self.assertEqual((summary['generated'], summary['legacy']), (2, 1))
+        outputs = sorted(os.listdir(f"{self.output_dir}/d6"))
+        self.assertEqual(outputs, ["d6_1_jpg_0.jpg", "d6_1_jpg_1.jpg", "d6_1_png_0.jpg", "d6_1_png_1.jpg"])
+
+        self.assertEqual(generate(), {'generated': 0, 'skipped': 2, 'removed': 0, 'legacy': 0})
+
+        self._image(f"{self.input_dir}/d6_1.jpg", 120)  # Edited in place
+        os.remove(png)
+        self._image(f"{self.input_dir}/d6_1.jpeg", 200)  # Replaced by the same stem with another extension
+        summary = generate()
+        self.assertEqual((summary['generated'], summary['skipped'], summary['removed']), (2, 0, 1))
+        outputs = sorted(os.listdir(f"{self.output_dir}/d6"))
+        self.assertEqual(outputs, ["d6_1_jpeg_0.jpg", "d6_1_jpeg_1.jpg", "d6_1_jpg_0.jpg", "d6_1_jpg_1.jpg"])
+
+    def test_fused_geometry_matches_pil_rotate_crop_and_resize(self):
+        """The composed affine renders what rotate(expand=True), crop and resize produce step by step."""
+        from unittest import mock
+        import numpy as np
+        from PIL import Image, ImageFilter
+        import process_image
+        size = (200, 150)
+        ramp = Image.linear_gradient('L')
+        image = Image.merge('RGB', (ramp.resize(size), Image.radial_gradient('L').resize(size),
+                                    ramp.rotate(90).resize(size)))
+        for angle in (30, -45, 7):
+            self.assertEqual(process_image.rotation_matrix(angle, size)[1], image.rotate(angle, expand=True).size)
+            # Rotate, skip skew and both flips, then crop 80% at (12, 9)
+            draws = mock.Mock()
+            draws.random.side_effect = [0.0, 0.9, 0.9, 0.9, 0.0]
+            draws.randint.side_effect = [angle, 12, 9]
+            draws.uniform.side_effect = [0.8]
+            with mock.patch.object(process_image, 'random', draws):
+                matrix = process_image.random_geometry(size)
+
+            def render(source):
+                fused = source.transform(process_image.TARGET_SIZE, Image.AFFINE, tuple(matrix[0]) + tuple(matrix[1]),
+                                         resample=Image.BICUBIC)
+                rotated = source.rotate(angle, expand=True, resample=Image.BICUBIC)
+                crop = (12, 9, 12 + int(rotated.width * 0.8), 9 + int(rotated.height * 0.8))
+                stepwise = rotated.crop(crop).resize(process_image.TARGET_SIZE, Image.BICUBIC)
+                return fused, stepwise
+
+            fused, stepwise = render(image)
+            # Compare away from the rotated image's edges, where the two paths blend in the black fill differently
+            inside = [np.asarray(mask.filter(ImageFilter.MinFilter(5))) == 255
+                      for mask in render(Image.new('L', size, 255))]
+            difference = np.abs(np.asarray(fused, dtype=int) - np.asarray(stepwise, dtype=int))[inside[0] & inside[1]]
+            self.assertGreater(difference.size, 0)
+            self.assertLessEqual(difference.max(), 2, angle)
+
+    def test_benchmark_report_times_geometry_stages(self):
+        """A tiny benchmark run writes the JSON report with the split geometry stages."""
+        import contextlib
+        import io
+        import json
+        import benchmark_augmentation
+        self._gradient(f"{self.input_dir}/d6_1.jpg", (600, 500))
+        report_path = f"{self.directory.name}/benchmark.json"
+        argv = ['--input-dir', self.input_dir, '--augmentations', '3', '--workers', '1', '--report', report_path]
+        with contextlib.redirect_stdout(io.StringIO()):
+            benchmark_augmentation.main(argv)
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertEqual(set(report), {'machine', 'config', 'results'})
+        self.assertEqual(report['config']['augmentations_per_image'], 3)
+        result, = report['results']
+        self.assertEqual((result['workers'], result['sources'], result['images']), (1, 1, 3))
+        self.assertLessEqual({'decode', 'geometry_matrix', 'geometry_resample', 'brightness', 'encode'},
+                             set(result['stages']))
+        self.assertNotIn('geometry', result['stages'])
+        self.assertEqual(result['stages']['geometry_resample']['count'], 3)
+        self.assertEqual(set(result['stages']['decode']),
+                         {'count', 'mean_ms', 'share', 'p50_ms', 'p90_ms', 'p99_ms'})
+
+    def _gradient(self, path, size, falling=False):
+        """Write a horizontal grayscale gradient (dark to light, or light to dark if falling) and return the path."""
+        from PIL import Image
+        ramp = Image.linear_gradient('L').rotate(-90 if falling else 90).resize(size)
+        ramp.convert('RGB').save(path)
+        return path
+
+    def test_validation_rejects_unreadable_small_and_duplicate_sources(self):
+        """Broken and tiny files are rejected and, of two near-identical photos, only the larger is kept."""
+        import process_image
+        import validate_images
+        small_copy = self._gradient(f"{self.input_dir}/d6_1.jpg", (240, 240))
+        large_copy = self._gradient(f"{self.input_dir}/d6_2.png", (320, 300))
+        other = self._gradient(f"{self.input_dir}/d8_1.jpg", (240, 240), falling=True)
+        tiny = self._gradient(f"{self.input_dir}/d8_2.jpg", (60, 60))
+        broken = f"{self.input_dir}/d20_1.jpg"
+        with open(large_copy, 'rb') as source, open(broken, 'wb') as f:
+            f.write(source.read()[:200])  # A truncated download
+        images, rejected = validate_images.validate_sources(process_image.load_images(self.input_dir),
+                                                            self.output_dir, workers=2)
+        self.assertEqual(images, {'d6': [large_copy], 'd8': [other]})
+        self.assertEqual(sorted(rejected), sorted([small_copy, tiny, broken]))
+        self.assertTrue(rejected[small_copy].startswith(f"near-duplicate of {large_copy}"))
+        self.assertTrue(rejected[tiny].startswith("too small"))
+        self.assertTrue(rejected[broken].startswith("unreadable"))
+
+        # The cleaned manifest carries the hashes, so generation does not hash the sources again
+        images, hashes = process_image.load_validated(f"{self.output_dir}/{validate_images.VALIDATED_FILENAME}")
+        self.assertEqual(set(hashes), {large_copy, other})
+        from unittest import mock
+        with mock.patch.object(process_image, 'hash_file', side_effect=AssertionError("hashed again")):
+            summary = process_image.generate_dataset(images, self.output_dir, 1, hashes=hashes)
+        self.assertEqual(summary['generated'], 2)
+
+    def test_validation_reuses_cached_facts_by_content_hash(self):
+        """Cached facts are looked up by content hash, so unchanged files are not decoded again."""
+        import json
+        import process_image
+        import validate_images
+        source = self._gradient(f"{self.input_dir}/d6_1.jpg", (240, 240))
+        sources = process_image.load_images(self.input_dir)
+        self.assertEqual(validate_images.validate_sources(sources, self.output_dir, workers=1)[1], {})
+        cache_path = f"{self.output_dir}/{validate_images.CACHE_FILENAME}"
+        with open(cache_path) as f:
+            cache = json.load(f)
+        (facts,) = cache['files'].values()
+        facts['width'] = 10  # Only visible if the cached facts are used instead of decoding the file
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f)
+        rejected = validate_images.validate_sources(sources, self.output_dir, workers=1)[1]
+        self.assertTrue(rejected[source].startswith("too small (10x240"))
+        self._gradient(source, (250, 240))  # Edited: a new content hash is inspected afresh
+        self.assertEqual(validate_images.validate_sources(sources, self.output_dir, workers=1)[1], {})
+
+    def test_rejected_sources_lose_their_outputs(self):
+        """When every source is rejected, main() still deletes the outputs generated from them earlier."""
+        import contextlib
+        import io
+        import process_image
+        from unittest import mock
+        self._gradient(f"{self.input_dir}/d6_1.jpg", (240, 240))
+        with mock.patch.multiple(process_image, INPUT_DIR=self.input_dir, OUTPUT_DIR=self.output_dir,
+                                 AUGMENTATIONS_PER_IMAGE=1), contextlib.redirect_stdout(io.StringIO()):
+            process_image.main()
+            self.assertEqual(os.listdir(f"{self.output_dir}/d6"), ["d6_1_jpg_0.jpg"])
+            self._gradient(f"{self.input_dir}/d6_1.jpg", (60, 60))  # Replaced by a photo too small to use
+            process_image.main()
+        self.assertEqual(os.listdir(f"{self.output_dir}/d6"), [])
@@ -0,0 +1,143 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from accumulators import METRIC_NAMES
+from parallel import run_parallel_simulations
+from participant import Participant
+
+# Outcome of a tuning search: the chosen value, its metrics (dict by METRIC_NAMES), whether each
+# requested band is met, and every (value, metrics) pair that was evaluated along the way
+TuneResult = namedtuple('TuneResult', ['parameter', 'value', 'metrics', 'in_band', 'evaluations'])
+
+MULTIPLIERS = ('attack_multiplier', 'defense_multiplier')
+STATS = ('hp', 'attack', 'defense', 'speed')
+
+def _in_band(value, band):
+    """True if value lies inside the inclusive (low, high) band."""
+    return band[0] <= value <= band[1]
+
+def _band_distance(value, band):
+    """How far value lies outside the band (0 when inside)."""
+    return max(band[0] - value, 0, value - band[1])
+
+def apply_parameter(players, enemies, attack_multiplier, defense_multiplier, parameter, value):
+    """Return (players, enemies, attack_multiplier, defense_multiplier) with one parameter set to value.
+
+    parameter is 'attack_multiplier', 'defense_multiplier' or '<Name>.<stat>' (e.g. 'Dragon.attack'),
+    which sets that stat on every participant with that name.
+    """
+    if parameter == 'attack_multiplier':
+        return players, enemies, value, defense_multiplier
+    if parameter == 'defense_multiplier':
+        return players, enemies, attack_multiplier, value
+    name, _, stat = parameter.rpartition('.')
+    if stat not in STATS or not any(p.name == name for p in players + enemies):
+        raise ValueError(f"Unknown parameter '{parameter}'. Use one of {MULTIPLIERS} or '<Name>.<{'|'.join(STATS)}>'.")
+
+    def rebuild(p):
+        stats = {'hp': p.max_hp, 'attack': p.attack, 'defense': p.defense, 'speed': p.speed}
+        if p.name == name:
+            stats[stat] = int(value)
+        return Participant(p.name, stats['hp'], stats['attack'], stats['defense'], stats['speed'], p.behavior,
+                           p.targeting)
+
+    return [rebuild(p) for p in players], [rebuild(e) for e in enemies], attack_multiplier, defense_multiplier
+
+def tune(players, enemies, parameter, bounds, target_victory, attack_multiplier=1.0, defense_multiplier=1.0,
+         flow_band=None, ntr_band=None, num_runs=2000, seed=0, workers=1, engine='compiled',
+         tolerance=0.01, candidates=5):
+    """Search one parameter for a value whose victory rate falls in target_victory.
+
+    Every candidate is simulated with the same master seed (common random numbers), so differences
+    between candidates come from the parameter rather than from noise and the victory rate behaves
+    monotonically enough for bisection. The search bisects for both edges of the victory band,
+    then evaluates evenly spaced candidates between them and keeps the one closest to flow_band
+    and ntr_band (ties go to the victory rate nearest the band centre).
+
+    Args:
+        players (list): Player Participant objects.
+        enemies (list): Enemy Participant objects.
+        parameter (str): 'attack_multiplier', 'defense_multiplier' or '<Name>.<stat>'.
+        bounds (tuple): (low, high) search range; integer stats are searched over integers.
+        target_victory (tuple): Desired (low, high) victory rate.
+        attack_multiplier (float): Base attack multiplier.
+        defense_multiplier (float): Base defense multiplier.
+        flow_band (tuple): Optional desired (low, high) Flow State.
+        ntr_band (tuple): Optional desired (low, high) Narrative Tension Ratio.
+        num_runs (int): Fights per candidate.
+        seed (int): Master seed shared by all candidates.
+        workers (int): Worker processes for the parallel backend.
+        engine (str): Simulation engine (see parallel.ENGINES).
+        tolerance (float): Stop bisecting multipliers once the interval is this narrow.
+        candidates (int): Values to compare inside the victory band for the secondary objectives.
+
+    Returns:
+        TuneResult
+    """
+    integer = parameter not in MULTIPLIERS
+    low, high = (int(bounds[0]), int(bounds[1])) if integer else (float(bounds[0]), float(bounds[1]))
+    cache = {}
+    evaluations = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def evaluate(value):
+        if value not in cache:
+            config = apply_parameter(players, enemies, attack_multiplier, defense_multiplier, parameter, value)
+            metrics = dict(zip(METRIC_NAMES, run_parallel_simulations(
+                *config, num_runs=num_runs, seed=seed, engine=engine, executor=executor).means()))
+            cache[value] = metrics
+            evaluations.append((value, metrics))
+        return cache[value]
+
+    def midpoint(a, b):
+        return (a + b) // 2 if integer else (a + b) / 2
+
+    def converged(a, b):
+        return abs(b - a) <= (1 if integer else tolerance)
+
+    def bisect(level, increasing):
+        """Smallest/largest value in [low, high] where the victory rate reaches level."""
+        a, b = low, high
+        while not converged(a, b):
+            mid = midpoint(a, b)
+            if (evaluate(mid)['victory'] >= level) == increasing:
+                b = mid
+            else:
+                a = mid
+        return b if increasing else a
+
+    try:
+        increasing = evaluate(high)['victory'] >= evaluate(low)['victory']
+        center = (target_victory[0] + target_victory[1]) / 2
+        reached = sorted((evaluate(low)['victory'], evaluate(high)['victory']))
+        if reached[1] < target_victory[0] or reached[0] > target_victory[1]:
+            # Band unreachable within bounds: report the endpoint that gets closest
+            best = min((low, high), key=lambda v: _band_distance(evaluate(v)['victory'], target_victory))
+        else:
+            edge_low = bisect(target_victory[0], increasing)
+            edge_high = bisect(target_victory[1], increasing)
+            lo, hi = sorted((edge_low, edge_high))
+            if integer:
+                step = max(1, (hi - lo) // max(1, candidates - 1))
+                pool = list(range(lo, hi + 1, step))
+            else:
+                pool = [lo + (hi - lo) * k / max(1, candidates - 1) for k in range(candidates)]
+
+            def score(value):
+                m = evaluate(value)
+                return (_band_distance(m['victory'], target_victory),
+                        (_band_distance(m['flow_state'], flow_band) if flow_band else 0)
+                        + (_band_distance(m['ntr'], ntr_band) if ntr_band else 0),
+                        abs(m['victory'] - center))
+
+            best = min(pool, key=score)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    metrics = evaluate(best)
+    in_band = {'victory': _in_band(metrics['victory'], target_victory)}
+    if flow_band:
+        in_band['flow_state'] = _in_band(metrics['flow_state'], flow_band)
+    if ntr_band:
+        in_band['ntr'] = _in_band(metrics['ntr'], ntr_band)
+    return TuneResult(parameter, best, metrics, in_band, evaluations)
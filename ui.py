@@ -1,32 +1,71 @@
-import gradio as gr
-import plotly.graph_objects as go
-from combat import run_multiple_simulations
-from participant import Participant
+from accumulators import METRIC_NAMES, OutcomeHistograms
+from parallel import run_parallel_simulations
+from scenarios import SCENARIOS, build_participants
+from surrogate import SurrogateBuilder
+from telemetry import Telemetry, format_status
+
+# gradio and plotly pull in hundreds of modules, so they are imported only when the UI is built or
+# a chart is drawn; importing this module stays cheap for headless runs and worker processes
+
+UI_RUNS = 2000  # Fights per button press; enough for smooth histograms on the compiled engine
+
+# Progress and throughput of every simulation the UI runs, shown in the Telemetry panel
+TELEMETRY = Telemetry()
+
+# Pre-simulated multiplier grids that answer slider moves instantly; built in the background by build_demo()
+SURROGATES = SurrogateBuilder(telemetry=TELEMETRY)
+
+# Outcome histograms shown under "Distributions": histogram name -> (tab title, x axis label)
+HISTOGRAM_PLOTS = {
+    'rounds': ("Rounds", "Rounds"),
+    'dmg_players': ("Damage Dealt", "Damage dealt by players"),
+    'dmg_enemies': ("Damage Taken", "Damage taken by players"),
+    'party_hp': ("Remaining Party HP", "Players' total HP at the end"),
+    'ntr': ("NTR per Fight", "Narrative Tension Ratio"),
+}
 
 def create_plot(data, title, y_label, x_labels):
     """Create a Plotly bar chart for given data."""
+    import plotly.graph_objects as go
     fig = go.Figure(data=[go.Bar(x=x_labels, y=data)])
     fig.update_layout(title=title, yaxis_title=y_label, xaxis_title="Scenario", height=400)
     return fig
 
+def create_histogram(hist, title, x_label):
+    """Create a Plotly histogram from a fixed-bin accumulators.Histogram."""
+    import plotly.graph_objects as go
+    fig = go.Figure(data=[go.Bar(x=hist.centers(), y=hist.counts, width=hist.width)])
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title="Fights", bargap=0.05, height=400)
+    return fig
+
+def estimate(scenario, attack_mult, defense_mult):
+    """Answer a slider move from the scenario's surrogate grid, with one-sigma uncertainties."""
+    if scenario is None:
+        return "Select a scenario."
+    grid = SURROGATES.get(scenario)
+    if grid is None:
+        if SURROGATES.error is not None:
+            return f"Surrogate unavailable ({SURROGATES.error}); use Run Simulation."
+        return (f"Pre-simulating multiplier grids ({SURROGATES.ready}/{len(SURROGATES.scenario_names)} scenarios "
+                f"ready); use Run Simulation meanwhile.")
+    means, errors = grid.predict(attack_mult, defense_mult)
+    lines = [f"Estimate for {scenario} at attack x{attack_mult:.2f}, defense x{defense_mult:.2f} "
+             f"(interpolated; press Run Simulation to confirm):"]
+    lines += [f"{name}: {mean:.3f} ± {error:.3f}" for name, mean, error in zip(METRIC_NAMES, means, errors)]
+    return "\n".join(lines)
+
+def telemetry_status():
+    """Current telemetry as text for the Telemetry panel."""
+    return format_status(TELEMETRY.snapshot())
+
 def run_test(scenario, attack_mult, defense_mult):
     """Run a specific test scenario and return results as text and plots."""
-    scenarios = {
-        "Solo Warrior vs. Goblin": ([Participant("Warrior", 50, 10, 5, 10)], [Participant("Goblin", 20, 5, 2, 8)]),
-        "Party vs. Mob": ([Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 12)], 
-                         [Participant("Goblin", 20, 5, 2, 8) for _ in range(3)]),
-        "Boss Fight": ([Participant("Warrior", 50, 10, 5, 10), Participant("Mage", 30, 8, 3, 12)], 
-                      [Participant("Dragon", 100, 15, 8, 9)]),
-        "Underdog Challenge": ([Participant("Thief", 25, 7, 2, 15)], 
-                             [Participant("Wolf", 30, 8, 3, 10) for _ in range(2)]),
-        "Attrition Test": ([Participant("Warrior", 50, 10, 5, 10)], 
-                          [Participant("Imp", 15, 4, 1, 7) for _ in range(5)])
-    }
-    
-    players, enemies = scenarios[scenario]
-    (victory, rounds, dmg_players, dmg_enemies, tension, engagement, flow, decision, ntr) = run_multiple_simulations(
-        players, enemies, attack_mult, defense_mult, num_runs=10
+    players, enemies = build_participants(scenario)
+    results = run_parallel_simulations(
+        players, enemies, attack_mult, defense_mult, num_runs=UI_RUNS, engine='compiled',
+        histograms=OutcomeHistograms.for_encounter(players, enemies, attack_mult, defense_mult), telemetry=TELEMETRY
     )
+    (victory, rounds, dmg_players, dmg_enemies, tension, engagement, flow, decision, ntr) = results.means()
     
     # Prepare text output
     output_text = f"Scenario: {scenario}\n"
@@ -39,6 +78,13 @@ def run_test(scenario, attack_mult, defense_mult):
     output_text += f"Flow State Potential: {flow:.2f}\n"
     output_text += f"Decision Impact Score: {decision:.2f}%\n"
     output_text += f"Narrative Tension Ratio (NTR): {ntr:.2f}\n"
+    grid = SURROGATES.get(scenario)
+    if grid is not None:
+        means, errors = grid.predict(attack_mult, defense_mult)
+        output_text += (f"Surrogate estimate: victory {means[0]:.2%} ± {errors[0]:.2%}, "
+                        f"rounds {means[1]:.2f} ± {errors[1]:.2f}\n")
+        # Explored cells get more fights in the background, so later slider estimates around here are tighter
+        SURROGATES.refine(scenario, attack_mult, defense_mult)
     
     # Prepare data for plots
     metrics = {
@@ -55,41 +101,58 @@ def run_test(scenario, attack_mult, defense_mult):
     for metric, values in metrics.items():
         plots[metric] = create_plot(values, f"{metric} for {scenario}", metric, x_labels)
     
-    return output_text, plots["Tension Index"], plots["Engagement Variability"], \
-           plots["Flow State Potential"], plots["Decision Impact Score"], plots["Narrative Tension Ratio (NTR)"]
+    histograms = [create_histogram(results.histograms[name], f"{title} for {scenario}", x_label)
+                  for name, (title, x_label) in HISTOGRAM_PLOTS.items()]
+    
+    return (output_text, plots["Tension Index"], plots["Engagement Variability"],
+            plots["Flow State Potential"], plots["Decision Impact Score"], plots["Narrative Tension Ratio (NTR)"],
+            *histograms)
 
 # Gradio Interface
-with gr.Blocks() as demo:
-    gr.Markdown("# RPG Combat Simulator with Fun Metrics")
-    with gr.Row():
-        with gr.Column():
-            scenario = gr.Dropdown(
-                choices=["Solo Warrior vs. Goblin", "Party vs. Mob", "Boss Fight", 
-                        "Underdog Challenge", "Attrition Test"],
-                label="Select Scenario"
-            )
-            attack_mult = gr.Slider(minimum=0.5, maximum=2.0, value=1.0, label="Attack Multiplier")
-            defense_mult = gr.Slider(minimum=0.5, maximum=2.0, value=1.0, label="Defense Multiplier")
-            submit_btn = gr.Button("Run Simulation")
-        with gr.Column():
-            output_text = gr.Textbox(label="Simulation Results")
-            with gr.Tabs():
-                with gr.TabItem("Tension Index"):
-                    tension_plot = gr.Plot(label="Tension Index")
-                with gr.TabItem("Engagement Variability"):
-                    engagement_plot = gr.Plot(label="Engagement Variability")
-                with gr.TabItem("Flow State Potential"):
-                    flow_plot = gr.Plot(label="Flow State Potential")
-                with gr.TabItem("Decision Impact Score"):
-                    decision_plot = gr.Plot(label="Decision Impact Score")
-                with gr.TabItem("Narrative Tension Ratio (NTR)"):
-                    ntr_plot = gr.Plot(label="Narrative Tension Ratio (NTR)")
+def build_demo():
+    """Build the Gradio Blocks app; call .launch() on the result to serve it."""
+    import gradio as gr
+    SURROGATES.start()
+    with gr.Blocks() as demo:
+        gr.Markdown("# RPG Combat Simulator with Fun Metrics")
+        with gr.Row():
+            with gr.Column():
+                scenario = gr.Dropdown(choices=list(SCENARIOS), label="Select Scenario")
+                attack_mult = gr.Slider(minimum=0.5, maximum=2.0, value=1.0, label="Attack Multiplier")
+                defense_mult = gr.Slider(minimum=0.5, maximum=2.0, value=1.0, label="Defense Multiplier")
+                submit_btn = gr.Button("Run Simulation")
+                estimate_text = gr.Textbox(label="Instant Estimate", lines=len(METRIC_NAMES) + 1)
+                with gr.Accordion("Telemetry", open=False):
+                    telemetry_text = gr.Textbox(label="Throughput and Progress", lines=4, value=telemetry_status)
+            with gr.Column():
+                output_text = gr.Textbox(label="Simulation Results")
+                with gr.Tabs():
+                    with gr.TabItem("Tension Index"):
+                        tension_plot = gr.Plot(label="Tension Index")
+                    with gr.TabItem("Engagement Variability"):
+                        engagement_plot = gr.Plot(label="Engagement Variability")
+                    with gr.TabItem("Flow State Potential"):
+                        flow_plot = gr.Plot(label="Flow State Potential")
+                    with gr.TabItem("Decision Impact Score"):
+                        decision_plot = gr.Plot(label="Decision Impact Score")
+                    with gr.TabItem("Narrative Tension Ratio (NTR)"):
+                        ntr_plot = gr.Plot(label="Narrative Tension Ratio (NTR)")
+                gr.Markdown("### Distributions")
+                histogram_plots = []
+                with gr.Tabs():
+                    for title, _ in HISTOGRAM_PLOTS.values():
+                        with gr.TabItem(title):
+                            histogram_plots.append(gr.Plot(label=title))
     
-    submit_btn.click(
-        fn=run_test,
-        inputs=[scenario, attack_mult, defense_mult],
-        outputs=[output_text, tension_plot, engagement_plot, flow_plot, decision_plot, ntr_plot]
-    )
+        submit_btn.click(
+            fn=run_test,
+            inputs=[scenario, attack_mult, defense_mult],
+            outputs=[output_text, tension_plot, engagement_plot, flow_plot, decision_plot, ntr_plot, *histogram_plots]
+        )
+        for control in (scenario, attack_mult, defense_mult):
+            control.change(fn=estimate, inputs=[scenario, attack_mult, defense_mult], outputs=estimate_text)
+        gr.Timer(2.0).tick(fn=telemetry_status, outputs=telemetry_text)
+    return demo
 
 if __name__ == "__main__":
-    demo.launch()
\ No newline at end of file
+    build_demo().launch()
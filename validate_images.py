@@ -0,0 +1,186 @@
+# validate_images.py
+# Checks the downloaded source dice photos before any augmentation compute is spent on them.
+# Every source is decoded, measured and perceptually hashed in parallel; results are cached per
+# content hash, so re-running after adding a few photos only inspects the new ones.
+# Usage: python validate_images.py [--input-dir DIR] [--workers N] [--min-size PX] [--max-distance BITS]
+
+# Import necessary libraries
+import argparse
+import json
+import os
+from multiprocessing import Pool
+from PIL import Image
+import process_image
+
+# Smallest accepted side in pixels; smaller sources would be upscaled for every augmentation
+MIN_SOURCE_SIZE = min(process_image.TARGET_SIZE)
+
+# Two sources whose 64-bit difference hashes differ in at most this many bits are near-duplicates
+DUPLICATE_DISTANCE = 6
+
+# Difference hash grid: the image is reduced to (HASH_SIZE + 1) x HASH_SIZE grayscale pixels
+HASH_SIZE = 8
+
+# Bump whenever inspect_image changes so cached results are recomputed
+VALIDATION_VERSION = 1
+
+# Cache of per-file results and the cleaned manifest, both written next to the dataset manifest
+CACHE_FILENAME = 'validation_cache.json'
+VALIDATED_FILENAME = 'validated_sources.json'
+
+# Function to compute a perceptual difference hash
+def difference_hash(image, hash_size=HASH_SIZE):
+    """
+    Returns the dHash of an image as an int: each bit records whether a pixel of the reduced
+    grayscale image is brighter than its right-hand neighbour. Re-encoding, resizing and mild
+    color changes leave most bits unchanged, so near-identical photos have a small Hamming distance.
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+# Function to inspect one source (runs inside worker processes)
+def inspect_image(image_path):
+    """
+    Decodes a source and returns its facts: {'width', 'height', 'dhash', 'error'}.
+    The file is first structurally verified, then fully decoded (at reduced size via draft mode
+    for JPEGs), which catches truncated downloads that verify() alone lets through.
+    Only facts about the file are returned; acceptance rules are applied by validate_sources,
+    so changing them never invalidates the cache.
+    """
+    try:
+        with Image.open(image_path) as image:
+            image.verify()
+        with Image.open(image_path) as image:
+            width, height = image.size
+            image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+            image.load()
+            dhash = difference_hash(image)
+    except Exception as exc:  # PIL raises a variety of errors for corrupt or unsupported files
+        return {'width': None, 'height': None, 'dhash': None, 'error': f"{type(exc).__name__}: {exc}"}
+    return {'width': width, 'height': height, 'dhash': f"{dhash:016x}", 'error': None}
+
+# Function to load the validation cache
+def load_cache(cache_path):
+    """
+    Loads cached facts keyed by content hash, or an empty cache if none exists yet or it was
+    written by a different VALIDATION_VERSION.
+    """
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as f:
+        cache = json.load(f)
+    if cache.get('version') != VALIDATION_VERSION:
+        return {}
+    return cache['files']
+
+# Function to pick the accepted sources and the reasons for rejecting the rest
+def select_sources(sources, min_size=MIN_SOURCE_SIZE, max_distance=DUPLICATE_DISTANCE):
+    """
+    Applies the acceptance rules to a list of (dice_type, path, content_hash, facts) and returns
+    (images, rejected): images maps dice type to accepted paths, rejected maps path to a reason.
+    Among duplicates the largest source is kept (ties go to the first path in sorted order);
+    exact copies are matched by content hash, near-duplicates by dHash distance.
+    """
+    images = {}
+    rejected = {}
+    kept = []  # (path, content_hash, dhash) of accepted sources
+    ordered = sorted(sources, key=lambda s: (-((s[3]['width'] or 0) * (s[3]['height'] or 0)), s[1]))
+    for dice_type, path, content_hash, facts in ordered:
+        if facts['error'] is not None:
+            rejected[path] = f"unreadable ({facts['error']})"
+            continue
+        if min(facts['width'], facts['height']) < min_size:
+            rejected[path] = f"too small ({facts['width']}x{facts['height']}, minimum side {min_size})"
+            continue
+        dhash = int(facts['dhash'], 16)
+        duplicate = None
+        for other_path, other_hash, other_dhash in kept:
+            if other_hash == content_hash:
+                duplicate = f"duplicate of {other_path}"
+                break
+            distance = (dhash ^ other_dhash).bit_count()
+            if distance <= max_distance:
+                duplicate = f"near-duplicate of {other_path} (distance {distance})"
+                break
+        if duplicate is not None:
+            rejected[path] = duplicate
+            continue
+        kept.append((path, content_hash, dhash))
+        images.setdefault(dice_type, []).append(path)
+    for paths in images.values():
+        paths.sort()
+    return images, rejected
+
+# Function to validate every source and write the cleaned manifest
+def validate_sources(images, output_dir, min_size=MIN_SOURCE_SIZE, max_distance=DUPLICATE_DISTANCE, workers=None):
+    """
+    Validates the sources returned by process_image.load_images and writes the cleaned manifest
+    (VALIDATED_FILENAME in output_dir) that process_image.load_images(..., validated_manifest=...)
+    reads back. Hashing and decoding run in a pool of workers (default: one per CPU); files whose
+    content hash is already in the cache are not decoded again.
+    Returns (images, rejected) as described in select_sources.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    cache_path = os.path.join(output_dir, CACHE_FILENAME)
+    cache = load_cache(cache_path)
+    entries = [(dice_type, path) for dice_type, paths in images.items() for path in paths]
+    paths = [path for _, path in entries]
+
+    with Pool(workers) as pool:
+        hashes = pool.map(process_image.hash_file, paths, chunksize=4)
+        missing = sorted({h: path for path, h in zip(paths, hashes) if h not in cache}.items())
+        inspected = pool.map(inspect_image, [path for _, path in missing], chunksize=1)
+    for (content_hash, _), facts in zip(missing, inspected):
+        cache[content_hash] = facts
+
+    # Keep only entries for current sources so the cache does not grow without bound
+    cache = {h: cache[h] for h in hashes}
+    process_image.save_manifest({'version': VALIDATION_VERSION, 'files': cache}, cache_path)
+
+    sources = [(dice_type, path, h, cache[h]) for (dice_type, path), h in zip(entries, hashes)]
+    cleaned, rejected = select_sources(sources, min_size, max_distance)
+    accepted = {path for paths in cleaned.values() for path in paths}
+    process_image.save_manifest({
+        'settings': {'min_size': min_size, 'max_distance': max_distance, 'version': VALIDATION_VERSION},
+        'images': cleaned,
+        'hashes': {path: h for (_, path), h in zip(entries, hashes) if path in accepted},
+        'rejected': rejected,
+    }, os.path.join(output_dir, VALIDATED_FILENAME))
+    return cleaned, rejected
+
+# Main function
+def main():
+    """
+    Parses arguments, validates the input directory and prints every rejected source.
+    """
+    parser = argparse.ArgumentParser(description="Validate source dice photos before augmentation.")
+    parser.add_argument('--input-dir', default=process_image.INPUT_DIR, help="Directory with source dice photos.")
+    parser.add_argument('--output-dir', default=process_image.OUTPUT_DIR,
+                        help="Directory for the validation cache and the cleaned manifest.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument('--min-size', type=int, default=MIN_SOURCE_SIZE, help="Smallest accepted side in pixels.")
+    parser.add_argument('--max-distance', type=int, default=DUPLICATE_DISTANCE,
+                        help="Largest dHash distance (in bits) treated as a near-duplicate.")
+    args = parser.parse_args()
+
+    images = process_image.load_images(args.input_dir) if os.path.isdir(args.input_dir) else {}
+    if not images:
+        print("No source images found in the input directory.")
+        return
+    cleaned, rejected = validate_sources(images, args.output_dir, args.min_size, args.max_distance, args.workers)
+    for path, reason in sorted(rejected.items()):
+        print(f"Rejected {path}: {reason}")
+    accepted = sum(len(paths) for paths in cleaned.values())
+    print(f"{accepted} sources accepted, {len(rejected)} rejected; cleaned manifest written to "
+          f"{os.path.join(args.output_dir, VALIDATED_FILENAME)}")
+
+if __name__ == "__main__":
+    main()